@@ -0,0 +1,7 @@
+"""Local benchmarks for the scripts in core/src, run with python -m benchmarks.<name>"""
+import os
+import sys
+
+# make the scripts in core/src importable
+CORE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(CORE_DIR, "src"))
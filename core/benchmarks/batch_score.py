@@ -0,0 +1,76 @@
+"""Benchmark batch scoring throughput against the number of workers and file size"""
+import os
+import tempfile
+import time
+from argparse import ArgumentParser, Namespace
+
+import batch_score
+import numpy as np
+import pandas as pd
+from benchmarks.common import make_sample_data, train_sample_model
+from constants import FEATURES
+
+
+def main(args: Namespace) -> None:
+    """Score generated files with the streaming driver and the whole file"""
+    model = train_sample_model(n_estimators=args.n_estimators, max_depth=args.max_depth)
+    classifier = model.named_steps["classifier"]
+    n_cores = os.cpu_count() or 1
+    batch_score.print = lambda *args: None
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        for n_rows in args.sizes:
+            input_path = os.path.join(data_dir, f"{n_rows}.csv")
+            make_sample_data(n_rows)[FEATURES].to_csv(input_path, index=False)
+
+            # score the whole file at once like the no-code deployment
+            classifier.set_params(n_jobs=-1)
+            start_time = time.perf_counter()
+            expected = model.predict_proba(pd.read_csv(input_path))[:, 1]
+            whole_throughput = n_rows / (time.perf_counter() - start_time)
+            print(f"{n_rows:,} rows")
+            print(f"  whole file:   {whole_throughput:,.0f} rows/s")
+
+            # stream chunks through the process pool
+            classifier.set_params(n_jobs=1)
+            for max_workers in sorted({1, 2, n_cores}):
+                start_time = time.perf_counter()
+                batch_score.main(
+                    Namespace(
+                        input_path=input_path,
+                        output_dir=data_dir,
+                        chunk_size=args.chunk_size,
+                        max_workers=max_workers,
+                    ),
+                    model,
+                )
+                throughput = n_rows / (time.perf_counter() - start_time)
+                print(f"  {max_workers} worker(s): {throughput:,.0f} rows/s")
+
+                # verify that predictions are complete and in input order
+                predictions = pd.read_csv(os.path.join(data_dir, "predictions.csv"))
+                np.testing.assert_array_equal(predictions["row_id"], np.arange(n_rows))
+                np.testing.assert_allclose(predictions["prediction"], expected)
+
+
+def parse_args() -> Namespace:
+    """Parse command line arguments"""
+    # setup arg parser
+    parser = ArgumentParser("batch_score")
+
+    # add arguments
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[10000, 100000, 1000000]
+    )
+    parser.add_argument("--chunk_size", type=int, default=10000)
+    parser.add_argument("--n_estimators", type=int, default=100)
+    parser.add_argument("--max_depth", type=int, default=10)
+
+    # parse args
+    args = parser.parse_args()
+
+    return args
+
+
+if __name__ == "__main__":
+    main(parse_args())
@@ -0,0 +1,81 @@
+"""Shared helpers to generate sample data and models for local benchmarks"""
+import os
+import time
+from typing import Callable, Dict, List
+
+import numpy as np
+import pandas as pd
+from benchmarks import CORE_DIR
+from constants import (
+    CATEGORICAL_FEATURES,
+    FEATURES,
+    INPUT_SAMPLE,
+    NUMERIC_FEATURES,
+    TARGET,
+)
+from train import make_classifer_pipeline
+
+# define sample inference data shipped with the repository
+BATCH_INFERENCE_DATA = os.path.join(CORE_DIR, "data", "inference", "batch", "01.csv")
+
+
+def make_sample_data(n_rows: int, random_state: int = 42) -> pd.DataFrame:
+    """Generate labelled rows by resampling the sample inference data"""
+    rng = np.random.default_rng(random_state)
+
+    # resample rows from the batch inference file and the input sample
+    df_source = pd.concat(
+        [pd.read_csv(BATCH_INFERENCE_DATA), pd.DataFrame(INPUT_SAMPLE)],
+        ignore_index=True,
+    )
+    df = df_source.sample(n=n_rows, replace=True, random_state=random_state)
+    df = df.reset_index(drop=True)
+
+    # jitter numeric features so that rows are distinct
+    df[NUMERIC_FEATURES] = df[NUMERIC_FEATURES].astype("float") * rng.uniform(
+        0.8, 1.2, size=(n_rows, len(NUMERIC_FEATURES))
+    )
+    df[CATEGORICAL_FEATURES] = df[CATEGORICAL_FEATURES].astype("str")
+
+    # derive a noisy target from the repayment history
+    delayed = df["repayment_status_1"].str.startswith("delay")
+    df[TARGET[0]] = (delayed | (rng.uniform(size=n_rows) < 0.2)).astype(int)
+
+    return df[FEATURES + TARGET]
+
+
+def make_sample_payload(n_rows: int, random_state: int = 0) -> List[Dict]:
+    """Generate a list of records in the format accepted by the online endpoint"""
+    return make_sample_data(n_rows, random_state)[FEATURES].to_dict(orient="records")
+
+
+def train_sample_model(
+    n_rows: int = 5000, n_estimators: int = 100, max_depth: int = 10
+):
+    """Train a model pipeline on generated data"""
+    df = make_sample_data(n_rows)
+    params = {
+        "n_estimators": n_estimators,
+        "max_depth": max_depth,
+        "criterion": "gini",
+        "random_state": 42,
+    }
+    estimator = make_classifer_pipeline(params)
+    estimator.fit(df[FEATURES], df[TARGET].values.ravel())
+
+    return estimator
+
+
+def measure_latency(func: Callable, repeat: int) -> Dict[str, float]:
+    """Call a function repeatedly and return latency percentiles in milliseconds"""
+    latencies = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        func()
+        latencies.append((time.perf_counter() - start_time) * 1000)
+
+    return {
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+    }
@@ -0,0 +1,91 @@
+"""Benchmark data drift calculation with the evidently and native backends"""
+import time
+from argparse import ArgumentParser, Namespace
+
+import numpy as np
+from benchmarks.common import make_sample_data
+from constants import NUMERIC_FEATURES
+from drift_engine import calculate_native_drift
+from profiles import DatasetProfile, compare_profiles
+
+
+def main(args: Namespace) -> None:
+    """Calculate drift metrics of generated data and report the elapsed time"""
+    for n_rows in args.sizes:
+        reference_df = make_sample_data(n_rows, random_state=0)
+        target_df = make_sample_data(n_rows, random_state=1)
+
+        # shift half of the numeric features so that drift is detected
+        for feature in NUMERIC_FEATURES[::2]:
+            target_df[feature] *= 1.5
+
+        print(f"{n_rows} rows")
+        for backend in args.backends:
+            start_time = time.perf_counter()
+            overall_metrics, feature_metrics = calculate_drift(
+                backend, reference_df, target_df, args.n_jobs
+            )
+            seconds = time.perf_counter() - start_time
+
+            print(
+                f"  {backend:<9} {seconds:8.2f} s, "
+                f"{overall_metrics['n_drifted_features']} drifted features"
+            )
+
+        # check distance metrics agree with the profile calculation
+        if "native" in args.backends:
+            reference_profile = DatasetProfile.from_reference(reference_df)
+            target_profile = reference_profile.empty_like()
+            target_profile.update(target_df)
+            _, profile_metrics = compare_profiles(reference_profile, target_profile)
+            _, native_metrics = calculate_native_drift(
+                reference_df, target_df, "psi", "jensenshannon", args.n_jobs
+            )
+            difference = np.max(
+                np.abs(
+                    np.subtract(
+                        [metric["drift_score"] for metric in profile_metrics],
+                        [metric["drift_score"] for metric in native_metrics],
+                    )
+                )
+            )
+            print(f"  max score difference to profiles: {difference:.2e}")
+
+
+def calculate_drift(backend: str, reference_df, target_df, n_jobs: int):
+    """Calculate drift metrics with one of the backends of the drift script"""
+    if backend == "native":
+        return calculate_native_drift(reference_df, target_df, n_jobs=n_jobs)
+
+    # import evidently only when it is benchmarked
+    from drift import calculate_evidently_drift
+
+    return calculate_evidently_drift(reference_df, target_df)
+
+
+def parse_args() -> Namespace:
+    """Parse command line arguments"""
+    # setup arg parser
+    parser = ArgumentParser("drift")
+
+    # add arguments
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[100000, 1000000, 10000000]
+    )
+    parser.add_argument(
+        "--backends",
+        type=str,
+        nargs="+",
+        choices=["evidently", "native"],
+        default=["evidently", "native"],
+    )
+    parser.add_argument("--n_jobs", type=int, default=-1)
+
+    # parse args
+    args = parser.parse_args()
+
+    return args
+
+
+if __name__ == "__main__":
+    main(parse_args())
@@ -0,0 +1,153 @@
+"""Benchmark the log analytics export against a fake query client"""
+import random
+import threading
+import time
+from argparse import ArgumentParser, Namespace
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import export
+import numpy as np
+import pyarrow as pa
+from azure.core.exceptions import HttpResponseError
+from azure.monitor.query import LogsQueryStatus
+from benchmarks.common import make_sample_payload
+from constants import FEATURES
+
+
+class FakeLogsQueryClient:
+    """Stand-in for LogsQueryClient serving generated rows with service limits"""
+
+    def __init__(
+        self,
+        start_time: datetime,
+        end_time: datetime,
+        rows_per_hour: int,
+        row_limit: int,
+        latency_ms: float,
+        row_latency_us: float,
+        throttle_rate: float,
+    ) -> None:
+        # spread rows uniformly over the window
+        rng = np.random.default_rng(0)
+        n_rows = int(rows_per_hour * (end_time - start_time) / timedelta(hours=1))
+        offsets = np.sort(
+            rng.uniform(0, (end_time - start_time).total_seconds(), n_rows)
+        )
+        self.times = np.datetime64(start_time.replace(tzinfo=None)) + (
+            offsets * 1e6
+        ).astype("timedelta64[us]")
+        payload = make_sample_payload(1000)
+        self.values = [[row[feature] for feature in FEATURES] for row in payload]
+
+        self.row_limit = row_limit
+        self.latency = latency_ms / 1000
+        self.row_latency = row_latency_us / 1e6
+        self.throttle_rate = throttle_rate
+        self.queries = 0
+        self._lock = threading.Lock()
+
+    def query_workspace(self, workspace_id, query, timespan):
+        with self._lock:
+            self.queries += 1
+
+        if random.random() < self.throttle_rate:
+            time.sleep(self.latency)
+            raise HttpResponseError(message="Too many requests")
+
+        # select rows logged within the half open timespan
+        start, end = [
+            np.datetime64(value.astimezone(timezone.utc).replace(tzinfo=None))
+            for value in timespan
+        ]
+        first, last = np.searchsorted(self.times, [start, end])
+        is_partial = last - first > self.row_limit
+        last = min(last, first + self.row_limit)
+
+        rows = [
+            [str(self.times[index]), *self.values[index % len(self.values)]]
+            for index in range(first, last)
+        ]
+        time.sleep(self.latency + self.row_latency * len(rows))
+
+        tables = [SimpleNamespace(rows=rows, columns=["TimeGenerated", *FEATURES])]
+        if is_partial:
+            return SimpleNamespace(
+                status=LogsQueryStatus.PARTIAL,
+                partial_data=tables,
+                partial_error=SimpleNamespace(message="Row limit exceeded"),
+            )
+
+        return SimpleNamespace(status=LogsQueryStatus.SUCCESS, tables=tables)
+
+
+def main(args: Namespace) -> None:
+    """Export a synthetic window of inference data with different settings"""
+    end_time = datetime(2023, 1, 31, tzinfo=timezone.utc)
+    start_time = end_time - timedelta(days=args.days)
+    export.BACKOFF_SECONDS = args.backoff_seconds
+
+    client = FakeLogsQueryClient(
+        start_time,
+        end_time,
+        args.rows_per_hour,
+        args.row_limit,
+        args.latency_ms,
+        args.row_latency_us,
+        args.throttle_rate,
+    )
+    print(f"{len(client.times)} rows over {args.days} days")
+
+    for sub_window_hours, max_concurrency in [
+        (24 * args.days, 1),
+        (args.sub_window_hours, 1),
+        *[(args.sub_window_hours, n) for n in args.concurrency],
+    ]:
+        client.queries = 0
+        start = time.perf_counter()
+        batches = export.query_window(
+            client,
+            "workspace",
+            "model",
+            "1",
+            start_time,
+            end_time,
+            timedelta(hours=sub_window_hours),
+            max_concurrency,
+        )
+        df_export = pa.Table.from_batches(batches, export.SCHEMA).to_pandas()
+        seconds = time.perf_counter() - start
+
+        in_order = bool(df_export["TimeGenerated"].is_monotonic_increasing)
+        print(
+            f"sub-window {sub_window_hours:g} h, concurrency {max_concurrency}: "
+            f"{len(df_export)} rows ({len(df_export) / len(client.times):.0%}), "
+            f"{client.queries} queries, {seconds:.2f} s, "
+            f"{len(df_export) / seconds:.0f} rows/s, in order: {in_order}"
+        )
+
+
+def parse_args() -> Namespace:
+    """Parse command line arguments"""
+    # setup arg parser
+    parser = ArgumentParser("export")
+
+    # add arguments
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--rows_per_hour", type=int, default=1000)
+    parser.add_argument("--row_limit", type=int, default=30000)
+    parser.add_argument("--sub_window_hours", type=float, default=24)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[4, 8])
+    parser.add_argument("--latency_ms", type=float, default=200)
+    parser.add_argument("--row_latency_us", type=float, default=5)
+    parser.add_argument("--throttle_rate", type=float, default=0.05)
+    parser.add_argument("--backoff_seconds", type=float, default=0.1)
+
+    # parse args
+    args = parser.parse_args()
+
+    return args
+
+
+if __name__ == "__main__":
+    main(parse_args())
@@ -0,0 +1,137 @@
+"""Benchmark peak memory of the streaming export against a full pandas frame"""
+import multiprocessing
+import resource
+import tempfile
+import time
+from argparse import ArgumentParser, Namespace
+from datetime import datetime, timedelta, timezone
+
+import export
+import pandas as pd
+from benchmarks.export import FakeLogsQueryClient
+from constants import CATEGORICAL_FEATURES, FEATURES, NUMERIC_FEATURES
+from instrumentation import NULL_CONTEXT
+
+
+def main(args: Namespace) -> None:
+    """Export generated rows in fresh processes and report memory and throughput"""
+    context = multiprocessing.get_context("spawn")
+    for mode in args.modes:
+        for days in args.days:
+            results = context.Queue()
+            process = context.Process(
+                target=run_export, args=(mode, days, args, results)
+            )
+            process.start()
+            result = results.get()
+            process.join()
+
+            print(
+                f"{mode:<6} {days:>3} days: {result['n_rows']} rows, "
+                f"{result['n_rows'] / result['seconds']:.0f} rows/s, "
+                f"peak rss {result['peak_rss_mb']:.0f} MB "
+                f"(client {result['client_rss_mb']:.0f} MB)"
+            )
+
+
+def run_export(mode: str, days: int, args: Namespace, results) -> None:
+    """Export a window of generated rows with the frame or streaming writer"""
+    end_time = datetime.now(timezone.utc)
+    client = FakeLogsQueryClient(
+        end_time - timedelta(days=days),
+        end_time,
+        args.rows_per_hour,
+        args.row_limit,
+        latency_ms=0,
+        row_latency_us=0,
+        throttle_rate=0,
+    )
+    client_rss_mb = peak_rss_mb()
+
+    export.print = lambda *args: None
+    export.stage = lambda *args: NULL_CONTEXT
+    start = time.perf_counter()
+    with tempfile.TemporaryDirectory() as prepared_data_dir:
+        if mode == "frame":
+            export_frame(client, prepared_data_dir, days)
+        else:
+            export.main(
+                Namespace(
+                    model_name="model",
+                    model_version="1",
+                    prepared_data_dir=prepared_data_dir,
+                    log_analytics_workspace_id="workspace",
+                    number_of_previous_days=days,
+                    sub_window_hours=args.sub_window_hours,
+                    max_concurrency=args.max_concurrency,
+                    max_retries=0,
+                    ingestion_delay_minutes=0,
+                    batch_size=args.batch_size,
+                ),
+                client,
+            )
+
+    results.put(
+        {
+            "n_rows": len(client.times),
+            "seconds": time.perf_counter() - start,
+            "peak_rss_mb": peak_rss_mb(),
+            "client_rss_mb": client_rss_mb,
+        }
+    )
+
+
+def export_frame(client: FakeLogsQueryClient, prepared_data_dir: str, days: int):
+    """Build one pandas frame of every row before writing it like before"""
+    end_time = datetime.now(timezone.utc)
+    response = client.query_workspace(
+        "workspace", "", (end_time - timedelta(days=days), end_time)
+    )
+    df_export = pd.concat(
+        [
+            pd.DataFrame(data=table.rows, columns=table.columns)
+            for table in response.tables
+        ],
+        ignore_index=True,
+    )
+    df_export["TimeGenerated"] = pd.to_datetime(df_export["TimeGenerated"])
+    df_export[CATEGORICAL_FEATURES] = df_export[CATEGORICAL_FEATURES].astype("str")
+    df_export[NUMERIC_FEATURES] = df_export[NUMERIC_FEATURES].astype("float")
+    df_export[["TimeGenerated"] + FEATURES].to_parquet(
+        f"{prepared_data_dir}/export.parquet", index=False
+    )
+
+
+def peak_rss_mb() -> float:
+    """Return the peak resident set size of the process in MB"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def parse_args() -> Namespace:
+    """Parse command line arguments"""
+    # setup arg parser
+    parser = ArgumentParser("export_writer")
+
+    # add arguments
+    parser.add_argument("--days", type=int, nargs="+", default=[7, 30])
+    parser.add_argument(
+        "--modes",
+        type=str,
+        nargs="+",
+        choices=["frame", "stream"],
+        default=["frame", "stream"],
+    )
+    parser.add_argument("--rows_per_hour", type=int, default=5000)
+    parser.add_argument("--row_limit", type=int, default=100000000)
+    parser.add_argument("--sub_window_hours", type=float, default=6)
+    parser.add_argument("--max_concurrency", type=int, default=4)
+    parser.add_argument("--batch_size", type=int, default=65536)
+
+    # parse args
+    args = parser.parse_args()
+
+    return args
+
+
+if __name__ == "__main__":
+    main(parse_args())
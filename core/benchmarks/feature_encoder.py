@@ -0,0 +1,53 @@
+"""Benchmark the compiled feature encoder against the pipeline preprocessor"""
+from argparse import ArgumentParser, Namespace
+
+import numpy as np
+import pandas as pd
+from benchmarks.common import make_sample_payload, measure_latency, train_sample_model
+from encoder import FeatureEncoder
+
+
+def main(args: Namespace) -> None:
+    """Compare per-request latency of both scoring paths"""
+    model = train_sample_model(n_estimators=args.n_estimators)
+    encoder = FeatureEncoder.from_pipeline(model)
+    classifier = model.named_steps["classifier"]
+
+    for batch_size in args.batch_sizes:
+        payload = make_sample_payload(batch_size)
+
+        # verify that both paths return identical predictions
+        expected = model.predict_proba(pd.DataFrame(payload))
+        actual = classifier.predict_proba(encoder.transform(payload))
+        assert np.array_equal(expected, actual), "predictions do not match"
+
+        pipeline_latency = measure_latency(
+            lambda: model.predict_proba(pd.DataFrame(payload)), args.repeat
+        )
+        encoder_latency = measure_latency(
+            lambda: classifier.predict_proba(encoder.transform(payload)), args.repeat
+        )
+
+        print(f"batch size {batch_size}")
+        print("  pipeline:", pipeline_latency)
+        print("  encoder: ", encoder_latency)
+
+
+def parse_args() -> Namespace:
+    """Parse command line arguments"""
+    # setup arg parser
+    parser = ArgumentParser("feature_encoder")
+
+    # add arguments
+    parser.add_argument("--batch_sizes", type=int, nargs="+", default=[1, 10, 1000])
+    parser.add_argument("--n_estimators", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=100)
+
+    # parse args
+    args = parser.parse_args()
+
+    return args
+
+
+if __name__ == "__main__":
+    main(parse_args())
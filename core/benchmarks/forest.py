@@ -0,0 +1,75 @@
+"""Benchmark the compiled forest against sklearn on one core and on all cores"""
+import os
+import time
+from argparse import ArgumentParser, Namespace
+from typing import Callable
+
+import numpy as np
+from benchmarks.common import make_sample_data, train_sample_model
+from constants import FEATURES
+from encoder import FeatureEncoder
+from forest import CompiledForest
+
+
+def main(args: Namespace) -> None:
+    """Compare throughput of both inference engines"""
+    model = train_sample_model(n_estimators=args.n_estimators, max_depth=args.max_depth)
+    classifier = model.named_steps["classifier"]
+    forest = CompiledForest.from_estimator(classifier)
+
+    n_cores = os.cpu_count() or 1
+    for batch_size in args.batch_sizes:
+        payload = make_sample_data(batch_size)[FEATURES].to_dict(orient="records")
+        features = FeatureEncoder.from_pipeline(model).transform(payload)
+
+        # verify that the compiled forest matches sklearn
+        np.testing.assert_allclose(
+            forest.predict_proba(features),
+            classifier.predict_proba(features),
+            atol=1e-9,
+        )
+
+        for n_jobs in sorted({1, n_cores}):
+            classifier.set_params(n_jobs=n_jobs)
+            sklearn_throughput = measure_throughput(
+                lambda: classifier.predict_proba(features), batch_size, args.repeat
+            )
+            compiled_throughput = measure_throughput(
+                lambda: forest.predict_proba(features, n_jobs=n_jobs),
+                batch_size,
+                args.repeat,
+            )
+
+            print(f"batch size {batch_size}, {n_jobs} core(s)")
+            print(f"  sklearn:  {sklearn_throughput:,.0f} rows/s")
+            print(f"  compiled: {compiled_throughput:,.0f} rows/s")
+
+
+def measure_throughput(func: Callable, n_rows: int, repeat: int) -> float:
+    """Return the mean number of rows scored per second"""
+    start_time = time.perf_counter()
+    for _ in range(repeat):
+        func()
+
+    return n_rows * repeat / (time.perf_counter() - start_time)
+
+
+def parse_args() -> Namespace:
+    """Parse command line arguments"""
+    # setup arg parser
+    parser = ArgumentParser("forest")
+
+    # add arguments
+    parser.add_argument("--batch_sizes", type=int, nargs="+", default=[1, 100, 10000])
+    parser.add_argument("--n_estimators", type=int, default=500)
+    parser.add_argument("--max_depth", type=int, default=25)
+    parser.add_argument("--repeat", type=int, default=10)
+
+    # parse args
+    args = parser.parse_args()
+
+    return args
+
+
+if __name__ == "__main__":
+    main(parse_args())
@@ -0,0 +1,69 @@
+"""Benchmark the overhead of stage instrumentation on the request path"""
+import time
+from argparse import ArgumentParser, Namespace
+
+import instrumentation
+from benchmarks.common import make_sample_payload, measure_latency, train_sample_model
+from encoder import FeatureEncoder
+from forest import CompiledForest
+from instrumentation import LatencyHistogram, RequestProfiler, stage
+
+
+def main(args: Namespace) -> None:
+    """Compare an instrumented single row prediction with a bare one"""
+    model = train_sample_model(n_estimators=args.n_estimators)
+    encoder = FeatureEncoder.from_pipeline(model)
+    forest = CompiledForest.from_estimator(model.named_steps["classifier"])
+    payload = make_sample_payload(1)
+    histogram = LatencyHistogram(flush_interval=0)
+    profiler = RequestProfiler(None)
+
+    def predict():
+        return forest.predict_proba(encoder.transform(payload))
+
+    def instrumented_predict():
+        with profiler(), stage("request", histogram.record):
+            with stage("encode", histogram.record):
+                features = encoder.transform(payload)
+            with stage("predict", histogram.record):
+                return forest.predict_proba(features)
+
+    # measure the cost of one stage on its own
+    for enabled in (False, True):
+        instrumentation.INSTRUMENTATION_ENABLED = enabled
+        start_time = time.perf_counter()
+        for _ in range(args.n_stages):
+            with stage("stage", histogram.record):
+                pass
+        stage_us = (time.perf_counter() - start_time) / args.n_stages * 1e6
+        print(f"stage {'on' if enabled else 'off'}: {stage_us:.2f} us")
+
+    # measure the cost of three stages around a single row prediction
+    instrumentation.INSTRUMENTATION_ENABLED = False
+    print("bare:        ", measure_latency(predict, args.repeat))
+    print("off:         ", measure_latency(instrumented_predict, args.repeat))
+    instrumentation.INSTRUMENTATION_ENABLED = True
+    print("on:          ", measure_latency(instrumented_predict, args.repeat))
+
+    summary = histogram.pop_due()
+    print("histogram p50:", {name: value["p50_ms"] for name, value in summary.items()})
+
+
+def parse_args() -> Namespace:
+    """Parse command line arguments"""
+    # setup arg parser
+    parser = ArgumentParser("instrumentation")
+
+    # add arguments
+    parser.add_argument("--n_estimators", type=int, default=100)
+    parser.add_argument("--n_stages", type=int, default=1000000)
+    parser.add_argument("--repeat", type=int, default=2000)
+
+    # parse args
+    args = parser.parse_args()
+
+    return args
+
+
+if __name__ == "__main__":
+    main(parse_args())
@@ -0,0 +1,204 @@
+"""Local load test and latency benchmark for the online scoring script"""
+import importlib
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import types
+from argparse import ArgumentParser, Namespace
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+import mlflow
+import numpy as np
+from benchmarks import CORE_DIR
+from benchmarks.common import make_sample_payload, train_sample_model
+from register import save_compiled_model
+
+
+class StubCollector:
+    """Stand-in for azureml.ai.monitoring.Collector that discards data"""
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+
+    def collect(self, df, context=None):
+        return context
+
+
+def main(args: Namespace) -> None:
+    """Train a model, load it with online_score and sweep load configurations"""
+    # apply scoring settings before online_score reads them at import
+    for setting in args.env:
+        key, value = setting.split("=", 1)
+        os.environ[key] = value
+
+    online_score = import_online_score()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # save the model in the layout of a registered model
+        model_dir = os.path.join(tmp_dir, "credit-card-default", "1")
+        model = train_sample_model(
+            n_estimators=args.n_estimators, max_depth=args.max_depth
+        )
+        mlflow.sklearn.save_model(
+            model,
+            f"{model_dir}/model",
+            serialization_format=mlflow.sklearn.SERIALIZATION_FORMAT_CLOUDPICKLE,
+        )
+        if args.compiled:
+            save_compiled_model(model, f"{model_dir}/model/compiled")
+
+        os.environ["AZUREML_MODEL_DIR"] = model_dir
+        online_score.init()
+
+        results = []
+        for batch_size in args.batch_sizes:
+            payloads = [
+                make_sample_payload(batch_size, random_state)
+                for random_state in range(args.n_unique_payloads)
+            ]
+            for concurrency in args.concurrency:
+                result = run_load(online_score.run, payloads, concurrency, args)
+                results.append(result)
+                print(
+                    f"batch size {batch_size:>5}, concurrency {concurrency:>3}: "
+                    f"{result['requests_per_second']:>8.1f} requests/s, "
+                    f"p50 {result['p50_ms']:.2f} ms, "
+                    f"p95 {result['p95_ms']:.2f} ms, "
+                    f"p99 {result['p99_ms']:.2f} ms"
+                )
+
+        online_score.TELEMETRY.close()
+
+    report = {"commit": git_commit(), "settings": vars(args), "results": results}
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as file:
+            baseline = json.load(file)
+        if compare(baseline["results"], results, args.tolerance):
+            sys.exit(1)
+
+
+def import_online_score() -> types.ModuleType:
+    """Import online_score with stubbed data collectors and telemetry logger"""
+    # provide the collector module when the monitoring package is missing
+    try:
+        importlib.import_module("azureml.ai.monitoring")
+    except ImportError:
+        for name in ["azureml", "azureml.ai", "azureml.ai.monitoring"]:
+            sys.modules.setdefault(name, types.ModuleType(name))
+        sys.modules["azureml.ai.monitoring"].Collector = StubCollector
+
+    online_score = importlib.import_module("online_score")
+    online_score.Collector = StubCollector
+
+    # replace the app insights logger with one that discards records
+    logger = logging.getLogger("online_score_benchmark")
+    logger.addHandler(logging.NullHandler())
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    online_score.LOGGER = logger
+
+    return online_score
+
+
+def run_load(run, payloads: List[List[Dict]], concurrency: int, args) -> Dict:
+    """Send requests from concurrent clients and summarize their latency"""
+
+    def request(index: int) -> float:
+        start_time = time.perf_counter()
+        run(payloads[index % len(payloads)])
+        return time.perf_counter() - start_time
+
+    # warm up before measuring
+    for index in range(min(args.warmup, args.n_requests)):
+        request(index)
+
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = np.array(list(executor.map(request, range(args.n_requests))))
+    duration = time.perf_counter() - start_time
+
+    return {
+        "batch_size": len(payloads[0]),
+        "concurrency": concurrency,
+        "requests_per_second": args.n_requests / duration,
+        "rows_per_second": args.n_requests * len(payloads[0]) / duration,
+        "p50_ms": float(np.percentile(latencies, 50) * 1000),
+        "p95_ms": float(np.percentile(latencies, 95) * 1000),
+        "p99_ms": float(np.percentile(latencies, 99) * 1000),
+    }
+
+
+def compare(baseline: List[Dict], results: List[Dict], tolerance: float) -> bool:
+    """Print changes against a baseline and return whether any regressed"""
+    regressed = False
+    previous = {(r["batch_size"], r["concurrency"]): r for r in baseline}
+
+    for result in results:
+        key = (result["batch_size"], result["concurrency"])
+        if key not in previous:
+            continue
+
+        throughput = (
+            result["requests_per_second"] / previous[key]["requests_per_second"]
+        )
+        p99 = result["p99_ms"] / previous[key]["p99_ms"]
+        status = "ok"
+        if throughput < 1 - tolerance or p99 > 1 + tolerance:
+            status = "REGRESSION"
+            regressed = True
+
+        print(
+            f"batch size {key[0]:>5}, concurrency {key[1]:>3}: "
+            f"throughput x{throughput:.2f}, p99 x{p99:.2f} {status}"
+        )
+
+    return regressed
+
+
+def git_commit() -> str:
+    """Return the current commit of the repository if available"""
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=CORE_DIR, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def parse_args() -> Namespace:
+    """Parse command line arguments"""
+    # setup arg parser
+    parser = ArgumentParser("load_test")
+
+    # add arguments
+    parser.add_argument("--batch_sizes", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--n_requests", type=int, default=500)
+    parser.add_argument("--n_unique_payloads", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--n_estimators", type=int, default=100)
+    parser.add_argument("--max_depth", type=int, default=10)
+    parser.add_argument("--compiled", action="store_true")
+    parser.add_argument("--env", type=str, nargs="*", default=[])
+    parser.add_argument("--output", type=str)
+    parser.add_argument("--baseline", type=str)
+    parser.add_argument("--tolerance", type=float, default=0.1)
+
+    # parse args
+    args = parser.parse_args()
+
+    return args
+
+
+if __name__ == "__main__":
+    main(parse_args())
@@ -0,0 +1,85 @@
+"""Benchmark concurrent single row requests with and without micro-batching"""
+import time
+from argparse import ArgumentParser, Namespace
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List
+
+import numpy as np
+import pandas as pd
+from batching import MicroBatcher
+from benchmarks.common import make_sample_payload, train_sample_model
+from encoder import FeatureEncoder
+from forest import CompiledForest
+
+
+def main(args: Namespace) -> None:
+    """Compare throughput and latency of direct and micro-batched scoring"""
+    model = train_sample_model(n_estimators=args.n_estimators)
+    encoder = FeatureEncoder.from_pipeline(model)
+    forest = CompiledForest.from_estimator(model.named_steps["classifier"])
+
+    def predict(data: List[Dict]) -> List[float]:
+        if args.engine == "pipeline":
+            return model.predict_proba(pd.DataFrame(data))[:, 1].tolist()
+        return forest.predict_proba(encoder.transform(data))[:, 1].tolist()
+
+    # one single row payload per request
+    payload = make_sample_payload(args.n_requests)
+    expected = predict(payload)
+
+    batcher = MicroBatcher(predict, args.max_batch_size, args.max_wait_ms)
+    for name, score in [("direct", predict), ("micro-batched", batcher.submit)]:
+        results = run_clients(score, payload, args.concurrency)
+
+        # verify that every caller received the predictions of its own rows
+        actual = [prediction for result in results for prediction in result[0]]
+        np.testing.assert_allclose(actual, expected)
+
+        latencies = [result[1] for result in results]
+        duration = max(result[2] for result in results) - min(
+            result[2] - result[1] for result in results
+        )
+        print(f"{name} ({args.concurrency} concurrent clients)")
+        print(f"  throughput: {len(payload) / duration:,.0f} requests/s")
+        print(f"  p50 latency: {np.percentile(latencies, 50) * 1000:.2f} ms")
+        print(f"  p99 latency: {np.percentile(latencies, 99) * 1000:.2f} ms")
+
+
+def run_clients(
+    score: Callable[[List[Dict]], List[float]], payload: List[Dict], concurrency: int
+) -> List:
+    """Send every row as its own request from concurrent clients"""
+
+    def request(row: Dict):
+        start_time = time.perf_counter()
+        predictions = score([row])
+        end_time = time.perf_counter()
+        return predictions, end_time - start_time, end_time
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return list(executor.map(request, payload))
+
+
+def parse_args() -> Namespace:
+    """Parse command line arguments"""
+    # setup arg parser
+    parser = ArgumentParser("micro_batching")
+
+    # add arguments
+    parser.add_argument("--n_requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--max_batch_size", type=int, default=64)
+    parser.add_argument("--max_wait_ms", type=float, default=5.0)
+    parser.add_argument("--n_estimators", type=int, default=100)
+    parser.add_argument(
+        "--engine", type=str, choices=["compiled", "pipeline"], default="compiled"
+    )
+
+    # parse args
+    args = parser.parse_args()
+
+    return args
+
+
+if __name__ == "__main__":
+    main(parse_args())
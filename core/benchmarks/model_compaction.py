@@ -0,0 +1,79 @@
+"""Benchmark pruning and quantization of a large forest at registration"""
+import tempfile
+from argparse import ArgumentParser, Namespace
+
+import numpy as np
+from benchmarks.common import make_sample_data, train_sample_model
+from compaction import oob_tree_probabilities, prune_pipeline, select_trees
+from constants import FEATURES, TARGET
+from encoder import FeatureEncoder
+from features import transform_features
+from forest import CompiledForest
+from register import measure_model
+
+
+def main(args: Namespace) -> None:
+    """Compare the registered artifacts of a forest before and after compaction"""
+    model = train_sample_model(
+        n_rows=args.n_rows, n_estimators=args.n_estimators, max_depth=args.max_depth
+    )
+    classifier = model.named_steps["classifier"]
+    df_test = make_sample_data(args.n_test_rows, random_state=1)
+    y_test = df_test[TARGET].to_numpy(np.int64).ravel()
+
+    # keep the fewest trees within tolerance on the out-of-bag training rows
+    df_train = make_sample_data(args.n_rows)
+    y_train = df_train[TARGET].to_numpy(np.int64).ravel()
+    x_train = transform_features(model.named_steps["preprocessor"], df_train[FEATURES])
+    trees, _ = select_trees(
+        oob_tree_probabilities(classifier, x_train), y_train, args.tolerance
+    )
+    optimized = prune_pipeline(model, trees)
+
+    # verify that quantized thresholds route every row to the same leaves
+    forest = CompiledForest.from_estimator(optimized.named_steps["classifier"])
+    quantized = forest.quantize()
+    features = FeatureEncoder.from_pipeline(model).transform(
+        df_test[FEATURES].to_dict(orient="records")
+    )
+    routed = CompiledForest(
+        feature=quantized.feature,
+        threshold=quantized.threshold,
+        children=quantized.children,
+        value=forest.value,
+        roots=quantized.roots,
+        max_depth=quantized.max_depth,
+    )
+    np.testing.assert_array_equal(
+        routed.predict_proba(features), forest.predict_proba(features)
+    )
+
+    with tempfile.TemporaryDirectory() as path:
+        before = measure_model(model, f"{path}/original", df_test, y_test, False)
+        after = measure_model(optimized, f"{path}/optimized", df_test, y_test, True)
+
+    print(f"trees: {len(classifier.estimators_)} -> {len(trees)}")
+    for name in before:
+        print(f"  {name + ':':<26} {before[name]:10.4f} -> {after[name]:10.4f}")
+
+
+def parse_args() -> Namespace:
+    """Parse command line arguments"""
+    # setup arg parser
+    parser = ArgumentParser("model_compaction")
+
+    # add arguments
+    parser.add_argument("--n_rows", type=int, default=20000)
+    parser.add_argument("--n_test_rows", type=int, default=5000)
+    parser.add_argument("--n_estimators", type=int, default=500)
+    parser.add_argument("--max_depth", type=int, default=25)
+    parser.add_argument("--tolerance", type=float, default=0.005)
+
+    # parse args
+    args = parser.parse_args()
+
+    return args
+
+
+if __name__ == "__main__":
+    main(parse_args())
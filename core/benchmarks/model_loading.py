@@ -0,0 +1,124 @@
+"""Benchmark worker startup with the pickled model and the compiled model"""
+import multiprocessing
+import os
+import tempfile
+import time
+from argparse import ArgumentParser, Namespace
+from typing import Dict, List
+
+import mlflow
+import numpy as np
+import pandas as pd
+from benchmarks.common import make_sample_payload, train_sample_model
+from encoder import FeatureEncoder
+from forest import CompiledForest
+from register import save_compiled_model
+
+
+def main(args: Namespace) -> None:
+    """Start workers loading the same model and report startup time and memory"""
+    model = train_sample_model(n_estimators=args.n_estimators, max_depth=args.max_depth)
+    payload = make_sample_payload(1)
+
+    with tempfile.TemporaryDirectory() as model_dir:
+        mlflow.sklearn.save_model(
+            model,
+            f"{model_dir}/model",
+            serialization_format=mlflow.sklearn.SERIALIZATION_FORMAT_CLOUDPICKLE,
+        )
+        save_compiled_model(model, f"{model_dir}/model/compiled")
+
+        # spawn fresh interpreters like the inference server workers
+        context = multiprocessing.get_context("spawn")
+        for mode in ["pickle", "compiled"]:
+            for n_workers in args.workers:
+                barrier = context.Barrier(n_workers)
+                results = context.Queue()
+                workers = [
+                    context.Process(
+                        target=start_worker,
+                        args=(mode, f"{model_dir}/model", payload, barrier, results),
+                    )
+                    for _ in range(n_workers)
+                ]
+                for worker in workers:
+                    worker.start()
+                measurements = [results.get() for _ in workers]
+                for worker in workers:
+                    worker.join()
+
+                print(f"{mode}, {n_workers} worker(s)")
+                print(
+                    "  time to first prediction: "
+                    f"{np.mean([m['seconds'] for m in measurements]):.3f} s"
+                )
+                print(
+                    "  rss per worker: "
+                    f"{np.mean([m['rss_mb'] for m in measurements]):.1f} MB"
+                )
+                print(
+                    "  pss per worker: "
+                    f"{np.mean([m['pss_mb'] for m in measurements]):.1f} MB"
+                )
+
+
+def start_worker(
+    mode: str, model_dir: str, payload: List[Dict], barrier, results
+) -> None:
+    """Load the model, score one request and report memory once all workers run"""
+    start_time = time.perf_counter()
+
+    if mode == "pickle":
+        model = mlflow.sklearn.load_model(model_dir)
+        model.predict_proba(pd.DataFrame(payload))
+    else:
+        encoder = FeatureEncoder.load(f"{model_dir}/compiled/encoder.json")
+        forest = CompiledForest.load(f"{model_dir}/compiled/forest")
+        forest.predict_proba(encoder.transform(payload))
+
+    seconds = time.perf_counter() - start_time
+
+    # touch every page of the model before measuring memory
+    if mode == "compiled":
+        forest.predict_proba(encoder.transform(make_sample_payload(100)))
+
+    barrier.wait()
+    results.put({"seconds": seconds, **memory_usage()})
+    barrier.wait()
+
+
+def memory_usage() -> Dict[str, float]:
+    """Return resident and proportional set size of the process in MB"""
+    usage = {}
+    for path, field, name in [
+        ("/proc/self/status", "VmRSS:", "rss_mb"),
+        ("/proc/self/smaps_rollup", "Pss:", "pss_mb"),
+    ]:
+        usage[name] = float("nan")
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as file:
+                for line in file:
+                    if line.startswith(field):
+                        usage[name] = int(line.split()[1]) / 1024
+
+    return usage
+
+
+def parse_args() -> Namespace:
+    """Parse command line arguments"""
+    # setup arg parser
+    parser = ArgumentParser("model_loading")
+
+    # add arguments
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--n_estimators", type=int, default=500)
+    parser.add_argument("--max_depth", type=int, default=25)
+
+    # parse args
+    args = parser.parse_args()
+
+    return args
+
+
+if __name__ == "__main__":
+    main(parse_args())
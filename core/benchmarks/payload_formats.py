@@ -0,0 +1,124 @@
+"""Benchmark request parse and score time of the online payload formats"""
+import json
+import os
+import tempfile
+from argparse import ArgumentParser, Namespace
+
+import mlflow
+import numpy as np
+import orjson
+import pandas as pd
+import pyarrow as pa
+from benchmarks.common import make_sample_payload, measure_latency, train_sample_model
+from benchmarks.load_test import import_online_score
+from constants import FEATURES
+from payloads import ARROW, JSON
+from register import save_compiled_model
+
+
+class NullTelemetry:
+    """Stand-in for the telemetry pipeline that discards requests"""
+
+    def submit(self, request_id, data, predictions) -> None:
+        pass
+
+
+def main(args: Namespace) -> None:
+    """Score payloads of each format through the online scoring handlers"""
+    online_score = import_online_score()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # save the model in the layout of a registered model
+        model_dir = os.path.join(tmp_dir, "credit-card-default", "1")
+        model = train_sample_model(n_estimators=args.n_estimators)
+        mlflow.sklearn.save_model(
+            model,
+            f"{model_dir}/model",
+            serialization_format=mlflow.sklearn.SERIALIZATION_FORMAT_CLOUDPICKLE,
+        )
+        save_compiled_model(model, f"{model_dir}/model/compiled")
+        os.environ["AZUREML_MODEL_DIR"] = model_dir
+        online_score.init()
+
+        # leave telemetry out so that the background worker does not add noise
+        online_score.TELEMETRY.close()
+        online_score.TELEMETRY = NullTelemetry()
+
+        for n_rows in args.sizes:
+            rows = make_sample_payload(n_rows)
+            bodies = make_bodies(rows)
+            repeat = max(args.repeat // n_rows, 5)
+
+            # parse records with the standard library and the schema decorators
+            def run_records():
+                data = json.loads(bodies["records"])["data"]
+                return json.loads(online_score.run(data=data))
+
+            # parse each format from the raw request body
+            def run_raw(name: str, content_type: str):
+                body, status, _ = online_score.handle_payload(
+                    bodies[name], content_type, content_type
+                )
+                assert status == 200, body
+                return body
+
+            expected = run_records()["predictions"]
+            np.testing.assert_allclose(
+                orjson.loads(run_raw("split", JSON))["predictions"], expected
+            )
+            np.testing.assert_allclose(
+                pa.ipc.open_stream(run_raw("arrow", ARROW))
+                .read_all()
+                .column("predictions")
+                .to_numpy(),
+                expected,
+            )
+
+            print(f"{n_rows:,} rows, p50 of parse and score")
+            results = {
+                "records, schema": measure_latency(run_records, repeat),
+                "records, raw": measure_latency(
+                    lambda: run_raw("records", JSON), repeat
+                ),
+                "split json": measure_latency(lambda: run_raw("split", JSON), repeat),
+                "arrow ipc": measure_latency(lambda: run_raw("arrow", ARROW), repeat),
+            }
+            for name, latency in results.items():
+                print(f"  {name:<16} {latency['p50_ms']:>9.2f} ms")
+
+
+def make_bodies(rows):
+    """Serialize the same rows as records, split json and an arrow stream"""
+    df = pd.DataFrame(rows, columns=FEATURES)
+    sink = pa.BufferOutputStream()
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+
+    return {
+        "records": json.dumps({"data": rows}).encode(),
+        "split": orjson.dumps(
+            {"columns": FEATURES, "data": df.to_numpy(dtype=object).tolist()}
+        ),
+        "arrow": sink.getvalue().to_pybytes(),
+    }
+
+
+def parse_args() -> Namespace:
+    """Parse command line arguments"""
+    # setup arg parser
+    parser = ArgumentParser("payload_formats")
+
+    # add arguments
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 100, 10000])
+    parser.add_argument("--n_estimators", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=2000)
+
+    # parse args
+    args = parser.parse_args()
+
+    return args
+
+
+if __name__ == "__main__":
+    main(parse_args())
@@ -0,0 +1,69 @@
+"""Benchmark successive halving against training every sampled candidate in full"""
+import time
+from argparse import ArgumentParser, Namespace
+
+import mlflow
+from benchmarks.common import make_sample_data
+from constants import FEATURES
+from features import compute_features
+from prepare import prepare_data
+from search import grow_forest, sample_candidates, successive_halving
+from sklearn.ensemble import RandomForestClassifier
+from train import make_preprocessor
+
+
+def main(args: Namespace) -> None:
+    """Compare wall-clock time and best validation f1 score of both searches"""
+    df_train, df_test = prepare_data(make_sample_data(args.n_rows), random_state=42)
+    preprocessor = make_preprocessor().fit(df_train[FEATURES])
+    matrices = compute_features(preprocessor, df_train, df_test)
+    candidates = sample_candidates(args.n_candidates, random_state=42)
+
+    # train every candidate with the maximum number of trees, like sweep trials
+    start_time = time.perf_counter()
+    full_scores = [
+        grow_forest(
+            RandomForestClassifier(**params), matrices, args.max_estimators, n_jobs=-1
+        )
+        for params in candidates
+    ]
+    full_time = time.perf_counter() - start_time
+
+    # grow candidates rung by rung and keep the best ones
+    with mlflow.start_run():
+        start_time = time.perf_counter()
+        params, classifier = successive_halving(
+            matrices, candidates, args.min_estimators, args.max_estimators, args.eta
+        )
+        halving_time = time.perf_counter() - start_time
+    halving_score = full_scores[
+        candidates.index(
+            {key: value for key, value in params.items() if key != "n_estimators"}
+        )
+    ]
+
+    print(f"{args.n_rows:,} rows, {args.n_candidates} candidates")
+    print(f"  full trials:        {full_time:.1f} s, best f1 {max(full_scores):.4f}")
+    print(f"  successive halving: {halving_time:.1f} s, best f1 {halving_score:.4f}")
+
+
+def parse_args() -> Namespace:
+    """Parse command line arguments"""
+    # setup arg parser
+    parser = ArgumentParser("search")
+
+    # add arguments
+    parser.add_argument("--n_rows", type=int, default=30000)
+    parser.add_argument("--n_candidates", type=int, default=9)
+    parser.add_argument("--min_estimators", type=int, default=100)
+    parser.add_argument("--max_estimators", type=int, default=1000)
+    parser.add_argument("--eta", type=int, default=3)
+
+    # parse args
+    args = parser.parse_args()
+
+    return args
+
+
+if __name__ == "__main__":
+    main(parse_args())
@@ -0,0 +1,101 @@
+"""Benchmark request latency of the online scoring service with shadow scoring"""
+import json
+import os
+import tempfile
+import time
+from argparse import ArgumentParser, Namespace
+
+import mlflow
+from benchmarks.common import make_sample_payload, measure_latency, train_sample_model
+from benchmarks.load_test import import_online_score
+from register import save_compiled_model
+
+
+class NullTelemetry:
+    """Stand-in for the telemetry pipeline that discards requests"""
+
+    def submit(self, request_id, data, predictions) -> None:
+        pass
+
+    def close(self, timeout=None) -> None:
+        pass
+
+
+def main(args: Namespace) -> None:
+    """Compare request latency without and with a shadow version"""
+    online_score = import_online_score()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # save a production and a candidate version in the registered model layout
+        versions_dir = os.path.join(tmp_dir, "credit-card-default")
+        for version, n_estimators in [
+            ("1", args.n_estimators),
+            ("2", 2 * args.n_estimators),
+        ]:
+            model_dir = os.path.join(versions_dir, version)
+            model = train_sample_model(n_estimators=n_estimators)
+            mlflow.sklearn.save_model(
+                model,
+                f"{model_dir}/model",
+                serialization_format=mlflow.sklearn.SERIALIZATION_FORMAT_CLOUDPICKLE,
+            )
+            save_compiled_model(model, f"{model_dir}/model/compiled")
+        os.environ["AZUREML_MODEL_DIR"] = os.path.join(versions_dir, "1")
+
+        for batch_size in args.batch_sizes:
+            payload = make_sample_payload(batch_size)
+            print(f"batch size {batch_size}, p50 / p99 of the request")
+
+            for name, shadow_version, sample_rate in [
+                ("no shadow", None, 0.0),
+                (f"shadow {args.sample_rate:.0%}", "2", args.sample_rate),
+                ("shadow 100%", "2", 1.0),
+            ]:
+                online_score.SHADOW_MODEL_VERSION = shadow_version
+                online_score.SHADOW_SAMPLE_RATE = sample_rate
+                online_score.init()
+
+                # leave telemetry out so that only the shadow worker runs
+                online_score.TELEMETRY.close()
+                online_score.TELEMETRY = NullTelemetry()
+
+                latency = measure_latency(
+                    lambda: online_score.run(data=payload), args.repeat
+                )
+
+                # let the shadow worker finish before the next configuration
+                drain_seconds, dropped = 0.0, 0
+                if online_score.SHADOW is not None:
+                    start_time = time.perf_counter()
+                    online_score.SHADOW.close()
+                    drain_seconds = time.perf_counter() - start_time
+                    dropped = online_score.SHADOW.dropped
+
+                print(
+                    f"  {name:<12} {latency['p50_ms']:>7.3f} ms "
+                    f"{latency['p99_ms']:>7.3f} ms, "
+                    f"dropped {dropped}, drained in {drain_seconds:.2f} s"
+                )
+
+        print(json.dumps(online_score.MODELS.stats()))
+
+
+def parse_args() -> Namespace:
+    """Parse command line arguments"""
+    # setup arg parser
+    parser = ArgumentParser("shadow_scoring")
+
+    # add arguments
+    parser.add_argument("--batch_sizes", type=int, nargs="+", default=[1, 100])
+    parser.add_argument("--n_estimators", type=int, default=100)
+    parser.add_argument("--sample_rate", type=float, default=0.1)
+    parser.add_argument("--repeat", type=int, default=2000)
+
+    # parse args
+    args = parser.parse_args()
+
+    return args
+
+
+if __name__ == "__main__":
+    main(parse_args())
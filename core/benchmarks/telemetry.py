@@ -0,0 +1,71 @@
+"""Benchmark request path latency of inline and background telemetry"""
+import logging
+import time
+import uuid
+from argparse import ArgumentParser, Namespace
+
+from benchmarks.common import make_sample_payload, measure_latency
+from telemetry import TelemetryPipeline
+
+
+class StubCollector:
+    """Stand-in for azureml.ai.monitoring.Collector with a fixed upload cost"""
+
+    def __init__(self, latency_ms: float) -> None:
+        self.latency = latency_ms / 1000
+
+    def collect(self, df, context=None):
+        time.sleep(self.latency)
+        return context
+
+
+def main(args: Namespace) -> None:
+    """Compare the time spent on telemetry before the response is returned"""
+    # log to a handler that formats records but discards the output
+    logger = logging.getLogger("telemetry_benchmark")
+    logger.setLevel(logging.INFO)
+    logger.addHandler(logging.NullHandler())
+    logger.propagate = False
+
+    collectors = [StubCollector(args.collector_latency_ms) for _ in range(3)]
+    pipeline = TelemetryPipeline("online/benchmark", logger, *collectors)
+
+    for batch_size in args.batch_sizes:
+        payload = make_sample_payload(batch_size)
+        predictions = [0.5] * batch_size
+
+        inline_latency = measure_latency(
+            lambda: pipeline.flush([(uuid.uuid4().hex, payload, predictions)]),
+            args.repeat,
+        )
+        background_latency = measure_latency(
+            lambda: pipeline.submit(uuid.uuid4().hex, payload, predictions),
+            args.repeat,
+        )
+
+        print(f"batch size {batch_size}")
+        print("  inline:    ", inline_latency)
+        print("  background:", background_latency)
+
+    pipeline.close()
+    print("dropped:", pipeline.dropped, "sampled:", pipeline.sampled)
+
+
+def parse_args() -> Namespace:
+    """Parse command line arguments"""
+    # setup arg parser
+    parser = ArgumentParser("telemetry")
+
+    # add arguments
+    parser.add_argument("--batch_sizes", type=int, nargs="+", default=[1, 10, 1000])
+    parser.add_argument("--collector_latency_ms", type=float, default=1.0)
+    parser.add_argument("--repeat", type=int, default=200)
+
+    # parse args
+    args = parser.parse_args()
+
+    return args
+
+
+if __name__ == "__main__":
+    main(parse_args())
@@ -0,0 +1,96 @@
+"""Benchmark the training engines on fit time, memory, model size and latency"""
+import multiprocessing
+import pickle
+import time
+from argparse import ArgumentParser, Namespace
+
+import pandas as pd
+from benchmarks.common import make_sample_data, make_sample_payload, measure_latency
+from benchmarks.export_writer import peak_rss_mb
+from constants import FEATURES, TARGET
+from prepare import prepare_data
+from sklearn.metrics import f1_score
+from train import make_classifer_pipeline
+
+
+def main(args: Namespace) -> None:
+    """Train each engine in a fresh process and report the measurements"""
+    context = multiprocessing.get_context("spawn")
+    for engine in args.engines:
+        results = context.Queue()
+        process = context.Process(target=run_engine, args=(engine, args, results))
+        process.start()
+        result = results.get()
+        process.join()
+
+        print(f"{engine}: {args.n_rows:,} rows")
+        print(f"  fit time:       {result['fit_seconds']:.1f} s")
+        print(f"  fit peak rss:   +{result['fit_rss_mb']:.0f} MB")
+        print(f"  model size:     {result['model_mb']:.1f} MB")
+        print(f"  1 row latency:  {result['p50_ms']:.1f} ms p50")
+        print(f"  batch scoring:  {result['rows_per_second']:,.0f} rows/s")
+        print(f"  validation f1:  {result['f1']:.4f}")
+
+
+def run_engine(engine: str, args: Namespace, results) -> None:
+    """Fit the pipeline of an engine and measure it"""
+    df_train, df_test = prepare_data(make_sample_data(args.n_rows), random_state=42)
+    params = {
+        "n_estimators": args.n_estimators,
+        "max_depth": args.max_depth,
+        "criterion": "gini",
+        "random_state": 42,
+    }
+
+    # fit the full pipeline, including the feature encoding
+    data_rss_mb = peak_rss_mb()
+    start_time = time.perf_counter()
+    model = make_classifer_pipeline(params, engine=engine)
+    model.fit(df_train[FEATURES], df_train[TARGET].values.ravel())
+    fit_seconds = time.perf_counter() - start_time
+    fit_rss_mb = peak_rss_mb() - data_rss_mb
+
+    # score single rows like the online endpoint and the test set in one batch
+    payload = pd.DataFrame(make_sample_payload(1))
+    latency = measure_latency(lambda: model.predict_proba(payload), args.repeat)
+    start_time = time.perf_counter()
+    y_pred = model.predict(df_test[FEATURES])
+    rows_per_second = len(df_test) / (time.perf_counter() - start_time)
+
+    results.put(
+        {
+            "fit_seconds": fit_seconds,
+            "fit_rss_mb": fit_rss_mb,
+            "model_mb": len(pickle.dumps(model)) / 1024**2,
+            "p50_ms": latency["p50_ms"],
+            "rows_per_second": rows_per_second,
+            "f1": f1_score(df_test[TARGET].values.ravel(), y_pred),
+        }
+    )
+
+
+def parse_args() -> Namespace:
+    """Parse command line arguments"""
+    # setup arg parser
+    parser = ArgumentParser("train_engines")
+
+    # add arguments
+    parser.add_argument(
+        "--engines",
+        type=str,
+        nargs="+",
+        default=["random_forest", "hist_gradient_boosting"],
+    )
+    parser.add_argument("--n_rows", type=int, default=200000)
+    parser.add_argument("--n_estimators", type=int, default=100)
+    parser.add_argument("--max_depth", type=int, default=25)
+    parser.add_argument("--repeat", type=int, default=100)
+
+    # parse args
+    args = parser.parse_args()
+
+    return args
+
+
+if __name__ == "__main__":
+    main(parse_args())
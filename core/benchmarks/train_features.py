@@ -0,0 +1,86 @@
+"""Benchmark sweep trials fitting full pipelines against precomputed features"""
+import tempfile
+import time
+from argparse import ArgumentParser, Namespace
+
+import numpy as np
+from benchmarks.common import make_sample_data
+from constants import FEATURES, TARGET
+from datasets import read_prepared, write_prepared
+from features import read_features
+from prepare import prepare_data, prepare_features
+from train import make_classifer_pipeline
+
+
+def main(args: Namespace) -> None:
+    """Compare the wall-clock time of trials with and without shared features"""
+    df_train, df_test = prepare_data(make_sample_data(args.n_rows), random_state=42)
+
+    with tempfile.TemporaryDirectory() as prepared_data_dir:
+        # prepare data and features once, as the prepare step does
+        start_time = time.perf_counter()
+        files = prepare_features(prepared_data_dir, df_train, df_test)
+        features_time = time.perf_counter() - start_time
+        write_prepared(
+            prepared_data_dir, {"train": df_train, "test": df_test}, "sample", files
+        )
+
+        params = {
+            "n_estimators": args.n_estimators,
+            "max_depth": args.max_depth,
+            "criterion": "gini",
+            "random_state": 42,
+        }
+
+        # fit preprocessor and classifier in every trial
+        start_time = time.perf_counter()
+        for _ in range(args.trials):
+            df_train = read_prepared(prepared_data_dir, "train")
+            df_test = read_prepared(prepared_data_dir, "test")
+            pipeline = make_classifer_pipeline(params)
+            pipeline.fit(df_train[FEATURES], df_train[TARGET].values.ravel())
+            pipeline_pred = pipeline.predict_proba(df_test[FEATURES])
+        pipeline_time = (time.perf_counter() - start_time) / args.trials
+
+        # fit the classifier only on memory-mapped features in every trial
+        start_time = time.perf_counter()
+        for _ in range(args.trials):
+            preprocessor, matrices = read_features(prepared_data_dir)
+            estimator = make_classifer_pipeline(params, preprocessor)
+            classifier = estimator.named_steps["classifier"]
+            classifier.fit(matrices["x_train"], matrices["y_train"])
+            features_pred = classifier.predict_proba(matrices["x_test"])
+        shared_time = (time.perf_counter() - start_time) / args.trials
+
+    # verify that both trials and the registered pipeline predict the same
+    np.testing.assert_array_equal(pipeline_pred, features_pred)
+    np.testing.assert_array_equal(
+        pipeline_pred, estimator.predict_proba(df_test[FEATURES])
+    )
+
+    print(f"{args.n_rows:,} rows, {args.n_estimators} trees")
+    print(f"  prepare features once: {features_time:.2f} s")
+    print(f"  full pipeline trial:   {pipeline_time:.2f} s")
+    print(f"  shared feature trial:  {shared_time:.2f} s")
+    print(f"  saving per trial:      {pipeline_time - shared_time:.2f} s")
+
+
+def parse_args() -> Namespace:
+    """Parse command line arguments"""
+    # setup arg parser
+    parser = ArgumentParser("train_features")
+
+    # add arguments
+    parser.add_argument("--n_rows", type=int, default=200000)
+    parser.add_argument("--n_estimators", type=int, default=100)
+    parser.add_argument("--max_depth", type=int, default=10)
+    parser.add_argument("--trials", type=int, default=3)
+
+    # parse args
+    args = parser.parse_args()
+
+    return args
+
+
+if __name__ == "__main__":
+    main(parse_args())
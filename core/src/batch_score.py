@@ -0,0 +1,174 @@
+"""Script for an azureml batch deployment that also scores files locally"""
+import multiprocessing
+import os
+from argparse import ArgumentParser, Namespace
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Deque, Iterator, List, Optional, Tuple
+
+import mlflow
+import numpy as np
+import pandas as pd
+from constants import FEATURES
+from readers import iter_file
+from sklearn.pipeline import Pipeline
+
+# define number of rows read and scored together
+BATCH_CHUNK_SIZE = int(os.getenv("BATCH_CHUNK_SIZE", "10000"))
+
+# define number of scoring processes, zero uses every core
+BATCH_MAX_WORKERS = int(os.getenv("BATCH_MAX_WORKERS", "0"))
+
+# define extensions of the input files that can be scored
+INPUT_EXTENSIONS = (".csv", ".parquet")
+
+# define columns of the written predictions
+PREDICTION_COLUMNS = ["file_name", "row_id", "prediction"]
+
+# define global variables
+MODEL = None
+EXECUTOR = None
+MAX_PENDING = None
+
+
+def init() -> None:
+    """Startup event handler to load an MLFlow model and start the workers"""
+    global MODEL, EXECUTOR, MAX_PENDING
+
+    MODEL = load_model(os.getenv("AZUREML_MODEL_DIR") + "/model")
+    EXECUTOR, MAX_PENDING = make_executor(BATCH_MAX_WORKERS)
+
+
+def run(mini_batch: List[str]) -> pd.DataFrame:
+    """Score the files of a mini batch, keeping rows in input order"""
+    files = [file_path for file_path in mini_batch if is_input_file(file_path)]
+    predictions = list(score_files(files, EXECUTOR, BATCH_CHUNK_SIZE, MAX_PENDING))
+    if not predictions:
+        return make_predictions("", 0, np.empty(0))
+
+    return pd.concat(predictions, ignore_index=True)
+
+
+def load_model(model_dir: str) -> Pipeline:
+    """Load the model pipeline, scoring each chunk on a single core"""
+    model = mlflow.sklearn.load_model(model_dir)
+
+    # use one core per chunk since the workers score chunks in parallel
+    classifier = model.named_steps["classifier"]
+    if "n_jobs" in classifier.get_params():
+        classifier.set_params(n_jobs=1)
+
+    return model
+
+
+def make_executor(max_workers: int) -> Tuple[ProcessPoolExecutor, int]:
+    """Start workers forked after loading the model, return the chunks they hold"""
+    max_workers = max_workers or os.cpu_count() or 1
+
+    # forked workers share the pages of the loaded model with the parent
+    executor = ProcessPoolExecutor(
+        max_workers=max_workers, mp_context=multiprocessing.get_context("fork")
+    )
+
+    # bound the number of chunks held in memory by the number of workers
+    return executor, 2 * max_workers
+
+
+def score_files(
+    files: List[str], executor: ProcessPoolExecutor, chunk_size: int, max_pending: int
+) -> Iterator[pd.DataFrame]:
+    """Score chunks of files concurrently, yielding predictions in input order"""
+    pending: Deque[Tuple[str, int, Future]] = deque()
+
+    for file_path in files:
+        row_id = 0
+        for df in iter_file(file_path, FEATURES, chunk_size):
+            pending.append((file_path, row_id, executor.submit(score_chunk, df)))
+            row_id += len(df)
+
+            if len(pending) >= max_pending:
+                file_name, start, future = pending.popleft()
+                yield make_predictions(file_name, start, future.result())
+
+    while pending:
+        file_name, start, future = pending.popleft()
+        yield make_predictions(file_name, start, future.result())
+
+
+def score_chunk(df: pd.DataFrame) -> np.ndarray:
+    """Return the probability of the positive class for each row of a chunk"""
+    return MODEL.predict_proba(df[FEATURES])[:, 1]
+
+
+def make_predictions(
+    file_path: str, start: int, predictions: np.ndarray
+) -> pd.DataFrame:
+    """Identify predictions by input file name and row number"""
+    return pd.DataFrame(
+        {
+            "file_name": os.path.basename(file_path),
+            "row_id": np.arange(start, start + len(predictions)),
+            "prediction": predictions,
+        },
+        columns=PREDICTION_COLUMNS,
+    )
+
+
+def is_input_file(file_path: str) -> bool:
+    """Return whether a file holds inference data"""
+    return file_path.endswith(INPUT_EXTENSIONS)
+
+
+def list_input_files(input_path: str) -> List[str]:
+    """List inference data files of a file or folder in a stable order"""
+    if os.path.isfile(input_path):
+        return [input_path]
+
+    return sorted(
+        os.path.join(root, name)
+        for root, _, names in os.walk(input_path)
+        for name in names
+        if is_input_file(name)
+    )
+
+
+def main(args: Namespace, model: Optional[Pipeline] = None) -> None:
+    """Score inference data files and write predictions in input order"""
+    global MODEL
+
+    MODEL = model if model is not None else load_model(args.model_dir)
+    files = list_input_files(args.input_path)
+
+    # append chunks of predictions so that memory stays bounded
+    path = os.path.join(args.output_dir, "predictions.csv")
+    os.makedirs(args.output_dir, exist_ok=True)
+    executor, max_pending = make_executor(args.max_workers)
+    with executor, open(f"{path}.tmp", "w", encoding="utf-8", newline="") as file:
+        file.write(",".join(PREDICTION_COLUMNS) + "\n")
+        for predictions in score_files(files, executor, args.chunk_size, max_pending):
+            predictions.to_csv(file, header=False, index=False)
+
+    os.replace(f"{path}.tmp", path)
+    print("Wrote predictions:", path)
+
+
+def parse_args() -> Namespace:
+    """Parse command line arguments"""
+    # setup arg parser
+    parser = ArgumentParser("batch_score")
+
+    # add arguments
+    parser.add_argument("--model_dir", type=str)
+    parser.add_argument("--input_path", type=str)
+    parser.add_argument("--output_dir", type=str)
+    parser.add_argument("--chunk_size", type=int, default=BATCH_CHUNK_SIZE)
+    parser.add_argument("--max_workers", type=int, default=BATCH_MAX_WORKERS)
+
+    # parse args
+    args = parser.parse_args()
+
+    return args
+
+
+if __name__ == "__main__":
+    main(parse_args())
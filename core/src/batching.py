@@ -0,0 +1,77 @@
+"""Micro-batching of concurrent requests for the online scoring service"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Tuple
+
+# define type of a queued request
+Request = Tuple[List[Dict], Future]
+
+
+class MicroBatcher:
+    """Coalesce concurrent scoring requests into a single model call"""
+
+    def __init__(
+        self,
+        predict: Callable[[List[Dict]], List[float]],
+        max_batch_size: int = 64,
+        max_wait_ms: float = 5.0,
+    ) -> None:
+        self.predict = predict
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+
+        # start worker thread flushing the request queue
+        self._queue: "queue.Queue[Request]" = queue.Queue()
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def submit(self, data: List[Dict]) -> List[float]:
+        """Queue payload rows and block until their predictions are available"""
+        # requests that fill a batch on their own are scored directly
+        if len(data) >= self.max_batch_size:
+            return self.predict(data)
+
+        future: Future = Future()
+        self._queue.put((data, future))
+
+        return future.result()
+
+    def _run(self) -> None:
+        """Collect queued requests until the batch is full or the wait expires"""
+        while True:
+            batch = [self._queue.get()]
+            n_rows = len(batch[0][0])
+            deadline = time.monotonic() + self.max_wait
+
+            while n_rows < self.max_batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    request = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                batch.append(request)
+                n_rows += len(request[0])
+
+            self._flush(batch)
+
+    def _flush(self, batch: List[Request]) -> None:
+        """Score a batch and hand every caller its own slice of the results"""
+        try:
+            predictions = self.predict([row for data, _ in batch for row in data])
+        except Exception:
+            # score requests one by one so that a bad payload only fails its caller
+            for data, future in batch:
+                try:
+                    future.set_result(self.predict(data))
+                except Exception as error:
+                    future.set_exception(error)
+            return
+
+        start = 0
+        for data, future in batch:
+            future.set_result(predictions[start : start + len(data)])
+            start += len(data)
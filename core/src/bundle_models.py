@@ -0,0 +1,53 @@
+"""Script to bundle registered model versions for a single online deployment"""
+import json
+import os
+from argparse import ArgumentParser, Namespace
+
+import mlflow
+from hosting import BUNDLE_CONFIG, BUNDLE_FOLDER
+
+
+def main(args: Namespace) -> None:
+    """Download registered model versions into the folders of a model bundle"""
+    bundle_dir = os.path.join(args.output_dir, BUNDLE_FOLDER)
+
+    # download each version in the layout of a registered model
+    for version in args.versions:
+        model_dir = os.path.join(bundle_dir, version, "model")
+        os.makedirs(model_dir, exist_ok=True)
+        mlflow.artifacts.download_artifacts(
+            artifact_uri=f"models:/{args.model_name}/{version}", dst_path=model_dir
+        )
+        print("Downloaded model version:", version)
+
+    # name the model and the version serving requests without a version
+    with open(os.path.join(bundle_dir, BUNDLE_CONFIG), "w", encoding="utf-8") as file:
+        json.dump(
+            {
+                "model_name": args.model_name,
+                "default_version": args.default_version or args.versions[0],
+                "versions": args.versions,
+            },
+            file,
+        )
+
+
+def parse_args() -> Namespace:
+    """Parse command line arguments"""
+    # setup arg parser
+    parser = ArgumentParser("bundle_models")
+
+    # add arguments
+    parser.add_argument("--model_name", type=str, default="credit-card-default")
+    parser.add_argument("--versions", type=str, nargs="+")
+    parser.add_argument("--default_version", type=str)
+    parser.add_argument("--output_dir", type=str, default="bundle")
+
+    # parse args
+    args = parser.parse_args()
+
+    return args
+
+
+if __name__ == "__main__":
+    main(parse_args())
@@ -0,0 +1,112 @@
+"""In-process prediction cache for the online scoring service"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Optional, Tuple
+
+from constants import FEATURES, NUMERIC_FEATURES
+
+# define lookup of numeric features for key normalization
+_NUMERIC_FEATURES = frozenset(NUMERIC_FEATURES)
+
+
+class PredictionCache:
+    """Bounded LRU cache of predictions keyed on canonical feature vectors"""
+
+    def __init__(self, max_size: int = 10000, ttl_seconds: float = 0) -> None:
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.model_id: Optional[str] = None
+
+        # map canonical feature vectors to (prediction, expiry time)
+        self._entries: "OrderedDict[Hashable, Tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        # define counters used to size the cache
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def bind(self, model_id: str) -> None:
+        """Clear the cache when it is used with a different model"""
+        with self._lock:
+            if model_id != self.model_id:
+                self._entries.clear()
+                self.model_id = model_id
+
+    @staticmethod
+    def make_key(row: Dict) -> Optional[Hashable]:
+        """Return a canonical key for the features of a payload row"""
+        try:
+            return tuple(
+                _canonical_value(row.get(feature), feature) for feature in FEATURES
+            )
+        except (TypeError, ValueError):
+            return None
+
+    def get_many(self, keys: List[Optional[Hashable]]) -> List[Optional[float]]:
+        """Look up cached predictions, None is returned for misses"""
+        now = time.monotonic()
+        predictions = []
+
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key) if key is not None else None
+
+                # expired entries count as misses and are evicted
+                if entry is not None and entry[1] < now:
+                    del self._entries[key]
+                    self.evictions += 1
+                    entry = None
+
+                if entry is None:
+                    self.misses += 1
+                    predictions.append(None)
+                else:
+                    self.hits += 1
+                    self._entries.move_to_end(key)
+                    predictions.append(entry[0])
+
+        return predictions
+
+    def put_many(
+        self, keys: List[Optional[Hashable]], predictions: List[float]
+    ) -> None:
+        """Store predictions and evict the least recently used entries"""
+        expires_at = (
+            time.monotonic() + self.ttl_seconds if self.ttl_seconds else float("inf")
+        )
+
+        with self._lock:
+            for key, prediction in zip(keys, predictions):
+                if key is None:
+                    continue
+                self._entries[key] = (prediction, expires_at)
+                self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> Dict[str, int]:
+        """Return the cache counters"""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+            }
+
+
+def _canonical_value(value, feature: str):
+    """Normalize a feature value so that equal inputs share a cache key"""
+    # missing values are imputed by the model, so they share one key
+    if value is None or value != value:
+        return None
+
+    if feature in _NUMERIC_FEATURES:
+        return float(value)
+
+    return str(value)
@@ -0,0 +1,127 @@
+"""Pruning of random forest model pipelines to a subset of their trees"""
+import copy
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import sklearn
+from features import Matrix
+from sklearn.ensemble import RandomForestClassifier, _forest
+from sklearn.metrics import f1_score, roc_auc_score
+from sklearn.pipeline import Pipeline
+from sklearn.utils.fixes import parse_version
+
+# define sklearn versions whose bootstrap sampling was checked, as [first, last)
+SKLEARN_BOOTSTRAP_VERSIONS = ((1, 2), (2, 0))
+
+
+def tree_probabilities(
+    classifier: RandomForestClassifier, features: Matrix
+) -> np.ndarray:
+    """Return the positive class probability of every tree for every row"""
+    return np.stack(
+        [tree.predict_proba(features)[:, 1] for tree in classifier.estimators_]
+    )
+
+
+def oob_tree_probabilities(
+    classifier: RandomForestClassifier, features: Matrix
+) -> np.ndarray:
+    """Return the probability of every tree for the training rows it did not draw"""
+    if not classifier.bootstrap:
+        raise ValueError("Forest was fitted without bootstrap samples")
+
+    probabilities = tree_probabilities(classifier, features)
+    n_samples = features.shape[0]
+
+    # leave out the rows each tree drew for its bootstrap sample
+    for index, tree in enumerate(classifier.estimators_):
+        unsampled = unsampled_indices(
+            tree.random_state, n_samples, classifier.max_samples
+        )
+        drawn = np.ones(n_samples, dtype=bool)
+        drawn[unsampled] = False
+        probabilities[index, drawn] = np.nan
+
+    return probabilities
+
+
+def unsampled_indices(
+    random_state: int, n_samples: int, max_samples: Optional[float]
+) -> np.ndarray:
+    """Return the rows a forest tree did not draw, with the helpers of sklearn"""
+    # the helpers are private, sklearn 1.8 added a sample weight argument and
+    # forests fitted by other versions are not supported
+    version = parse_version(sklearn.__version__).release[:2]
+    if not SKLEARN_BOOTSTRAP_VERSIONS[0] <= version < SKLEARN_BOOTSTRAP_VERSIONS[1]:
+        raise ValueError(
+            f"Out-of-bag rows are not supported for sklearn {sklearn.__version__}"
+        )
+    if version < (1, 8):
+        n_drawn = _forest._get_n_samples_bootstrap(n_samples, max_samples)
+        return _forest._generate_unsampled_indices(random_state, n_samples, n_drawn)
+
+    n_drawn = _forest._get_n_samples_bootstrap(n_samples, max_samples, None)
+    return _forest._generate_unsampled_indices(random_state, n_samples, n_drawn, None)
+
+
+def score_probabilities(y_true: np.ndarray, y_proba: np.ndarray) -> Dict[str, float]:
+    """Calculate the validation metrics compared when compacting a model"""
+    return {
+        "validation_f1_score": float(f1_score(y_true, y_proba > 0.5)),
+        "validation_roc_auc_score": float(roc_auc_score(y_true, y_proba)),
+    }
+
+
+def select_trees(
+    probabilities: np.ndarray, y_true: np.ndarray, tolerance: float
+) -> Tuple[np.ndarray, Dict[str, float]]:
+    """Find the fewest best trees whose average stays within tolerance of all trees"""
+    # rows that are nan for a tree, like its out-of-bag rows, are left out
+    scored = ~np.isnan(probabilities)
+    probabilities = np.where(scored, probabilities, 0.0)
+    baseline = score_average(probabilities.sum(axis=0), scored.sum(axis=0), y_true)
+
+    # add trees in order of their own roc auc and average them incrementally
+    order = np.argsort(
+        [
+            -roc_auc_score(y_true[tree_scored], tree_proba[tree_scored])
+            for tree_proba, tree_scored in zip(probabilities, scored)
+        ],
+        kind="stable",
+    )
+    cumulative = np.cumsum(probabilities[order], axis=0)
+    counts = np.cumsum(scored[order], axis=0)
+
+    for n_trees in range(1, len(order) + 1):
+        metrics = score_average(cumulative[n_trees - 1], counts[n_trees - 1], y_true)
+        if all(metrics[name] >= baseline[name] - tolerance for name in baseline):
+            return np.sort(order[:n_trees]), metrics
+
+    return np.arange(len(order)), baseline
+
+
+def score_average(
+    total: np.ndarray, counts: np.ndarray, y_true: np.ndarray
+) -> Dict[str, float]:
+    """Score the average probability of the rows scored by at least one tree"""
+    rows = counts > 0
+
+    return score_probabilities(y_true[rows], total[rows] / counts[rows])
+
+
+def prune_pipeline(model: Pipeline, trees: np.ndarray) -> Pipeline:
+    """Return a copy of a model pipeline keeping a subset of the forest trees"""
+    # copy the pipeline without copying the trees
+    classifier = model.named_steps["classifier"]
+    estimators = classifier.estimators_
+    classifier.estimators_ = []
+    try:
+        pruned = copy.deepcopy(model)
+    finally:
+        classifier.estimators_ = estimators
+
+    pruned_classifier = pruned.named_steps["classifier"]
+    pruned_classifier.estimators_ = [estimators[index] for index in trees]
+    pruned_classifier.n_estimators = len(trees)
+
+    return pruned
@@ -1,46 +1,177 @@
 """Script to run data quality tests"""
+import hashlib
+import json
+import os
+import re
+import shutil
+import time
 from argparse import ArgumentParser, Namespace
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional, Tuple
 
 import mlflow
 import pandas as pd
 from constants import CATEGORICAL_FEATURES, TARGET
+from datasets import hash_files, read_manifest, read_prepared
+from deepchecks.core import CheckFailure, SuiteResult
 from deepchecks.tabular import Dataset
 from deepchecks.tabular.suites import data_integrity, train_test_validation
+from instrumentation import stage
+from sklearn.model_selection import train_test_split
+
+# define version of the data quality results, bump when the suites change
+DATA_QUALITY_VERSION = 1
+
+# define name of the file holding the cached suite results
+RESULTS = "results.json"
+
+# define suites run on the train dataset only or on both datasets
+SUITES = {
+    "data_integrity": data_integrity,
+    "train_test_validation": train_test_validation,
+}
 
 
 def main(args: Namespace) -> None:
     """Generate data quality report"""
-    # read data
-    df_train = pd.read_csv(f"{args.prepared_data_dir}/train.csv")
-    df_test = pd.read_csv(f"{args.prepared_data_dir}/test.csv")
+    # identify results by the prepared data and the sample taken from it
+    sample_size = args.sample_size if args.mode == "fast" else 0
+    key = data_quality_key(args.prepared_data_dir, sample_size, args.random_state)
+    cache_dir = f"{args.cache_dir}/{key}" if args.cache_dir else None
+    mlflow.log_param("data_quality_key", key)
+
+    # skip the suites when the results of unchanged data are cached
+    if cache_dir and os.path.exists(os.path.join(cache_dir, RESULTS)):
+        print("Using cached data quality results:", cache_dir)
+        with open(os.path.join(cache_dir, RESULTS), encoding="utf-8") as file:
+            log_results(json.load(file), cache_dir)
+        return
 
+    # read data
+    with stage("read_data"):
+        df_train = read_prepared(args.prepared_data_dir, "train")
+        df_test = read_prepared(args.prepared_data_dir, "test")
+
+    # run the suites one after the other or concurrently on stratified samples
+    if args.mode == "full":
+        with stage("suites"):
+            outputs = {
+                name: run_suite(name, df_train, df_test, f"./{name}.html")
+                for name in SUITES
+            }
+    else:
+        df_train = stratified_sample(df_train, sample_size, args.random_state)
+        df_test = stratified_sample(df_test, sample_size, args.random_state)
+        with stage("suites"), ProcessPoolExecutor(max_workers=len(SUITES)) as executor:
+            futures = {
+                name: executor.submit(
+                    run_suite, name, df_train, df_test, f"./{name}.html"
+                )
+                for name in SUITES
+            }
+            outputs = {name: future.result() for name, future in futures.items()}
+
+    # log time spent in each check to find slow checks
+    for name, (_, timings) in outputs.items():
+        for check_name, seconds in timings.items():
+            mlflow.log_metric(f"{name}_{metric_name(check_name)}_seconds", seconds)
+
+    results = {
+        "key": key,
+        "suites": {name: passed for name, (passed, _) in outputs.items()},
+    }
+    log_results(results, ".")
+
+    # add the results and html reports to the cache
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+        for name in SUITES:
+            shutil.copyfile(f"./{name}.html", os.path.join(cache_dir, f"{name}.html"))
+        with open(
+            os.path.join(cache_dir, f"{RESULTS}.tmp"), "w", encoding="utf-8"
+        ) as file:
+            json.dump(results, file)
+        os.replace(
+            os.path.join(cache_dir, f"{RESULTS}.tmp"), os.path.join(cache_dir, RESULTS)
+        )
+
+
+def run_suite(
+    name: str, df_train: pd.DataFrame, df_test: pd.DataFrame, report_path: str
+) -> Tuple[bool, Dict[str, float]]:
+    """Run a deepchecks suite, save its html report and time each check"""
     # initiate dataset objects
     dataset_train = Dataset(
         df_train, cat_features=CATEGORICAL_FEATURES, label=TARGET[0]
     )
     dataset_test = Dataset(df_test, cat_features=CATEGORICAL_FEATURES, label=TARGET[0])
 
-    # run data integrity suite
-    data_integrity_suite = data_integrity()
-    data_integrity_result = data_integrity_suite.run(dataset_train)
+    # run the checks one at a time to time each of them, failing checks are
+    # reported in the results like suite.run does
+    suite = SUITES[name]()
+    results = []
+    timings: Dict[str, float] = {}
+    for check in suite.checks.values():
+        start_time = time.perf_counter()
+        try:
+            # run the data integrity suite on train data only
+            if name == "data_integrity":
+                results.append(check.run(dataset_train))
+            else:
+                results.append(check.run(dataset_train, dataset_test))
+        except Exception as error:
+            results.append(CheckFailure(check, error))
+        timings[check.name()] = time.perf_counter() - start_time
+
+    # save html output
+    result = SuiteResult(suite.name, results)
+    result.save_as_html(report_path)
+
+    return result.passed(), timings
+
+
+def stratified_sample(
+    df: pd.DataFrame, sample_size: int, random_state: int
+) -> pd.DataFrame:
+    """Sample rows keeping the share of each target class"""
+    if not sample_size or len(df) <= sample_size:
+        return df
 
-    # run train test validation suite
-    train_test_validation_suite = train_test_validation()
-    train_test_validation_result = train_test_validation_suite.run(
-        dataset_train, dataset_test
+    df_sample, _ = train_test_split(
+        df, train_size=sample_size, stratify=df[TARGET[0]], random_state=random_state
     )
 
-    # display test results
-    print("data integrity suite result:", data_integrity_result.passed())
-    print("train test validation suite result:", train_test_validation_result.passed())
+    return df_sample
+
+
+def data_quality_key(
+    prepared_data_dir: str, sample_size: Optional[int], random_state: int
+) -> str:
+    """Calculate the key of data quality results of prepared data"""
+    manifest = read_manifest(prepared_data_dir)
+    data_key = manifest["key"] if manifest else hash_files(prepared_data_dir)
+
+    return hashlib.sha256(
+        json.dumps(
+            [DATA_QUALITY_VERSION, data_key, sample_size or 0, random_state]
+        ).encode()
+    ).hexdigest()
 
-    # save html output
-    data_integrity_result.save_as_html("./data_integrity.html")
-    train_test_validation_result.save_as_html("./train_test_validation.html")
+
+def log_results(results: Dict, report_dir: str) -> None:
+    """Display suite results and log the html reports"""
+    # display test results
+    for name, passed in results["suites"].items():
+        print(f"{name.replace('_', ' ')} suite result:", passed)
 
     # log html output
-    mlflow.log_artifact("./data_integrity.html")
-    mlflow.log_artifact("./train_test_validation.html")
+    for name in results["suites"]:
+        mlflow.log_artifact(os.path.join(report_dir, f"{name}.html"))
+
+
+def metric_name(check_name: str) -> str:
+    """Convert a check name to a metric name"""
+    return re.sub(r"[^0-9a-z]+", "_", check_name.lower()).strip("_")
 
 
 def parse_args() -> Namespace:
@@ -50,6 +181,10 @@ def parse_args() -> Namespace:
 
     # add arguments
     parser.add_argument("--prepared_data_dir", type=str)
+    parser.add_argument("--mode", type=str, choices=["full", "fast"], default="full")
+    parser.add_argument("--sample_size", type=lambda x: int(float(x)), default=0)
+    parser.add_argument("--random_state", type=lambda x: int(float(x)), default=24)
+    parser.add_argument("--cache_dir", type=str)
 
     # parse args
     args = parser.parse_args()
@@ -0,0 +1,117 @@
+"""Typed columnar datasets shared by the preparation and training scripts"""
+import hashlib
+import json
+import os
+import shutil
+from typing import Dict, Iterator, List, Optional
+
+import pandas as pd
+import pyarrow.feather as feather
+
+# define version of the prepared data format, bump when preparation changes
+PREPARED_VERSION = 2
+
+# define name of the file identifying the input of prepared data
+MANIFEST = "prepared.json"
+
+
+def hash_files(path: str) -> str:
+    """Calculate a content hash of every file in a folder"""
+    digest = hashlib.sha256()
+    for root, directories, files in os.walk(path):
+        directories.sort()
+        for name in sorted(files):
+            file_path = os.path.join(root, name)
+            digest.update(os.path.relpath(file_path, path).encode())
+            for chunk in read_chunks(file_path):
+                digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def hash_file(file_path: str) -> str:
+    """Calculate a content hash of a single file"""
+    digest = hashlib.sha256()
+    for chunk in read_chunks(file_path):
+        digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def read_chunks(file_path: str) -> Iterator[bytes]:
+    """Read a file in chunks of a megabyte"""
+    with open(file_path, "rb") as file:
+        yield from iter(lambda: file.read(1 << 20), b"")
+
+
+def prepared_key(content_hash: str, random_state: int) -> str:
+    """Calculate the key of data prepared from an input with a random state"""
+    return hashlib.sha256(
+        json.dumps([PREPARED_VERSION, content_hash, random_state]).encode()
+    ).hexdigest()
+
+
+def read_prepared(prepared_data_dir: str, name: str) -> pd.DataFrame:
+    """Read a prepared dataset, memory-mapping arrow files and falling back to csv"""
+    path = os.path.join(prepared_data_dir, f"{name}.arrow")
+    if os.path.exists(path):
+        return feather.read_table(path, memory_map=True).to_pandas()
+
+    return pd.read_csv(os.path.join(prepared_data_dir, f"{name}.csv"))
+
+
+def write_prepared(
+    prepared_data_dir: str,
+    datasets: Dict[str, pd.DataFrame],
+    key: str,
+    files: Optional[List[str]] = None,
+) -> None:
+    """Write uncompressed arrow files and then the manifest identifying them"""
+    os.makedirs(prepared_data_dir, exist_ok=True)
+    for name, df in datasets.items():
+        path = os.path.join(prepared_data_dir, f"{name}.arrow")
+        feather.write_feather(
+            df.reset_index(drop=True), f"{path}.tmp", compression="uncompressed"
+        )
+        os.replace(f"{path}.tmp", path)
+
+    write_manifest(
+        prepared_data_dir,
+        {"key": key, "datasets": list(datasets), "files": files or []},
+    )
+
+
+def copy_prepared(source_dir: str, target_dir: str) -> None:
+    """Copy prepared datasets, their other files and manifest to another folder"""
+    manifest = read_manifest(source_dir)
+    os.makedirs(target_dir, exist_ok=True)
+    file_names = [f"{name}.arrow" for name in manifest["datasets"]]
+    for file_name in file_names + manifest.get("files", []):
+        shutil.copyfile(
+            os.path.join(source_dir, file_name),
+            os.path.join(target_dir, f"{file_name}.tmp"),
+        )
+        os.replace(
+            os.path.join(target_dir, f"{file_name}.tmp"),
+            os.path.join(target_dir, file_name),
+        )
+
+    write_manifest(target_dir, manifest)
+
+
+def read_manifest(prepared_data_dir: str) -> Optional[Dict]:
+    """Read the manifest of prepared data if it exists"""
+    path = os.path.join(prepared_data_dir, MANIFEST)
+    if not os.path.exists(path):
+        return None
+
+    with open(path, encoding="utf-8") as file:
+        return json.load(file)
+
+
+def write_manifest(prepared_data_dir: str, manifest: Dict) -> None:
+    """Write the manifest of prepared data atomically"""
+    path = os.path.join(prepared_data_dir, MANIFEST)
+    with open(f"{path}.tmp", "w", encoding="utf-8") as file:
+        json.dump(manifest, file)
+    os.replace(f"{path}.tmp", path)
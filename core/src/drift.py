@@ -1,88 +1,132 @@
 """Script to calculate data drift metrics for a baseline and target dataset"""
+import glob
 import json
 import logging
+import os
 from argparse import ArgumentParser, Namespace
-from typing import Dict, Tuple
+from typing import Dict, Iterator, List, Optional, Tuple
 
 import mltable
+import pandas as pd
+import yaml
 from constants import CATEGORICAL_FEATURES, FEATURES, NUMERIC_FEATURES
+from drift_engine import calculate_native_drift
 from evidently.model_profile import Profile
 from evidently.model_profile.sections import (
     CatTargetDriftProfileSection,
     DataDriftProfileSection,
 )
 from evidently.pipeline.column_mapping import ColumnMapping
+from instrumentation import stage
 from opencensus.ext.azure.log_exporter import AzureLogHandler
+from profiles import (
+    DatasetProfile,
+    compare_profiles,
+    hash_files,
+    load_reference_profile,
+)
+from readers import iter_file
+from stattests import HISTOGRAM_STATTESTS, STATTESTS
+from windows import (
+    FREQUENCIES,
+    load_sketches,
+    load_watermarks,
+    save_watermarks,
+    window_drift,
+)
 
 
 def main(args: Namespace, log: logging.Logger) -> None:
     """Calculate data drift metrics and send to app insights"""
     try:
-        # load datasets
-        reference_tbl = mltable.load(args.reference_data)
-        target_tbl = mltable.load(args.target_data)
+        # compare windows of the target data with the reference profile
+        if args.window_days:
+            reference_profile = get_reference_profile(args)
+            table = load_mltable_config(args.target_data)
+            with stage("load_sketches"):
+                sketches = load_sketches(
+                    args.target_data,
+                    list_files(args.target_data, table["paths"]),
+                    reference_profile,
+                    args.sketch_dir,
+                    args.window_frequency,
+                    args.chunk_size or 100000,
+                )
 
-        reference_df = reference_tbl.to_pandas_dataframe()
-        target_df = target_tbl.to_pandas_dataframe()
-
-        # change data types of features
-        reference_df[CATEGORICAL_FEATURES] = reference_df[CATEGORICAL_FEATURES].astype(
-            "str"
-        )
-        reference_df[NUMERIC_FEATURES] = reference_df[NUMERIC_FEATURES].astype("float")
-        target_df[CATEGORICAL_FEATURES] = target_df[CATEGORICAL_FEATURES].astype("str")
-        target_df[NUMERIC_FEATURES] = target_df[NUMERIC_FEATURES].astype("float")
-
-        # define column mapping for evidently
-        column_mapping = ColumnMapping()
-        column_mapping.target = None
-        column_mapping.prediction = None
-        column_mapping.id = None
-        column_mapping.datetime = None
-        column_mapping.numerical_features = NUMERIC_FEATURES
-        column_mapping.categorical_features = CATEGORICAL_FEATURES
-
-        # generate data drift profile
-        data_drift_profile = Profile(
-            sections=[DataDriftProfileSection(), CatTargetDriftProfileSection()]
-        )
-        data_drift_profile.calculate(
-            reference_df, target_df, column_mapping=column_mapping
-        )
+            # report windows ending after the last reported window of each size
+            watermarks = load_watermarks(
+                args.sketch_dir, reference_profile, args.window_frequency
+            )
+            for window_days in args.window_days:
+                for start, end, overall_metrics, feature_metrics in window_drift(
+                    sketches,
+                    reference_profile,
+                    window_days,
+                    args.window_frequency,
+                    watermarks.get(str(window_days)),
+                    args.numeric_stattest,
+                    args.categorical_stattest,
+                ):
+                    window = {
+                        "window_start": start.isoformat(),
+                        "window_end": end.isoformat(),
+                        "window_days": window_days,
+                    }
+                    log_drift_metrics(
+                        log, args.model_name, overall_metrics, feature_metrics, window
+                    )
+                    watermarks[str(window_days)] = end
 
-        # convert drift  profile to json
-        data_drift_profile_json = json.loads(data_drift_profile.json())
-        print(data_drift_profile_json)
+            save_watermarks(
+                args.sketch_dir, reference_profile, args.window_frequency, watermarks
+            )
+            return
 
-        # process data drift output
-        overall_metrics, feature_metrics = process_data_drift_output(
-            data_drift_profile_json["data_drift"]["data"]["metrics"]
-        )
+        # compare target data with the reference profile
+        if args.reference_profile_dir or args.chunk_size:
+            reference_profile = get_reference_profile(args)
 
-        print("Overall data drift metrics:", overall_metrics)
-        print("Feature data drift metrics:", feature_metrics)
+            # accumulate the target profile in chunks or from the full dataset
+            target_profile = reference_profile.empty_like()
+            with stage("profile_target"):
+                if args.chunk_size:
+                    for target_df in iter_dataset(args.target_data, args.chunk_size):
+                        target_profile.update(target_df)
+                else:
+                    target_profile.update(load_dataset(args.target_data))
 
-        # Log overall drift metrics
-        log.info(
-            json.dumps(
-                {
-                    "model_name": args.model_name,
-                    "type": "OverallDriftMetrics",
-                    "data": overall_metrics,
-                }
+            overall_metrics, feature_metrics = compare_profiles(
+                reference_profile,
+                target_profile,
+                args.numeric_stattest,
+                args.categorical_stattest,
             )
-        )
 
-        # Log feature drift metrics
-        log.info(
-            json.dumps(
-                {
-                    "model_name": args.model_name,
-                    "type": "FeatureDriftMetrics",
-                    "data": feature_metrics,
-                }
-            )
-        )
+        # compare target data with the reference data using the native engine
+        elif args.backend == "native":
+            with stage("load_data"):
+                target_df = load_dataset(args.target_data)
+                reference_df = load_dataset(args.reference_data)
+            with stage("calculate_drift"):
+                overall_metrics, feature_metrics = calculate_native_drift(
+                    reference_df,
+                    target_df,
+                    args.numeric_stattest,
+                    args.categorical_stattest,
+                    args.n_jobs,
+                )
+
+        # compare target data with the reference data using evidently
+        else:
+            with stage("load_data"):
+                target_df = load_dataset(args.target_data)
+                reference_df = load_dataset(args.reference_data)
+            with stage("calculate_drift"):
+                overall_metrics, feature_metrics = calculate_evidently_drift(
+                    reference_df, target_df
+                )
+
+        log_drift_metrics(log, args.model_name, overall_metrics, feature_metrics)
 
     except Exception as error:
         log.error(
@@ -93,6 +137,147 @@ def main(args: Namespace, log: logging.Logger) -> None:
         )
 
 
+def get_reference_profile(args: Namespace) -> DatasetProfile:
+    """Load the cached reference profile or summarize the reference data"""
+    if args.reference_profile_dir:
+        return load_reference_profile(
+            args.reference_data,
+            args.reference_profile_dir,
+            lambda: load_dataset(args.reference_data),
+        )
+
+    return DatasetProfile.from_reference(
+        load_dataset(args.reference_data), hash_files(args.reference_data)
+    )
+
+
+def log_drift_metrics(
+    log: logging.Logger,
+    model_name: str,
+    overall_metrics: Dict,
+    feature_metrics: List[Dict],
+    window: Optional[Dict] = None,
+) -> None:
+    """Print drift metrics and send to app insights"""
+    print("Overall data drift metrics:", overall_metrics)
+    print("Feature data drift metrics:", feature_metrics)
+
+    # Log overall drift metrics
+    log.info(
+        json.dumps(
+            {
+                "model_name": model_name,
+                "type": "OverallDriftMetrics",
+                "data": overall_metrics,
+                **(window or {}),
+            }
+        )
+    )
+
+    # Log feature drift metrics
+    log.info(
+        json.dumps(
+            {
+                "model_name": model_name,
+                "type": "FeatureDriftMetrics",
+                "data": feature_metrics,
+                **(window or {}),
+            }
+        )
+    )
+
+
+def load_dataset(path: str) -> pd.DataFrame:
+    """Load an mltable and change data types of features"""
+    df = mltable.load(path).to_pandas_dataframe()
+
+    return cast_features(df)
+
+
+def iter_dataset(path: str, chunk_size: int) -> Iterator[pd.DataFrame]:
+    """Read the delimited or parquet files of an mltable in chunks of rows"""
+    table = load_mltable_config(path)
+
+    # load the whole table when it is not a plain delimited or parquet file table
+    transformations = table.get("transformations") or [{}]
+    transformation = transformations[0]
+    if isinstance(transformation, str):
+        transformation = {transformation: {}}
+    if len(transformations) > 1 or not (
+        "read_delimited" in transformation or "read_parquet" in transformation
+    ):
+        yield load_dataset(path)
+        return
+
+    for file_path in list_files(path, table["paths"]):
+        for df in iter_file(
+            file_path,
+            FEATURES,
+            chunk_size,
+            transformation.get("read_delimited"),
+        ):
+            yield cast_features(df)
+
+
+def load_mltable_config(path: str) -> Dict:
+    """Read the MLTable file of an mltable folder"""
+    with open(os.path.join(path, "MLTable"), encoding="utf-8") as file:
+        return yaml.safe_load(file)
+
+
+def list_files(path: str, paths: List[Dict]) -> List[str]:
+    """List the local files matched by the paths of an mltable"""
+    files = []
+    for entry in paths:
+        if "file" in entry:
+            files.append(os.path.join(path, entry["file"]))
+        elif "folder" in entry:
+            files.extend(sorted(glob.glob(os.path.join(path, entry["folder"], "*"))))
+        else:
+            files.extend(
+                sorted(glob.glob(os.path.join(path, entry["pattern"]), recursive=True))
+            )
+
+    return files
+
+
+def cast_features(df: pd.DataFrame) -> pd.DataFrame:
+    """Change data types of features"""
+    df[CATEGORICAL_FEATURES] = df[CATEGORICAL_FEATURES].astype("str")
+    df[NUMERIC_FEATURES] = df[NUMERIC_FEATURES].astype("float")
+
+    return df
+
+
+def calculate_evidently_drift(
+    reference_df: pd.DataFrame, target_df: pd.DataFrame
+) -> Tuple[Dict, List[Dict]]:
+    """Calculate data drift metrics with an evidently profile"""
+    # define column mapping for evidently
+    column_mapping = ColumnMapping()
+    column_mapping.target = None
+    column_mapping.prediction = None
+    column_mapping.id = None
+    column_mapping.datetime = None
+    column_mapping.numerical_features = NUMERIC_FEATURES
+    column_mapping.categorical_features = CATEGORICAL_FEATURES
+
+    # generate data drift profile
+    data_drift_profile = Profile(
+        sections=[DataDriftProfileSection(), CatTargetDriftProfileSection()]
+    )
+    data_drift_profile.calculate(reference_df, target_df, column_mapping=column_mapping)
+
+    # convert drift  profile to json
+    data_drift_profile_json = json.loads(data_drift_profile.json())
+    print(data_drift_profile_json)
+
+    # process data drift output
+    return process_data_drift_output(
+        data_drift_profile_json["data_drift"]["data"]["metrics"]
+    )
+
+
 def process_data_drift_output(data_drift_metrics: Dict) -> Tuple[Dict, Dict]:
     """Preprocess data drift output from evidently"""
     # define overall data drift metrics table
@@ -130,10 +315,44 @@ def parse_args() -> Namespace:
     parser.add_argument("--model_name", type=str)
     parser.add_argument("--reference_data", type=str)
     parser.add_argument("--target_data", type=str)
+    parser.add_argument("--reference_profile_dir", type=str)
+    parser.add_argument(
+        "--backend", type=str, choices=["evidently", "native"], default="evidently"
+    )
+    parser.add_argument(
+        "--numeric_stattest", type=str, choices=["auto", *STATTESTS], default="auto"
+    )
+    parser.add_argument(
+        "--categorical_stattest",
+        type=str,
+        choices=["auto", *STATTESTS],
+        default="auto",
+    )
+    parser.add_argument("--n_jobs", type=int, default=-1)
+    parser.add_argument("--chunk_size", type=int, default=0)
+    parser.add_argument("--window_days", type=int, nargs="*", default=[])
+    parser.add_argument(
+        "--window_frequency", type=str, choices=list(FREQUENCIES), default="day"
+    )
+    parser.add_argument("--sketch_dir", type=str)
 
     # parse args
     args = parser.parse_args()
 
+    # profiles are compared with the histogram tests of the native backend
+    if args.chunk_size or args.reference_profile_dir or args.window_days:
+        if args.backend != "native":
+            parser.error(
+                "--chunk_size, --reference_profile_dir and --window_days compare "
+                "profiles and require --backend native"
+            )
+        for stattest in (args.numeric_stattest, args.categorical_stattest):
+            if stattest != "auto" and stattest not in HISTOGRAM_STATTESTS:
+                parser.error(
+                    f"{stattest} cannot be calculated from profiles, choose one of "
+                    f"{sorted(HISTOGRAM_STATTESTS)}"
+                )
+
     return args
 
 
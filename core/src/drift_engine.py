@@ -0,0 +1,82 @@
+"""Vectorized drift engine calculating statistical tests per feature in parallel"""
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+from constants import CATEGORICAL_FEATURES, FEATURES, NUMERIC_FEATURES
+from stattests import feature_drift, summarize_feature_metrics
+
+# define feature arrays shared with worker processes
+_ARRAYS: Dict[str, Tuple[np.ndarray, np.ndarray, str]] = {}
+
+
+def calculate_native_drift(
+    reference_df: pd.DataFrame,
+    target_df: pd.DataFrame,
+    numeric_stattest: str = "auto",
+    categorical_stattest: str = "auto",
+    n_jobs: int = -1,
+) -> Tuple[Dict, List[Dict]]:
+    """Calculate data drift metrics of every feature on numpy arrays"""
+    arrays = {}
+
+    # drop missing and infinite numeric values like evidently
+    for feature in NUMERIC_FEATURES:
+        reference = reference_df[feature].to_numpy(dtype=np.float64)
+        target = target_df[feature].to_numpy(dtype=np.float64)
+        arrays[feature] = (
+            reference[np.isfinite(reference)],
+            target[np.isfinite(target)],
+            "num",
+        )
+
+    # encode categories of both datasets with shared integer codes, missing
+    # values are coded as -1 and dropped
+    for feature in CATEGORICAL_FEATURES:
+        codes, _ = pd.factorize(
+            pd.concat([reference_df[feature], target_df[feature]], ignore_index=True)
+        )
+        reference, target = codes[: len(reference_df)], codes[len(reference_df) :]
+        arrays[feature] = (reference[reference >= 0], target[target >= 0], "cat")
+
+    stattests = [
+        numeric_stattest if feature in NUMERIC_FEATURES else categorical_stattest
+        for feature in FEATURES
+    ]
+
+    if n_jobs < 0:
+        n_jobs = os.cpu_count() or 1
+
+    # calculate features in parallel, forked workers share the arrays
+    if n_jobs == 1:
+        _set_arrays(arrays)
+        feature_metrics = list(map(_feature_drift, FEATURES, stattests))
+    else:
+        context = multiprocessing.get_context(
+            "fork" if "fork" in multiprocessing.get_all_start_methods() else None
+        )
+        with ProcessPoolExecutor(
+            max_workers=min(n_jobs, len(FEATURES)),
+            mp_context=context,
+            initializer=_set_arrays,
+            initargs=(arrays,),
+        ) as executor:
+            feature_metrics = list(executor.map(_feature_drift, FEATURES, stattests))
+
+    return summarize_feature_metrics(feature_metrics), feature_metrics
+
+
+def _set_arrays(arrays: Dict[str, Tuple[np.ndarray, np.ndarray, str]]) -> None:
+    """Make the feature arrays available to the current process"""
+    _ARRAYS.clear()
+    _ARRAYS.update(arrays)
+
+
+def _feature_drift(feature: str, stattest: str) -> Dict:
+    """Calculate the drift metrics of a feature from the shared arrays"""
+    reference, target, feature_type = _ARRAYS[feature]
+
+    return feature_drift(feature, reference, target, feature_type, stattest)
@@ -0,0 +1,160 @@
+"""Precompiled feature encoder used by the online scoring fast path"""
+import json
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+from sklearn.impute import SimpleImputer
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OneHotEncoder
+
+
+class FeatureEncoder:
+    """Encode payload rows into the matrix produced by a fitted preprocessor"""
+
+    def __init__(
+        self,
+        numeric_columns: List[Tuple[int, str, float]],
+        categorical_columns: List[Tuple[str, Dict[str, int], int]],
+        n_columns: int,
+    ) -> None:
+        # (output column, feature name, imputed value) for each numeric feature
+        self.numeric_columns = numeric_columns
+
+        # (feature name, category to output column, missing value column)
+        self.categorical_columns = categorical_columns
+
+        self.n_columns = n_columns
+
+        # define features every payload must hold, checked once per batch
+        self.features = frozenset(
+            [feature for _, feature, _ in numeric_columns]
+            + [feature for feature, _, _ in categorical_columns]
+        )
+
+    @classmethod
+    def from_pipeline(cls, pipeline: Pipeline) -> "FeatureEncoder":
+        """Compile an encoder from the preprocessor of a fitted model pipeline"""
+        numeric_columns = []
+        categorical_columns = []
+        offset = 0
+
+        # walk the fitted transformers in the order of the output matrix
+        for name, transformer, features in pipeline.named_steps[
+            "preprocessor"
+        ].transformers_:
+            if name == "remainder" and transformer == "drop":
+                continue
+
+            imputer, one_hot_encoder = _unpack_transformer(transformer)
+
+            # numeric features are imputed and passed through
+            if one_hot_encoder is None:
+                for feature, fill_value in zip(features, imputer.statistics_):
+                    numeric_columns.append((offset, feature, float(fill_value)))
+                    offset += 1
+                continue
+
+            # categorical features are imputed and one hot encoded
+            for feature, fill_value, categories in zip(
+                features, imputer.statistics_, one_hot_encoder.categories_
+            ):
+                offsets = {
+                    category: offset + index
+                    for index, category in enumerate(categories.tolist())
+                }
+                categorical_columns.append(
+                    (feature, offsets, offsets.get(fill_value, -1))
+                )
+                offset += len(categories)
+
+        return cls(numeric_columns, categorical_columns, offset)
+
+    def save(self, path: str) -> None:
+        """Write the encoder to a json file"""
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(
+                {
+                    "numeric_columns": self.numeric_columns,
+                    "categorical_columns": self.categorical_columns,
+                    "n_columns": self.n_columns,
+                },
+                file,
+            )
+
+    @classmethod
+    def load(cls, path: str) -> "FeatureEncoder":
+        """Read an encoder written by save"""
+        with open(path, encoding="utf-8") as file:
+            config = json.load(file)
+
+        return cls(
+            [tuple(column) for column in config["numeric_columns"]],
+            [tuple(column) for column in config["categorical_columns"]],
+            config["n_columns"],
+        )
+
+    def transform(self, data: List[Dict]) -> np.ndarray:
+        """Write payload rows into a preallocated feature matrix"""
+        # reject rows without a feature, merged requests are checked row by row
+        for row in data:
+            if not self.features <= row.keys():
+                missing = self.features.difference(row)
+                raise ValueError(f"Payload is missing features: {sorted(missing)}")
+
+        columns = {feature: [row[feature] for row in data] for feature in self.features}
+
+        return self.transform_columns(columns, len(data))
+
+    def transform_columns(
+        self, columns: Dict[str, Sequence], n_rows: int
+    ) -> np.ndarray:
+        """Write payload columns into a preallocated feature matrix"""
+        matrix = np.zeros((n_rows, self.n_columns), dtype=np.float32)
+
+        # impute missing numeric values with the fitted statistics
+        for column, feature, fill_value in self.numeric_columns:
+            values = np.array(columns[feature], dtype=np.float64)
+            values[np.isnan(values)] = fill_value
+            matrix[:, column] = values
+
+        # set the one hot column for each known category, unknowns are ignored
+        rows = np.arange(n_rows)
+        for feature, offsets, missing_column in self.categorical_columns:
+            indices = np.fromiter(
+                (
+                    (
+                        offsets.get(value, -1)
+                        if value is not None and value == value
+                        else missing_column
+                    )
+                    for value in columns[feature]
+                ),
+                dtype=np.intp,
+                count=n_rows,
+            )
+            known = indices >= 0
+            matrix[rows[known], indices[known]] = 1.0
+
+        return matrix
+
+
+def _unpack_transformer(transformer: Pipeline) -> Tuple[SimpleImputer, OneHotEncoder]:
+    """Extract the imputer and optional one hot encoder of a column transformer"""
+    steps = dict(transformer.steps) if isinstance(transformer, Pipeline) else {}
+    imputer = steps.get("imputer")
+    one_hot_encoder = steps.get("ohe")
+
+    # only the transformations created by make_classifer_pipeline are supported
+    if not isinstance(imputer, SimpleImputer) or set(steps) - {"imputer", "ohe"}:
+        raise ValueError(f"Unsupported column transformer: {transformer}")
+    if imputer.add_indicator or np.any(
+        [value != value for value in imputer.statistics_]
+    ):
+        raise ValueError("Unsupported imputer configuration")
+    if one_hot_encoder is not None and (
+        one_hot_encoder.drop_idx_ is not None
+        or getattr(one_hot_encoder, "_infrequent_enabled", False)
+    ):
+        raise ValueError("Unsupported one hot encoder configuration")
+
+    return imputer, one_hot_encoder
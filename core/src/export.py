@@ -1,55 +1,396 @@
 """Script to query log analytics for data drift metrics"""
+import json
 import os
+import random
+import time
 from argparse import ArgumentParser, Namespace
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterator, List, Optional, Tuple
 
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from azure.core.exceptions import HttpResponseError
 from azure.identity import DefaultAzureCredential
 from azure.monitor.query import LogsQueryClient, LogsQueryStatus
+from constants import CATEGORICAL_FEATURES, FEATURES
+from instrumentation import stage
 
+# define smallest sub-window that is split further when results are partial
+MIN_SUB_WINDOW = timedelta(minutes=1)
 
-def main(args: Namespace) -> None:
+# define initial and maximum delay between retries of a failed query
+BACKOFF_SECONDS = 1.0
+MAX_BACKOFF_SECONDS = 60.0
+
+# define schema of exported inference data
+SCHEMA = pa.schema(
+    [("TimeGenerated", pa.timestamp("us"))]
+    + [
+        (feature, pa.string() if feature in CATEGORICAL_FEATURES else pa.float64())
+        for feature in FEATURES
+    ]
+)
+
+# define number of rows per parquet row group
+ROW_GROUP_SIZE = 65536
+
+
+def main(args: Namespace, client: Optional[LogsQueryClient] = None) -> None:
     """Query log analytics workspace and write inference data to a datastore"""
     # setup log analytics client
-    credential = DefaultAzureCredential()
-    client = LogsQueryClient(credential)
+    if client is None:
+        credential = DefaultAzureCredential()
+        client = LogsQueryClient(credential)
+
+    # define data and watermark paths
+    data_path = f"{args.prepared_data_dir}/uci-credit-card-default/inference/online"
+    watermark_path = (
+        f"{args.prepared_data_dir}/uci-credit-card-default/inference/online-watermarks"
+        f"/{args.model_name}/{args.model_version}.json"
+    )
+
+    # start from the watermark of the model version or the previous days
+    watermark = load_watermark(watermark_path)
+    if watermark is None:
+        watermark = {
+            "time": pd.Timestamp.now(timezone.utc)
+            - pd.Timedelta(days=args.number_of_previous_days),
+            "boundary_rows": [],
+        }
+        save_watermark(watermark_path, watermark)
+
+    # specify query window, leaving time for logs to be ingested
+    start_time = watermark["time"]
+    end_time = datetime.now(timezone.utc) - timedelta(
+        minutes=args.ingestion_delay_minutes
+    )
+    if end_time <= start_time:
+        print("No new inference data to export")
+        return
+
+    # stream sub-windows in time order into date partitions
+    writer = PartitionWriter(
+        data_path,
+        f"{args.model_name}_{args.model_version}_{start_time:%Y%m%dT%H%M%S%f}",
+    )
+    boundary = BoundaryTracker(watermark)
+    with stage("query_and_write"):
+        for batch in query_window(
+            client,
+            args.log_analytics_workspace_id,
+            args.model_name,
+            args.model_version,
+            start_time,
+            end_time,
+            timedelta(hours=args.sub_window_hours),
+            args.max_concurrency,
+            args.max_retries,
+            args.batch_size,
+        ):
+            # drop rows up to the watermark that the previous run already wrote
+            batch = boundary.filter(batch)
+            if batch.num_rows:
+                writer.write(batch)
+                boundary.update(batch)
+
+    # advance the watermark over a window without new rows so that it is not
+    # queried again, partial sub-windows fail the run before this point
+    if writer.n_rows == 0:
+        print("No new inference data to export")
+        save_watermark(
+            watermark_path, {"time": pd.Timestamp(end_time), "boundary_rows": []}
+        )
+        return
+
+    # write partitions before advancing the watermark
+    with stage("close_writer"):
+        writer.close()
+    save_watermark(watermark_path, boundary.next_watermark())
+
+
+def to_record_batches(
+    rows: List, columns: List[str], batch_size: int
+) -> List[pa.RecordBatch]:
+    """Convert rows of a response table to typed record batches of features"""
+    batches = []
+    positions = [
+        columns.index(name) if name in columns else None for name in SCHEMA.names
+    ]
+    for start in range(0, len(rows), batch_size):
+        values = np.array(rows[start : start + batch_size], dtype=object)
+        values = values.reshape(len(values), len(columns))
+
+        # convert each column to an array, casting values to the feature type
+        arrays = []
+        for position, field in zip(positions, SCHEMA):
+            if position is None:
+                arrays.append(pa.nulls(len(values), field.type))
+            else:
+                arrays.append(
+                    pa.array(values[:, position], from_pandas=True).cast(field.type)
+                )
+        batches.append(pa.RecordBatch.from_arrays(arrays, schema=SCHEMA))
+
+    return batches
+
+
+def hash_rows(table: pa.Table) -> pd.Series:
+    """Hash the values of every exported row"""
+    return pd.util.hash_pandas_object(
+        table.to_pandas().astype("str"), index=False
+    ).astype("str")
+
+
+class PartitionWriter:
+    """Append record batches to one parquet file per date partition"""
+
+    def __init__(self, data_path: str, file_name: str) -> None:
+        self.data_path = data_path
+        self.file_name = file_name
+        self.n_rows = 0
+        self._writers: Dict[str, pq.ParquetWriter] = {}
+
+    def write(self, batch: pa.RecordBatch) -> None:
+        """Append the rows of a batch to the partitions of their dates"""
+        dates = batch.column(0).cast(pa.date32())
+        for date in pc.unique(dates):
+            partition = f"date={date.as_py():%Y-%m-%d}"
+            if partition not in self._writers:
+                os.makedirs(f"{self.data_path}/{partition}", exist_ok=True)
+                self._writers[partition] = pq.ParquetWriter(
+                    f"{self.data_path}/{partition}/.{self.file_name}.tmp", SCHEMA
+                )
+            self._writers[partition].write_batch(
+                batch.filter(pc.equal(dates, date)), row_group_size=ROW_GROUP_SIZE
+            )
+
+        self.n_rows += batch.num_rows
+
+    def close(self) -> None:
+        """Close every partition file and move it into place"""
+        for partition, writer in self._writers.items():
+            writer.close()
+
+            # a rerun from the same watermark replaces the files of the failed run
+            os.replace(
+                f"{self.data_path}/{partition}/.{self.file_name}.tmp",
+                f"{self.data_path}/{partition}/{self.file_name}.parquet",
+            )
+
+
+class BoundaryTracker:
+    """Track the latest exported rows to drop them from the next export"""
+
+    def __init__(self, watermark: Dict) -> None:
+        self.watermark = watermark
+        self.watermark_time = pa.scalar(
+            watermark_timestamp(watermark).to_pydatetime(), SCHEMA.field(0).type
+        )
+        self.latest_time = self.watermark_time
+        self.latest_rows: List[pa.RecordBatch] = []
+
+    def filter(self, batch: pa.RecordBatch) -> pa.RecordBatch:
+        """Drop rows before the watermark and rows exported at the watermark"""
+        times = batch.column(0)
+        keep = pc.greater(times, self.watermark_time)
+
+        at_watermark = pc.equal(times, self.watermark_time)
+        if pc.any(at_watermark).as_py():
+            hashes = hash_rows(pa.Table.from_batches([batch]))
+            keep = pc.or_(
+                keep,
+                pc.and_(
+                    at_watermark,
+                    pa.array(~hashes.isin(self.watermark["boundary_rows"]).to_numpy()),
+                ),
+            )
+
+        return batch.filter(keep)
+
+    def update(self, batch: pa.RecordBatch) -> None:
+        """Keep the rows at the latest time of the exported batches"""
+        batch_time = pc.max(batch.column(0))
+        if pc.greater(batch_time, self.latest_time).as_py():
+            self.latest_time = batch_time
+            self.latest_rows = []
+        self.latest_rows.append(
+            batch.filter(pc.equal(batch.column(0), self.latest_time))
+        )
 
-    # specify query window
-    end_time = datetime.now(timezone.utc)
-    start_time = end_time - timedelta(days=args.number_of_previous_days)
+    def next_watermark(self) -> Dict:
+        """Advance the watermark to the latest exported row"""
+        boundary_rows = set(hash_rows(pa.Table.from_batches(self.latest_rows, SCHEMA)))
 
-    # create query
-    log_analytics_query = f"""
+        # keep boundary rows of the previous run when the watermark did not move
+        if self.latest_time == self.watermark_time:
+            boundary_rows |= set(self.watermark["boundary_rows"])
+
+        return {
+            "time": pd.Timestamp(self.latest_time.as_py()).tz_localize(timezone.utc),
+            "boundary_rows": sorted(boundary_rows),
+        }
+
+
+def watermark_timestamp(watermark: Dict) -> pd.Timestamp:
+    """Return the watermark as a timestamp comparable with exported rows"""
+    return pd.Timestamp(watermark["time"]).tz_convert(None)
+
+
+def load_watermark(path: str) -> Optional[Dict]:
+    """Load the watermark of a model version if it exists"""
+    if not os.path.exists(path):
+        return None
+
+    with open(path, encoding="utf-8") as file:
+        watermark = json.load(file)
+
+    return {
+        "time": pd.Timestamp(watermark["time"]),
+        "boundary_rows": watermark["boundary_rows"],
+    }
+
+
+def save_watermark(path: str, watermark: Dict) -> None:
+    """Write the watermark of a model version atomically"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(f"{path}.tmp", "w", encoding="utf-8") as file:
+        json.dump(
+            {
+                "time": watermark["time"].isoformat(),
+                "boundary_rows": watermark["boundary_rows"],
+            },
+            file,
+        )
+    os.replace(f"{path}.tmp", path)
+
+
+def make_query(
+    model_name: str, model_version: str, start_time: datetime, end_time: datetime
+) -> str:
+    """Create the query of inference data logged within a time window"""
+    return f"""
         AmlOnlineEndpointConsoleLog
-        | where Message has 'online/{args.model_name}/{args.model_version}'and Message has 'InputData'
+        | where TimeGenerated >= datetime({format_time(start_time)}) and TimeGenerated < datetime({format_time(end_time)})
+        | where Message has 'online/{model_name}/{model_version}'and Message has 'InputData'
         | project TimeGenerated, ResponsePayload=split(Message, '|')
         | project TimeGenerated, InputData=parse_json(tostring(ResponsePayload[-1])).data
         | project TimeGenerated, InputData=parse_json(tostring(InputData))
         | mv-expand InputData
         | evaluate bag_unpack(InputData)
+        | sort by TimeGenerated asc
     """
 
-    # query log analytics workspace
-    df_export = query_workspace(
-        client,
-        args.log_analytics_workspace_id,
-        log_analytics_query,
-        start_time,
-        end_time,
-    )
-    df_export["TimeGenerated"] = df_export["TimeGenerated"].dt.strftime(
-        "%Y-%m-%d %H:%M:%S"
-    )
 
-    # define file name and path
-    file_name = datetime.now().strftime("%Y_%m_%d_%H_%M_%S")
-    file_path = f"{args.prepared_data_dir}/uci-credit-card-default/inference/online/"
+def format_time(value: datetime) -> str:
+    """Format a time as a utc datetime literal of the query language"""
+    return value.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
 
-    # create directories if they do not exist
-    os.makedirs(file_path, exist_ok=True)
+def query_window(
+    client: LogsQueryClient,
+    log_analytics_workspace_id: str,
+    model_name: str,
+    model_version: str,
+    start_time: datetime,
+    end_time: datetime,
+    sub_window: timedelta = timedelta(days=1),
+    max_concurrency: int = 4,
+    max_retries: int = 5,
+    batch_size: int = 65536,
+) -> Iterator[pa.RecordBatch]:
+    """Query sub-windows concurrently and yield their record batches in time order"""
+    # split the query window into sub-windows
+    windows = deque()
+    window_start = start_time
+    while window_start < end_time:
+        windows.append((window_start, min(window_start + sub_window, end_time)))
+        window_start += sub_window
+
+    # keep completed sub-windows until the sub-windows before them complete
+    results: Dict[datetime, Tuple[datetime, List[pa.RecordBatch]]] = {}
+    next_start = start_time
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+
+        def submit(window: Tuple[datetime, datetime]) -> Future:
+            return executor.submit(
+                query_sub_window,
+                client,
+                log_analytics_workspace_id,
+                make_query(model_name, model_version, *window),
+                *window,
+                max_retries,
+                batch_size,
+            )
+
+        pending: Dict[Future, Tuple[datetime, datetime]] = {}
+        while windows or pending:
+            # bound the number of sub-windows held in memory
+            while windows and (
+                not pending or len(pending) + len(results) < 2 * max_concurrency
+            ):
+                window = windows.popleft()
+                pending[submit(window)] = window
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                window_start, window_end = pending.pop(future)
+                batches, is_partial = future.result()
+
+                # split partial sub-windows in half and query both halves first
+                if is_partial and window_end - window_start > MIN_SUB_WINDOW:
+                    middle = window_start + (window_end - window_start) / 2
+                    print(f"Splitting sub-window {window_start} - {window_end}")
+                    windows.extendleft([(middle, window_end), (window_start, middle)])
+
+                # fail the run so that the watermark stays before the missing rows
+                elif is_partial:
+                    raise RuntimeError(
+                        f"Sub-window {window_start} - {window_end} is still partial "
+                        "at the smallest sub-window, its missing rows would be lost"
+                    )
+                else:
+                    results[window_start] = (window_end, batches)
+
+            # stitch completed sub-windows together in time order
+            while next_start in results:
+                next_start, batches = results.pop(next_start)
+                yield from batches
+
+
+def query_sub_window(
+    client: LogsQueryClient,
+    log_analytics_workspace_id: str,
+    log_analytics_query: str,
+    start_time: datetime,
+    end_time: datetime,
+    max_retries: int = 5,
+    batch_size: int = 65536,
+) -> Tuple[List[pa.RecordBatch], bool]:
+    """Query a sub-window with retries and report whether the result is partial"""
+    for attempt in range(max_retries + 1):
+        try:
+            return query_workspace(
+                client,
+                log_analytics_workspace_id,
+                log_analytics_query,
+                start_time,
+                end_time,
+                batch_size,
+            )
+        except HttpResponseError as error:
+            if attempt == max_retries:
+                raise
 
-    # write data to datastore
-    df_export.to_csv(f"{file_path}/{file_name}.csv", index=False)
+            # back off exponentially with jitter before retrying
+            delay = min(BACKOFF_SECONDS * 2**attempt, MAX_BACKOFF_SECONDS)
+            delay *= random.uniform(0.5, 1.5)
+            print(f"Retrying sub-window {start_time} in {delay:.1f} s: {error.message}")
+            time.sleep(delay)
 
 
 def query_workspace(
@@ -58,7 +399,8 @@ def query_workspace(
     log_analytics_query: str,
     start_time: datetime,
     end_time: datetime,
-) -> pd.DataFrame:
+    batch_size: int = 65536,
+) -> Tuple[List[pa.RecordBatch], bool]:
     """Query log analytics workspace and return data"""
     # query log analytics workspace
     response = client.query_workspace(
@@ -76,11 +418,14 @@ def query_workspace(
     else:
         data = response.tables
 
-    # convert data to pandas dataframe
-    for table in data:
-        df_export = pd.DataFrame(data=table.rows, columns=table.columns)
+    # convert data of every table to record batches
+    batches = [
+        batch
+        for table in data
+        for batch in to_record_batches(table.rows, table.columns, batch_size)
+    ]
 
-    return df_export
+    return batches, response.status == LogsQueryStatus.PARTIAL
 
 
 def parse_args() -> Namespace:
@@ -94,6 +439,11 @@ def parse_args() -> Namespace:
     parser.add_argument("--prepared_data_dir", type=str)
     parser.add_argument("--log_analytics_workspace_id", type=str)
     parser.add_argument("--number_of_previous_days", type=int)
+    parser.add_argument("--sub_window_hours", type=float, default=24)
+    parser.add_argument("--max_concurrency", type=int, default=4)
+    parser.add_argument("--max_retries", type=int, default=5)
+    parser.add_argument("--ingestion_delay_minutes", type=float, default=10)
+    parser.add_argument("--batch_size", type=int, default=65536)
 
     # parse args
     args = parser.parse_args()
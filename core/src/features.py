@@ -0,0 +1,118 @@
+"""Precomputed feature matrices shared by the model training trials"""
+import json
+import os
+from typing import Dict, List, Optional, Tuple, Union
+
+import joblib
+import numpy as np
+import pandas as pd
+from constants import FEATURES, TARGET
+from scipy import sparse
+from sklearn.compose import ColumnTransformer
+
+# define type of a dense or sparse feature matrix
+Matrix = Union[np.ndarray, sparse.spmatrix]
+
+# define names of the files written for the preprocessor and matrices
+PREPROCESSOR = "preprocessor.joblib"
+FEATURES_CONFIG = "features.json"
+
+# define arrays holding each sparse matrix format
+SPARSE_ARRAYS = ["data", "indices", "indptr"]
+
+
+def transform_features(
+    preprocessor: ColumnTransformer, df: pd.DataFrame, sparse_format: str = "csr"
+) -> Matrix:
+    """Transform features to the float32 layout trees convert inputs to"""
+    matrix = preprocessor.transform(df)
+    if sparse.issparse(matrix):
+        return matrix.asformat(sparse_format).astype(np.float32)
+
+    return np.ascontiguousarray(matrix, dtype=np.float32)
+
+
+def compute_features(
+    preprocessor: ColumnTransformer, df_train: pd.DataFrame, df_test: pd.DataFrame
+) -> Dict[str, Matrix]:
+    """Transform train and test data with a preprocessor fitted on train data"""
+    # store train features column-major as trees are fitted on csc matrices
+    return {
+        "x_train": transform_features(preprocessor, df_train[FEATURES], "csc"),
+        "y_train": df_train[TARGET].to_numpy(np.int64).ravel(),
+        "x_test": transform_features(preprocessor, df_test[FEATURES], "csr"),
+        "y_test": df_test[TARGET].to_numpy(np.int64).ravel(),
+    }
+
+
+def write_features(
+    prepared_data_dir: str,
+    preprocessor: ColumnTransformer,
+    matrices: Dict[str, Matrix],
+) -> List[str]:
+    """Write a fitted preprocessor and memory-mappable matrices, return file names"""
+    files = [PREPROCESSOR, FEATURES_CONFIG]
+    joblib.dump(preprocessor, os.path.join(prepared_data_dir, PREPROCESSOR))
+
+    config = {}
+    for name, matrix in matrices.items():
+        # store sparse matrices as their component arrays
+        if sparse.issparse(matrix):
+            config[name] = {"format": matrix.format, "shape": list(matrix.shape)}
+            matrix.sort_indices()
+            arrays = {
+                f"{name}.{array}.npy": getattr(matrix, array) for array in SPARSE_ARRAYS
+            }
+        else:
+            config[name] = {"format": "dense"}
+            arrays = {f"{name}.npy": np.ascontiguousarray(matrix)}
+
+        for file_name, array in arrays.items():
+            np.save(os.path.join(prepared_data_dir, file_name), array)
+            files.append(file_name)
+
+    with open(
+        os.path.join(prepared_data_dir, FEATURES_CONFIG), "w", encoding="utf-8"
+    ) as file:
+        json.dump(config, file)
+
+    return files
+
+
+def read_features(
+    prepared_data_dir: str,
+) -> Optional[Tuple[ColumnTransformer, Dict[str, Matrix]]]:
+    """Load the fitted preprocessor and memory-map the matrices if they exist"""
+    path = os.path.join(prepared_data_dir, FEATURES_CONFIG)
+    if not os.path.exists(path):
+        return None
+
+    with open(path, encoding="utf-8") as file:
+        config = json.load(file)
+
+    matrices: Dict[str, Matrix] = {}
+    for name, matrix_config in config.items():
+        if matrix_config["format"] == "dense":
+            matrices[name] = np.load(
+                os.path.join(prepared_data_dir, f"{name}.npy"), mmap_mode="r"
+            )
+        else:
+            arrays = [
+                np.load(
+                    os.path.join(prepared_data_dir, f"{name}.{array}.npy"),
+                    mmap_mode="r",
+                )
+                for array in SPARSE_ARRAYS
+            ]
+            matrix_class = (
+                sparse.csc_matrix
+                if matrix_config["format"] == "csc"
+                else sparse.csr_matrix
+            )
+            matrices[name] = matrix_class(
+                tuple(arrays), shape=tuple(matrix_config["shape"]), copy=False
+            )
+
+    preprocessor = joblib.load(os.path.join(prepared_data_dir, PREPROCESSOR))
+
+    return preprocessor, matrices
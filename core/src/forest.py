@@ -0,0 +1,186 @@
+"""Array-backed inference engine for fitted random forest classifiers"""
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+
+# define node arrays written to compiled forest artifacts
+ARRAYS = ["feature", "threshold", "children", "value", "roots"]
+
+
+class CompiledForest:
+    """Evaluate every tree of a forest with vectorized traversal of flat node arrays"""
+
+    def __init__(
+        self,
+        feature: np.ndarray,
+        threshold: np.ndarray,
+        children: np.ndarray,
+        value: np.ndarray,
+        roots: np.ndarray,
+        max_depth: int,
+    ) -> None:
+        # split feature and threshold of every node of every tree
+        self.feature = feature
+        self.threshold = threshold
+
+        # left and right child of every node interleaved, leaves point to themselves
+        self.children = children
+
+        # class probabilities of every node
+        self.value = value
+
+        # index of the root node of each tree
+        self.roots = roots
+        self.max_depth = max_depth
+
+    @classmethod
+    def from_estimator(cls, estimator: RandomForestClassifier) -> "CompiledForest":
+        """Flatten the fitted trees of a forest into contiguous node arrays"""
+        if not isinstance(estimator, RandomForestClassifier):
+            raise ValueError(f"Unsupported estimator: {estimator}")
+        if estimator.n_outputs_ != 1:
+            raise ValueError("Only single output forests are supported")
+
+        features, thresholds, children, values, roots = [], [], [], [], []
+        offset = 0
+
+        for tree in (tree.tree_ for tree in estimator.estimators_):
+            index = np.arange(tree.node_count) + offset
+            is_leaf = tree.children_left == -1
+
+            # leaves loop back to themselves so traversal needs no branching
+            features.append(np.where(is_leaf, 0, tree.feature))
+            thresholds.append(np.where(is_leaf, 0.0, tree.threshold))
+            children.append(
+                np.stack(
+                    [
+                        np.where(is_leaf, index, tree.children_left + offset),
+                        np.where(is_leaf, index, tree.children_right + offset),
+                    ],
+                    axis=1,
+                )
+            )
+
+            # normalize node values to class probabilities like predict_proba
+            value = tree.value[:, 0, :].astype(np.float64)
+            normalizer = value.sum(axis=1, keepdims=True)
+            normalizer[normalizer == 0.0] = 1.0
+            values.append(value / normalizer)
+
+            roots.append(offset)
+            offset += tree.node_count
+
+        return cls(
+            feature=np.concatenate(features).astype(np.intp),
+            threshold=np.concatenate(thresholds).astype(np.float64),
+            children=np.concatenate(children).astype(np.intp).ravel(),
+            value=np.concatenate(values),
+            roots=np.array(roots, dtype=np.intp),
+            max_depth=max(tree.tree_.max_depth for tree in estimator.estimators_),
+        )
+
+    def quantize(self) -> "CompiledForest":
+        """Return a copy with float32 thresholds, float16 values and int32 indices"""
+        # round thresholds down so that float32 features split exactly as before
+        threshold = self.threshold.astype(np.float32)
+        rounded_up = threshold > self.threshold
+        threshold[rounded_up] = np.nextafter(threshold[rounded_up], np.float32(-np.inf))
+
+        return CompiledForest(
+            feature=self.feature.astype(np.int32),
+            threshold=threshold,
+            children=self.children.astype(np.int32),
+            value=self.value.astype(np.float16),
+            roots=self.roots.astype(np.int32),
+            max_depth=self.max_depth,
+        )
+
+    def save(self, path: str) -> None:
+        """Write the node arrays to a directory of memory-mappable npy files"""
+        os.makedirs(path, exist_ok=True)
+        for name in ARRAYS:
+            np.save(os.path.join(path, f"{name}.npy"), getattr(self, name))
+
+        with open(os.path.join(path, "forest.json"), "w", encoding="utf-8") as file:
+            json.dump({"max_depth": self.max_depth}, file)
+
+    @classmethod
+    def load(cls, path: str, mmap_mode: Optional[str] = "r") -> "CompiledForest":
+        """Read a forest written by save, memory mapping the node arrays"""
+        with open(os.path.join(path, "forest.json"), encoding="utf-8") as file:
+            config = json.load(file)
+
+        arrays = {
+            name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode)
+            for name in ARRAYS
+        }
+
+        return cls(**arrays, max_depth=config["max_depth"])
+
+    @property
+    def n_trees(self) -> int:
+        """Number of trees in the forest"""
+        return len(self.roots)
+
+    def predict_proba(
+        self, features: np.ndarray, n_jobs: Optional[int] = 1, chunk_size: int = 1024
+    ) -> np.ndarray:
+        """Average the class probabilities of all trees for a batch of rows"""
+        # compare features in float32 like the sklearn tree implementation
+        features = np.asarray(features, dtype=np.float32)
+
+        if n_jobs is None or n_jobs < 0:
+            n_jobs = os.cpu_count() or 1
+
+        # split large batches into chunks to bound the traversal state
+        chunks = [
+            features[start : start + chunk_size]
+            for start in range(0, len(features), chunk_size)
+        ]
+        if n_jobs == 1 or len(chunks) == 1:
+            results = [self._predict_chunk(chunk) for chunk in chunks]
+        else:
+            with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+                results = list(executor.map(self._predict_chunk, chunks))
+
+        if not results:
+            return np.empty((0, self.value.shape[1]))
+
+        return np.concatenate(results)
+
+    def _predict_chunk(self, features: np.ndarray) -> np.ndarray:
+        """Traverse every tree for every row of a chunk"""
+        n_rows, n_features = features.shape
+        values = features.ravel()
+
+        # flat node index and row offset of every (row, tree) pair
+        nodes = np.tile(self.roots, n_rows)
+        offsets = np.repeat(np.arange(n_rows, dtype=np.intp) * n_features, self.n_trees)
+
+        # move the pairs that have not reached a leaf one level down at a time
+        active = np.arange(nodes.size)
+        current = nodes
+        for _ in range(self.max_depth):
+            feature_values = values.take(offsets + self.feature.take(current))
+            go_right = feature_values > self.threshold.take(current)
+            current = self.children.take(2 * current + go_right)
+            nodes[active] = current
+
+            # drop pairs that reached a leaf from the next iteration
+            is_branch = self.children.take(2 * current) != current
+            if not is_branch.all():
+                active, current = active[is_branch], current[is_branch]
+                offsets = offsets[is_branch]
+                if not active.size:
+                    break
+
+        return (
+            self.value.take(nodes, axis=0)
+            .reshape(n_rows, self.n_trees, -1)
+            .sum(axis=1, dtype=np.float64)
+            / self.n_trees
+        )
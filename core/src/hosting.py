@@ -0,0 +1,225 @@
+"""Registered model versions hosted together by the online scoring service"""
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import mlflow
+import numpy as np
+import pandas as pd
+from encoder import FeatureEncoder
+from forest import CompiledForest
+from instrumentation import Recorder, timed
+from payloads import Columns
+
+# define folder and config file of a bundle of registered model versions
+BUNDLE_FOLDER = "versions"
+BUNDLE_CONFIG = "bundle.json"
+
+
+class HostedModel:
+    """Compiled forest or model pipeline of a registered model version"""
+
+    def __init__(self, version: str, model_dir: str, compiled_max_rows: int = 500):
+        self.version = version
+        self.compiled_max_rows = compiled_max_rows
+
+        # load memory-mapped compiled model written at registration if available
+        compiled_dir = model_dir + "/compiled"
+        if os.path.isdir(compiled_dir):
+            self.model = None
+            self.encoder = FeatureEncoder.load(compiled_dir + "/encoder.json")
+            self.forest = CompiledForest.load(compiled_dir + "/forest")
+            self.size_mb = directory_size_mb(compiled_dir)
+
+        # load mlflow model and compile it, fall back to the pipeline if unsupported
+        else:
+            self.model = mlflow.sklearn.load_model(model_dir)
+            try:
+                self.encoder = FeatureEncoder.from_pipeline(self.model)
+                self.forest = CompiledForest.from_estimator(
+                    self.model.named_steps["classifier"]
+                )
+            except (AttributeError, KeyError, ValueError):
+                self.encoder, self.forest = None, None
+            self.size_mb = directory_size_mb(model_dir)
+
+    def predict(self, data: List[Dict]) -> List[float]:
+        """Return the probability of the positive class for each payload row"""
+        if self.encoder is None:
+            return self.predict_frame(pd.DataFrame(data))
+
+        return self.predict_features(self.encoder.transform(data))
+
+    def predict_columns(self, columns: Columns, n_rows: int) -> List[float]:
+        """Return the probability of the positive class for payload columns"""
+        if self.encoder is None:
+            return self.predict_frame(pd.DataFrame(columns))
+
+        return self.predict_features(self.encoder.transform_columns(columns, n_rows))
+
+    def predict_frame(self, df: pd.DataFrame) -> List[float]:
+        """Return the probability of the positive class with the model pipeline"""
+        return self.model.predict_proba(df)[:, 1].tolist()
+
+    def predict_features(self, features: np.ndarray) -> List[float]:
+        """Return the probability of the positive class for each encoded row"""
+        # evaluate the compiled forest for small batches and sklearn for large ones
+        if self.model is None or len(features) <= self.compiled_max_rows:
+            return self.forest.predict_proba(features)[:, 1].tolist()
+
+        classifier = self.model.named_steps["classifier"]
+        return classifier.predict_proba(features)[:, 1].tolist()
+
+
+class ModelStore:
+    """Load model versions on first use and evict the least recently used"""
+
+    def __init__(
+        self,
+        versions_dir: str,
+        default_version: str,
+        service_name: str,
+        logger: logging.Logger,
+        size_budget_mb: float = 2048,
+        compiled_max_rows: int = 500,
+        record_stage: Optional[Recorder] = None,
+    ) -> None:
+        self.versions_dir = versions_dir
+        self.default_version = default_version
+        self.service_name = service_name
+        self.logger = logger
+        self.size_budget_mb = size_budget_mb
+        self.compiled_max_rows = compiled_max_rows
+
+        # list the versions holding a model, requests name one of them
+        self.versions = frozenset(
+            name
+            for name in os.listdir(versions_dir)
+            if os.path.isdir(os.path.join(versions_dir, name, "model"))
+        )
+        if default_version not in self.versions:
+            raise ValueError(f"Model version not found: {default_version}")
+
+        # time loads of new versions with the given recorder
+        if record_stage is not None:
+            self.load = timed("load_model", record_stage)(self.load)
+
+        # map loaded versions to models in least recently used order
+        self._models: "OrderedDict[str, HostedModel]" = OrderedDict()
+        self._loading: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+        # define counters used to size the budget
+        self.loads = 0
+        self.evictions = 0
+
+    def get(self, version: Optional[str] = None) -> HostedModel:
+        """Return a model version, loading it on first use"""
+        version = version or self.default_version
+
+        with self._lock:
+            model = self._models.get(version)
+            if model is not None:
+                self._models.move_to_end(version)
+                return model
+            if version not in self.versions:
+                raise ValueError(f"Model version not found: {version}")
+            loading = self._loading.setdefault(version, threading.Lock())
+
+        # load each version once while requests for loaded versions go on
+        with loading:
+            with self._lock:
+                model = self._models.get(version)
+            if model is None:
+                model = self.load(version)
+
+        return model
+
+    def load(self, version: str) -> HostedModel:
+        """Load a model version and evict others beyond the size budget"""
+        model = HostedModel(
+            version,
+            os.path.join(self.versions_dir, version, "model"),
+            self.compiled_max_rows,
+        )
+
+        with self._lock:
+            self._models[version] = model
+            self.loads += 1
+            evicted = self._evict()
+
+        self.log_event("LoadModel", version, model.size_mb)
+        for evicted_model in evicted:
+            self.log_event("EvictModel", evicted_model.version, evicted_model.size_mb)
+
+        return model
+
+    def _evict(self) -> List[HostedModel]:
+        """Evict least recently used versions, keeping the default and newest"""
+        evicted = []
+        for version in list(self._models)[:-1]:
+            if self.loaded_size_mb() <= self.size_budget_mb:
+                break
+            if version != self.default_version:
+                evicted.append(self._models.pop(version))
+                self.evictions += 1
+
+        return evicted
+
+    def loaded_size_mb(self) -> float:
+        """Return the artifact size of the loaded versions, not their resident memory"""
+        return sum(model.size_mb for model in self._models.values())
+
+    def stats(self) -> Dict:
+        """Return the loaded versions and counters"""
+        with self._lock:
+            return {
+                "loaded_versions": list(self._models),
+                "loaded_size_mb": self.loaded_size_mb(),
+                "size_budget_mb": self.size_budget_mb,
+                "loads": self.loads,
+                "evictions": self.evictions,
+            }
+
+    def log_event(self, event_type: str, version: str, size_mb: float) -> None:
+        """Log the load or eviction of a model version with the store stats"""
+        self.logger.info(
+            json.dumps(
+                {
+                    "service_name": self.service_name,
+                    "type": event_type,
+                    "model_version": version,
+                    "size_mb": size_mb,
+                    "data": self.stats(),
+                }
+            )
+        )
+
+
+def locate_versions(model_dir: str) -> Tuple[str, str, str]:
+    """Return the versions folder, model name and default version of a model"""
+    # a bundle written by bundle_models holds a folder per version
+    bundle_dir = os.path.join(model_dir, BUNDLE_FOLDER)
+    if os.path.isfile(os.path.join(bundle_dir, BUNDLE_CONFIG)):
+        with open(os.path.join(bundle_dir, BUNDLE_CONFIG), encoding="utf-8") as file:
+            config = json.load(file)
+        return bundle_dir, config["model_name"], config["default_version"]
+
+    # a registered model is hosted with versions downloaded next to it
+    versions_dir, version = os.path.split(model_dir)
+    return versions_dir, os.path.basename(versions_dir), version
+
+
+def directory_size_mb(path: str) -> float:
+    """Return the size of the files under a directory in megabytes"""
+    return (
+        sum(
+            os.path.getsize(os.path.join(root, name))
+            for root, _, names in os.walk(path)
+            for name in names
+        )
+        / 1024**2
+    )
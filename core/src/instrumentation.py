@@ -0,0 +1,250 @@
+"""Stage timers, memory probes and latency histograms for scoring and jobs"""
+import bisect
+import contextlib
+import cProfile
+import functools
+import os
+import random
+import resource
+import sys
+import threading
+import time
+from typing import Callable, ContextManager, Dict, List, Optional
+
+import mlflow
+
+# define whether stages are measured, when off stages cost a single branch
+INSTRUMENTATION_ENABLED = os.getenv("INSTRUMENTATION_ENABLED", "false") == "true"
+
+# define upper bounds of the latency histogram buckets in milliseconds
+LATENCY_BUCKETS_MS = [0.05 * 2**exponent for exponent in range(18)]
+
+# define context manager used for stages that are not measured
+NULL_CONTEXT = contextlib.nullcontext()
+
+# define type of a function receiving the name and seconds of a stage
+Recorder = Callable[[str, float], None]
+
+
+def peak_rss_mb(who: int = resource.RUSAGE_SELF) -> float:
+    """Return the lifetime peak resident set size in megabytes"""
+    peak_rss = resource.getrusage(who).ru_maxrss
+
+    # macos reports bytes while linux reports kilobytes
+    return peak_rss / 1024**2 if sys.platform == "darwin" else peak_rss / 1024
+
+
+def current_rss_mb() -> Optional[float]:
+    """Return the resident set size of the process, None without procfs"""
+    try:
+        with open("/proc/self/statm", encoding="ascii") as file:
+            resident_pages = int(file.read().split()[1])
+    except OSError:
+        return None
+
+    return resident_pages * resource.getpagesize() / 1024**2
+
+
+def reset_peak_rss() -> bool:
+    """Reset the peak resident set size of the process, linux 4.0 and later"""
+    try:
+        with open("/proc/self/clear_refs", "w", encoding="ascii") as file:
+            file.write("5")
+    except OSError:
+        return False
+
+    return True
+
+
+def high_water_rss_mb() -> Optional[float]:
+    """Return the peak resident set size since the last reset, None without procfs"""
+    try:
+        with open("/proc/self/status", encoding="ascii") as file:
+            for line in file:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+
+    return None
+
+
+def log_stage(name: str, seconds: float) -> None:
+    """Log the duration of a stage to mlflow"""
+    mlflow.log_metric(f"stage_{name}_seconds", seconds)
+
+
+class Stage:
+    """Time a block of code and pass its duration to a recorder"""
+
+    __slots__ = ("name", "record", "start_time")
+
+    def __init__(self, name: str, record: Recorder) -> None:
+        self.name = name
+        self.record = record
+        self.start_time = 0.0
+
+    def __enter__(self) -> "Stage":
+        self.start_time = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.record(self.name, time.perf_counter() - self.start_time)
+
+
+class JobStage(Stage):
+    """Time a job stage and log its duration and memory use to mlflow"""
+
+    __slots__ = ("start_rss_mb", "start_children_peak_mb", "peak_reset")
+
+    def __init__(self, name: str) -> None:
+        super().__init__(name, log_stage)
+        self.start_rss_mb: Optional[float] = None
+        self.start_children_peak_mb = 0.0
+        self.peak_reset = False
+
+    def __enter__(self) -> "JobStage":
+        self.start_rss_mb = current_rss_mb()
+        self.start_children_peak_mb = peak_rss_mb(resource.RUSAGE_CHILDREN)
+        self.peak_reset = reset_peak_rss()
+        return super().__enter__()
+
+    def __exit__(self, *exc_info) -> None:
+        seconds = time.perf_counter() - self.start_time
+        metrics = {f"stage_{self.name}_seconds": seconds}
+
+        # measure the memory held and the peak reached within the stage
+        end_rss_mb = current_rss_mb()
+        if self.start_rss_mb is not None and end_rss_mb is not None:
+            metrics[f"stage_{self.name}_rss_delta_mb"] = end_rss_mb - self.start_rss_mb
+        high_water_mb = high_water_rss_mb() if self.peak_reset else None
+        metrics[f"stage_{self.name}_peak_rss_mb"] = (
+            high_water_mb if high_water_mb is not None else peak_rss_mb()
+        )
+
+        # the peak of workers is known once they exceed the peak of earlier workers
+        children_peak_mb = peak_rss_mb(resource.RUSAGE_CHILDREN)
+        if children_peak_mb > self.start_children_peak_mb:
+            metrics[f"stage_{self.name}_children_peak_rss_mb"] = children_peak_mb
+
+        mlflow.log_metrics(metrics)
+
+
+def stage(name: str, record: Optional[Recorder] = None) -> ContextManager:
+    """Measure a block of code, job stages without a recorder log memory too"""
+    if not INSTRUMENTATION_ENABLED:
+        return NULL_CONTEXT
+    if record is not None:
+        return Stage(name, record)
+
+    # log job stages to the active run only, logging without one starts a new run
+    return JobStage(name) if mlflow.active_run() is not None else NULL_CONTEXT
+
+
+def timed(name: str, record: Optional[Recorder] = None) -> Callable:
+    """Measure every call of a function when instrumentation is enabled"""
+
+    def decorator(func: Callable) -> Callable:
+        if not INSTRUMENTATION_ENABLED:
+            return func
+
+        @functools.wraps(func)
+        def timed_func(*args, **kwargs):
+            with stage(name, record):
+                return func(*args, **kwargs)
+
+        return timed_func
+
+    return decorator
+
+
+class LatencyHistogram:
+    """Count stage latencies in fixed buckets, summarized once per interval"""
+
+    def __init__(
+        self,
+        flush_interval: float = 60.0,
+        buckets: Optional[List[float]] = None,
+    ) -> None:
+        self.flush_interval = flush_interval
+        self.buckets = buckets or LATENCY_BUCKETS_MS
+        self._counts: Dict[str, List[int]] = {}
+        self._sums: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._next_flush = time.monotonic() + flush_interval
+
+    def record(self, name: str, seconds: float) -> None:
+        """Add the latency of a stage to its bucket"""
+        milliseconds = seconds * 1000
+        index = bisect.bisect_left(self.buckets, milliseconds)
+        with self._lock:
+            counts = self._counts.get(name)
+            if counts is None:
+                counts = self._counts[name] = [0] * (len(self.buckets) + 1)
+                self._sums[name] = 0.0
+            counts[index] += 1
+            self._sums[name] += milliseconds
+
+    def pop_due(self) -> Optional[Dict[str, Dict]]:
+        """Return and reset the summary once the flush interval expired"""
+        if time.monotonic() < self._next_flush:
+            return None
+
+        with self._lock:
+            counts, sums = self._counts, self._sums
+            self._counts, self._sums = {}, {}
+            self._next_flush = time.monotonic() + self.flush_interval
+
+        return {name: self.summarize(counts[name], sums[name]) for name in counts}
+
+    def summarize(self, counts: List[int], sum_ms: float) -> Dict:
+        """Estimate percentiles as the upper bound of the bucket holding them"""
+        count = sum(counts)
+        summary = {"count": count, "mean_ms": sum_ms / count}
+        for percentile in (50, 95, 99):
+            target, cumulative = percentile / 100 * count, 0
+            for index, bucket_count in enumerate(counts):
+                cumulative += bucket_count
+                if cumulative >= target:
+                    break
+            summary[f"p{percentile}_ms"] = (
+                self.buckets[index] if index < len(self.buckets) else None
+            )
+        summary["buckets_ms"] = self.buckets
+        summary["counts"] = counts
+
+        return summary
+
+
+class RequestProfiler:
+    """Write the cProfile stats of a single sampled request"""
+
+    def __init__(self, path: Optional[str], sample_rate: float = 0.01) -> None:
+        self.path = path
+        self.sample_rate = sample_rate
+        self._done = not path
+        self._lock = threading.Lock()
+
+    def __call__(self) -> ContextManager:
+        """Profile the block when the request is sampled and none was profiled"""
+        if self._done or random.random() >= self.sample_rate:
+            return NULL_CONTEXT
+
+        with self._lock:
+            if self._done:
+                return NULL_CONTEXT
+            self._done = True
+
+        return self._profile()
+
+    @contextlib.contextmanager
+    def _profile(self):
+        """Profile the block and dump the stats"""
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            profiler.dump_stats(self.path)
@@ -1,38 +1,167 @@
 """Script for an azureml online deployment"""
+import atexit
+import itertools
 import json
 import logging
 import os
 import uuid
-from typing import Dict, List
+from typing import Dict, List, Optional, Tuple
 
-import mlflow
+import numpy as np
 import pandas as pd
 from azureml.ai.monitoring import Collector
+from batching import MicroBatcher
+from cache import PredictionCache
 from constants import INPUT_SAMPLE, OUTPUT_SAMPLE
+from hosting import HostedModel, ModelStore, locate_versions
 from inference_schema.parameter_types.standard_py_parameter_type import \
     StandardPythonParameterType
 from inference_schema.schema_decorators import input_schema, output_schema
+from instrumentation import LatencyHistogram, RequestProfiler, stage
+from payloads import JSON, Columns, format_response, parse_payload, to_rows
+from shadow import ShadowScorer
+from telemetry import TelemetryPipeline
+
+# define maximum batch size scored with the compiled forest
+COMPILED_FOREST_MAX_ROWS = int(os.getenv("COMPILED_FOREST_MAX_ROWS", "500"))
+
+# define model hosting settings, versions default to the folders of a model bundle
+# or to sibling folders of the model, versions beyond a budget on the size of their
+# model files on disk are evicted
+MODEL_VERSIONS_DIR = os.getenv("MODEL_VERSIONS_DIR")
+DEFAULT_MODEL_VERSION = os.getenv("DEFAULT_MODEL_VERSION")
+MODEL_SIZE_BUDGET_MB = float(os.getenv("MODEL_SIZE_BUDGET_MB", "2048"))
+MODEL_VERSION_HEADER = "X-Model-Version"
+
+# define shadow scoring settings for a candidate model version
+SHADOW_MODEL_VERSION = os.getenv("SHADOW_MODEL_VERSION")
+SHADOW_SAMPLE_RATE = float(os.getenv("SHADOW_SAMPLE_RATE", "0.1"))
+SHADOW_QUEUE_SIZE = int(os.getenv("SHADOW_QUEUE_SIZE", "1000"))
+
+# define whether requests are read raw to accept columnar and arrow payloads
+RAW_HTTP_ENABLED = os.getenv("RAW_HTTP_ENABLED", "false") == "true"
+
+# define micro-batching settings for concurrent requests
+MICRO_BATCHING_ENABLED = os.getenv("MICRO_BATCHING_ENABLED", "false") == "true"
+MICRO_BATCH_MAX_SIZE = int(os.getenv("MICRO_BATCH_MAX_SIZE", "64"))
+MICRO_BATCH_MAX_WAIT_MS = float(os.getenv("MICRO_BATCH_MAX_WAIT_MS", "5"))
+
+# define prediction cache settings
+PREDICTION_CACHE_ENABLED = os.getenv("PREDICTION_CACHE_ENABLED", "false") == "true"
+PREDICTION_CACHE_MAX_SIZE = int(os.getenv("PREDICTION_CACHE_MAX_SIZE", "10000"))
+PREDICTION_CACHE_TTL_SECONDS = float(os.getenv("PREDICTION_CACHE_TTL_SECONDS", "0"))
+PREDICTION_CACHE_STATS_INTERVAL = int(
+    os.getenv("PREDICTION_CACHE_STATS_INTERVAL", "1000")
+)
+
+# define telemetry settings for logging and data collection
+TELEMETRY_QUEUE_SIZE = int(os.getenv("TELEMETRY_QUEUE_SIZE", "10000"))
+TELEMETRY_BATCH_SIZE = int(os.getenv("TELEMETRY_BATCH_SIZE", "100"))
+TELEMETRY_FLUSH_INTERVAL_SECONDS = float(
+    os.getenv("TELEMETRY_FLUSH_INTERVAL_SECONDS", "1")
+)
+TELEMETRY_OVERFLOW_POLICY = os.getenv("TELEMETRY_OVERFLOW_POLICY", "drop")
+TELEMETRY_SAMPLE_RATE = float(os.getenv("TELEMETRY_SAMPLE_RATE", "0.1"))
+
+# define instrumentation settings for stage latencies and profiling
+INSTRUMENTATION_FLUSH_INTERVAL_SECONDS = float(
+    os.getenv("INSTRUMENTATION_FLUSH_INTERVAL_SECONDS", "60")
+)
+INSTRUMENTATION_PROFILE_PATH = os.getenv("INSTRUMENTATION_PROFILE_PATH")
+INSTRUMENTATION_PROFILE_SAMPLE_RATE = float(
+    os.getenv("INSTRUMENTATION_PROFILE_SAMPLE_RATE", "0.01")
+)
 
 # define global variables
 SERVICE_NAME = None
-MODEL = None
+MODELS = None
+BATCHER = None
+CACHE = None
+TELEMETRY = None
+SHADOW = None
+REQUEST_COUNTER = itertools.count(1)
+HISTOGRAM = LatencyHistogram(INSTRUMENTATION_FLUSH_INTERVAL_SECONDS)
+PROFILER = RequestProfiler(
+    INSTRUMENTATION_PROFILE_PATH, INSTRUMENTATION_PROFILE_SAMPLE_RATE
+)
 LOGGER = logging.getLogger("root")
 INPUTS_COLLECTOR = None
 OUTPUTS_COLLECTOR = None
 INPUTS_OUTPUTS_COLLECTOR = None
 
+
 def init() -> None:
     """Startup event handler to load an MLFLow model."""
-    global SERVICE_NAME, MODEL, INPUTS_COLLECTOR, OUTPUTS_COLLECTOR, INPUTS_OUTPUTS_COLLECTOR
+    global SERVICE_NAME, MODELS, BATCHER, CACHE, TELEMETRY, SHADOW, INPUTS_COLLECTOR, OUTPUTS_COLLECTOR, INPUTS_OUTPUTS_COLLECTOR
 
     # instantiate collectors
     INPUTS_COLLECTOR = Collector(name="model_inputs")
     OUTPUTS_COLLECTOR = Collector(name="model_outputs")
     INPUTS_OUTPUTS_COLLECTOR = Collector(name="model_inputs_outputs")
 
-    # Load MLFlow model
-    SERVICE_NAME = "online/" + os.getenv("AZUREML_MODEL_DIR").split("/", 4)[-1]
-    MODEL = mlflow.sklearn.load_model(os.getenv("AZUREML_MODEL_DIR") + "/model")
+    # Host registered model versions, loading the default version at startup and
+    # the others on first use within the memory budget
+    versions_dir, model_name, default_version = locate_versions(
+        os.path.normpath(os.getenv("AZUREML_MODEL_DIR"))
+    )
+    default_version = DEFAULT_MODEL_VERSION or default_version
+    SERVICE_NAME = f"online/{model_name}/{default_version}"
+    MODELS = ModelStore(
+        MODEL_VERSIONS_DIR or versions_dir,
+        default_version,
+        SERVICE_NAME,
+        LOGGER,
+        size_budget_mb=MODEL_SIZE_BUDGET_MB,
+        compiled_max_rows=COMPILED_FOREST_MAX_ROWS,
+        record_stage=HISTOGRAM.record,
+    )
+    MODELS.get()
+
+    # Start micro-batching worker
+    if MICRO_BATCHING_ENABLED:
+        BATCHER = MicroBatcher(predict, MICRO_BATCH_MAX_SIZE, MICRO_BATCH_MAX_WAIT_MS)
+
+    # Create prediction cache, cleared whenever a different model is loaded
+    if PREDICTION_CACHE_ENABLED:
+        if CACHE is None:
+            CACHE = PredictionCache(
+                PREDICTION_CACHE_MAX_SIZE, PREDICTION_CACHE_TTL_SECONDS
+            )
+        CACHE.bind(
+            get_model_id(os.path.join(MODELS.versions_dir, MODELS.default_version))
+        )
+
+    # Start telemetry worker for logging and data collection
+    if TELEMETRY is not None:
+        TELEMETRY.close()
+    TELEMETRY = TelemetryPipeline(
+        SERVICE_NAME,
+        LOGGER,
+        INPUTS_COLLECTOR,
+        OUTPUTS_COLLECTOR,
+        INPUTS_OUTPUTS_COLLECTOR,
+        max_queue_size=TELEMETRY_QUEUE_SIZE,
+        max_batch_size=TELEMETRY_BATCH_SIZE,
+        flush_interval=TELEMETRY_FLUSH_INTERVAL_SECONDS,
+        overflow_policy=TELEMETRY_OVERFLOW_POLICY,
+        sample_rate=TELEMETRY_SAMPLE_RATE,
+        record_stage=HISTOGRAM.record,
+    )
+
+    # Start shadow worker scoring a sample of requests with the candidate version
+    if SHADOW is not None:
+        SHADOW.close()
+        SHADOW = None
+    if SHADOW_MODEL_VERSION:
+        SHADOW = ShadowScorer(
+            SERVICE_NAME,
+            LOGGER,
+            MODELS,
+            SHADOW_MODEL_VERSION,
+            sample_rate=SHADOW_SAMPLE_RATE,
+            max_queue_size=SHADOW_QUEUE_SIZE,
+            record_stage=HISTOGRAM.record,
+        )
 
     # Log output data
     LOGGER.info(
@@ -45,80 +174,238 @@ def init() -> None:
     )
 
 
+@atexit.register
+def shutdown() -> None:
+    """Exit event handler to flush queued telemetry, registered once"""
+    if TELEMETRY is not None:
+        TELEMETRY.close(TELEMETRY_FLUSH_INTERVAL_SECONDS * 2)
+
+
 @input_schema("data", StandardPythonParameterType(INPUT_SAMPLE))
 @output_schema(StandardPythonParameterType(OUTPUT_SAMPLE))
 def run(data: List[Dict]) -> str:
     """Perform scoring for every invocation of the endpoint"""
 
+    # Define UUID for the request
+    request_id = uuid.uuid4().hex
+
+    try:
+        with PROFILER(), stage("request", HISTOGRAM.record):
+            # Preprocess payload and get model prediction
+            with stage("score", HISTOGRAM.record):
+                model_output = score(data)
+
+            # Queue inputs and outputs for logging and data collection
+            with stage("telemetry", HISTOGRAM.record):
+                TELEMETRY.submit(request_id, data, model_output)
+
+            # Queue a sample of requests for the shadow version
+            if SHADOW is not None:
+                with stage("shadow", HISTOGRAM.record):
+                    SHADOW.submit(
+                        request_id,
+                        MODELS.default_version,
+                        data,
+                        len(data),
+                        model_output,
+                    )
+
+            # Make response payload
+            with stage("response", HISTOGRAM.record):
+                response_payload = json.dumps({"predictions": model_output})
+
+        log_latency_histogram()
+
+        return response_payload
+
+    except Exception as error:
+        log_exception(request_id, error)
+
+
+def handle_payload(
+    body: bytes, content_type: str, accept: str, version: Optional[str] = None
+) -> Tuple[bytes, int, str]:
+    """Score a raw request body, return the response body, status and type"""
+
+    # Define UUID for the request
+    request_id = uuid.uuid4().hex
+
     try:
-        # Append datetime column to predictions
-        input_df = pd.DataFrame(data)
+        # Route the request to the requested or the default model version
+        model = MODELS.get(version)
+
+        with PROFILER(), stage("request", HISTOGRAM.record):
+            # Parse records, split json or arrow payload and check features once
+            with stage("parse", HISTOGRAM.record):
+                columns, n_rows = parse_payload(body, content_type)
+
+            # Get model prediction
+            with stage("score", HISTOGRAM.record):
+                model_output = score_columns(columns, n_rows, model)
 
-        # Preprocess payload and get model prediction
-        model_output = MODEL.predict_proba(input_df)[:, 1].tolist()
-        output_df = pd.DataFrame(model_output, columns=["predictions"])
+            # Queue inputs and outputs for logging and data collection
+            with stage("telemetry", HISTOGRAM.record):
+                TELEMETRY.submit(request_id, columns, model_output)
 
-        # --- Custom Monitoring / Data Collection ---
+            # Queue a sample of requests for the shadow version
+            if SHADOW is not None:
+                with stage("shadow", HISTOGRAM.record):
+                    SHADOW.submit(
+                        request_id, model.version, columns, n_rows, model_output
+                    )
 
-        # Define UUID for the request
-        request_id = uuid.uuid4().hex
+            # Make response payload in the requested format
+            with stage("response", HISTOGRAM.record):
+                response_payload, response_type = format_response(model_output, accept)
 
-        # Log input data
+        log_latency_histogram()
+
+        return response_payload, 200, response_type
+
+    except Exception as error:
+        log_exception(request_id, error)
+        status = 400 if isinstance(error, ValueError) else 500
+
+        return json.dumps({"error": str(error)}).encode(), status, JSON
+
+
+def log_exception(request_id: str, error: Exception) -> None:
+    """Log an exception raised while scoring a request"""
+    LOGGER.error(
+        json.dumps(
+            {
+                "service_name": SERVICE_NAME,
+                "type": "Exception",
+                "request_id": request_id,
+                "error": str(error),
+            }
+        ),
+        exc_info=error,
+    )
+
+
+def score(data: List[Dict]) -> List[float]:
+    """Return cached predictions and send the remaining rows to the model"""
+    if CACHE is None:
+        return BATCHER.submit(data) if BATCHER is not None else predict(data)
+
+    # look up predictions of every row in the cache
+    keys = [CACHE.make_key(row) for row in data]
+    model_output = CACHE.get_many(keys)
+
+    # score the rows that missed the cache
+    misses = [
+        index for index, prediction in enumerate(model_output) if prediction is None
+    ]
+    if misses:
+        rows = [data[index] for index in misses]
+        predictions = BATCHER.submit(rows) if BATCHER is not None else predict(rows)
+        for index, prediction in zip(misses, predictions):
+            model_output[index] = prediction
+        CACHE.put_many([keys[index] for index in misses], predictions)
+
+    log_cache_stats()
+
+    return model_output
+
+
+def score_columns(columns: Columns, n_rows: int, model: HostedModel) -> List[float]:
+    """Score payload columns, using the row path for caching and micro-batching"""
+    # cache and micro-batch requests of the default version only
+    if model.version == MODELS.default_version and (
+        CACHE is not None or BATCHER is not None
+    ):
+        return score(to_rows(columns))
+
+    # use the pipeline when no compiled model is available
+    if model.encoder is None:
+        with stage("predict", HISTOGRAM.record):
+            return model.predict_frame(pd.DataFrame(columns))
+
+    # encode payload columns directly
+    with stage("encode", HISTOGRAM.record):
+        features = model.encoder.transform_columns(columns, n_rows)
+
+    return predict_features(features, model)
+
+
+def log_cache_stats() -> None:
+    """Periodically log the prediction cache counters"""
+    if next(REQUEST_COUNTER) % PREDICTION_CACHE_STATS_INTERVAL == 0:
         LOGGER.info(
             json.dumps(
                 {
                     "service_name": SERVICE_NAME,
-                    "type": "InputData",
-                    "request_id": request_id,
-                    "data": input_df.to_json(orient="records"),
+                    "type": "PredictionCacheStats",
+                    "data": CACHE.stats(),
                 }
             )
         )
 
-        # Log output data
+
+def log_latency_histogram() -> None:
+    """Periodically log the latency histograms of the request stages"""
+    histograms = HISTOGRAM.pop_due()
+    if histograms:
         LOGGER.info(
             json.dumps(
                 {
                     "service_name": SERVICE_NAME,
-                    "type": "OutputData",
-                    "request_id": request_id,
-                    "data": model_output,
+                    "type": "LatencyHistogram",
+                    "data": histograms,
                 }
             )
         )
 
-        # Make response payload
-        response_payload = json.dumps({"predictions": model_output})
 
-        # ----------------------------------
+def get_model_id(model_dir: str) -> str:
+    """Identify a model by its directory and the modification time of MLmodel"""
+    try:
+        return f"{model_dir}:{os.path.getmtime(model_dir + '/model/MLmodel')}"
+    except OSError:
+        return model_dir
 
-        # --- Azure ML Native Data Collection ---
 
-        # collect inputs data
-        context = INPUTS_COLLECTOR.collect(input_df)
+def predict(data: List[Dict]) -> List[float]:
+    """Return the probability of the positive class for each payload row"""
+    model = MODELS.get()
 
-        # collect outputs data
-        OUTPUTS_COLLECTOR.collect(output_df, context)
+    # use the pipeline when no compiled model is available
+    if model.encoder is None:
+        with stage("predict", HISTOGRAM.record):
+            return model.predict_frame(pd.DataFrame(data))
 
-        # create a dataframe with inputs/outputs joined - this creates a URI folder (not mltable)
-        input_output_df = input_df.join(output_df)
+    # encode payload rows directly
+    with stage("encode", HISTOGRAM.record):
+        features = model.encoder.transform(data)
 
-        # collect both your inputs and output
-        INPUTS_OUTPUTS_COLLECTOR.collect(input_output_df, context)
+    return predict_features(features, model)
 
-        # ----------------------------------
 
-        return response_payload
+def predict_features(features: np.ndarray, model: HostedModel) -> List[float]:
+    """Return the probability of the positive class for each encoded row"""
+    # evaluate the compiled forest for small batches and sklearn for large ones
+    with stage("predict", HISTOGRAM.record):
+        return model.predict_features(features)
 
-    except Exception as error:
-        LOGGER.error(
-            json.dumps(
-                {
-                    "service_name": SERVICE_NAME,
-                    "type": "Exception",
-                    "request_id": request_id,
-                    "error": error,
-                }
-            ),
-            exc_info=error,
+
+# Read raw requests instead of the schema-decorated handler when enabled, the
+# swagger schema is only generated for the default handler
+if RAW_HTTP_ENABLED:
+    from azureml.contrib.services.aml_request import rawhttp
+    from azureml.contrib.services.aml_response import AMLResponse
+
+    @rawhttp
+    def run(request) -> AMLResponse:  # noqa: F811
+        """Score records, split json or arrow bodies with the requested version"""
+        if request.method != "POST":
+            return AMLResponse("Method not allowed", 405)
+
+        body, status, content_type = handle_payload(
+            request.get_data(cache=False),
+            request.headers.get("Content-Type", JSON),
+            request.headers.get("Accept", JSON),
+            request.headers.get(MODEL_VERSION_HEADER),
         )
+
+        return AMLResponse(body, status, {"Content-Type": content_type})
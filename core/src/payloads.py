@@ -0,0 +1,105 @@
+"""Columnar request and response payloads of the online scoring service"""
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+import orjson
+import pyarrow as pa
+from constants import FEATURES, NUMERIC_FEATURES
+
+# define content types of the supported payload formats
+JSON = "application/json"
+ARROW = "application/vnd.apache.arrow.stream"
+
+# define features every columnar payload must hold, checked once per batch
+REQUIRED_FEATURES = frozenset(FEATURES)
+NUMERIC_FEATURE_SET = frozenset(NUMERIC_FEATURES)
+
+# define type of payload columns keyed by feature name
+Columns = Dict[str, Sequence]
+
+
+def parse_payload(body: bytes, content_type: str) -> Tuple[Columns, int]:
+    """Parse records or split json, or an arrow stream, into feature columns"""
+    if content_type.split(";")[0].strip() == ARROW:
+        return parse_arrow(body)
+
+    payload = orjson.loads(body)
+
+    # accept the {"columns": [...], "data": [[...], ...]} split layout
+    if isinstance(payload, dict) and "columns" in payload:
+        return parse_split(payload["columns"], payload["data"])
+
+    # accept a list of records, optionally wrapped like the swagger payload
+    if isinstance(payload, dict):
+        payload = payload.get("data")
+    if not isinstance(payload, list) or not all(
+        isinstance(row, dict) for row in payload
+    ):
+        raise ValueError("Payload must be a list of records or split columns")
+
+    # reject records whose keys are not exactly the features
+    for row in payload:
+        if row.keys() != REQUIRED_FEATURES:
+            check_columns(row)
+            raise ValueError(
+                "Payload has unexpected features: "
+                f"{sorted(set(row).difference(REQUIRED_FEATURES))}"
+            )
+
+    columns = {feature: [row[feature] for row in payload] for feature in FEATURES}
+
+    return columns, len(payload)
+
+
+def parse_split(columns: List[str], data: List[List]) -> Tuple[Columns, int]:
+    """Transpose the rows of a split payload into feature columns"""
+    check_columns(columns)
+    if any(len(row) != len(columns) for row in data):
+        raise ValueError("Every row must hold a value for every column")
+
+    # index rows per column, unpacking thousands of rows into zip is slower
+    return {
+        column: [row[index] for row in data] for index, column in enumerate(columns)
+    }, len(data)
+
+
+def parse_arrow(body: bytes) -> Tuple[Columns, int]:
+    """Read the feature columns of an arrow ipc stream"""
+    table = pa.ipc.open_stream(body).read_all()
+    check_columns(table.column_names)
+
+    # read numeric columns as float arrays with missing values as nan
+    columns = {
+        feature: (
+            table.column(feature).to_numpy(zero_copy_only=False).astype(np.float64)
+            if feature in NUMERIC_FEATURE_SET
+            else table.column(feature).to_pylist()
+        )
+        for feature in FEATURES
+    }
+
+    return columns, table.num_rows
+
+
+def check_columns(columns: Sequence[str]) -> None:
+    """Check that a columnar payload holds every feature"""
+    missing = REQUIRED_FEATURES.difference(columns)
+    if missing:
+        raise ValueError(f"Payload is missing features: {sorted(missing)}")
+
+
+def to_rows(columns: Columns) -> List[Dict]:
+    """Convert feature columns back to a list of records"""
+    return [dict(zip(columns, values)) for values in zip(*columns.values())]
+
+
+def format_response(predictions: List[float], accept: str) -> Tuple[bytes, str]:
+    """Serialize predictions as json or as an arrow stream when requested"""
+    if accept.split(";")[0].strip() == ARROW:
+        table = pa.table({"predictions": pa.array(predictions, type=pa.float64())})
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes(), ARROW
+
+    return orjson.dumps({"predictions": predictions}), JSON
@@ -1,23 +1,62 @@
 # imports
+import os
 from argparse import ArgumentParser, Namespace
-from typing import Tuple
+from typing import List, Tuple
 
 import mlflow
 import mltable
 import numpy as np
 import pandas as pd
-from constants import CATEGORICAL_FEATURES, NUMERIC_FEATURES, TARGET
+from constants import CATEGORICAL_FEATURES, FEATURES, NUMERIC_FEATURES, TARGET
+from datasets import (
+    copy_prepared,
+    hash_files,
+    prepared_key,
+    read_manifest,
+    write_prepared,
+)
+from features import compute_features, write_features
+from instrumentation import stage
 from sklearn.model_selection import train_test_split
+from train import make_preprocessor
 
 
 def main(args: Namespace) -> None:
+    # identify prepared data by the input data and random state
+    key = prepared_key(hash_files(args.curated_dataset), args.random_state)
+    cache_dir = f"{args.cache_dir}/{key}" if args.cache_dir else None
+    mlflow.log_param("prepared_data_key", key)
+
+    # skip preparation when the output or cache already holds the prepared data
+    manifest = read_manifest(args.prepared_data_dir)
+    if manifest and manifest["key"] == key:
+        print("Prepared data is up to date:", args.prepared_data_dir)
+        return
+
+    manifest = read_manifest(cache_dir) if cache_dir else None
+    if manifest and manifest["key"] == key:
+        print("Using cached prepared data:", cache_dir)
+        copy_prepared(cache_dir, args.prepared_data_dir)
+        return
+
     # process data
-    tbl = mltable.load(args.curated_dataset)
-    df = tbl.to_pandas_dataframe()
-    df_train, df_test = prepare_data(df, args.random_state)
+    with stage("read_data"):
+        tbl = mltable.load(args.curated_dataset)
+        df = tbl.to_pandas_dataframe()
+    with stage("prepare_data"):
+        df_train, df_test = prepare_data(df, args.random_state)
+
+    # fit the preprocessor once so that training trials only fit classifiers
+    with stage("prepare_features"):
+        files = prepare_features(args.prepared_data_dir, df_train, df_test)
 
-    df_train.to_csv(f"{args.prepared_data_dir}/train.csv", index=False)
-    df_test.to_csv(f"{args.prepared_data_dir}/test.csv", index=False)
+    # write typed columnar files and add them to the cache
+    with stage("write_prepared"):
+        write_prepared(
+            args.prepared_data_dir, {"train": df_train, "test": df_test}, key, files
+        )
+        if cache_dir:
+            copy_prepared(args.prepared_data_dir, cache_dir)
 
 
 def prepare_data(
@@ -26,7 +65,7 @@ def prepare_data(
     # change data types of target and features
     df[TARGET] = df[TARGET].replace({"True": 1, "False": 0})
     df[NUMERIC_FEATURES] = df[NUMERIC_FEATURES].astype("float")
-    df[CATEGORICAL_FEATURES] = df[CATEGORICAL_FEATURES].astype("str")
+    df[CATEGORICAL_FEATURES] = df[CATEGORICAL_FEATURES].astype("str").astype("category")
 
     # split into train and test datasets
     df_train, df_test = train_test_split(
@@ -38,6 +77,16 @@ def prepare_data(
     return df_train, df_test
 
 
+def prepare_features(
+    prepared_data_dir: str, df_train: pd.DataFrame, df_test: pd.DataFrame
+) -> List[str]:
+    os.makedirs(prepared_data_dir, exist_ok=True)
+    preprocessor = make_preprocessor().fit(df_train[FEATURES])
+    matrices = compute_features(preprocessor, df_train, df_test)
+
+    return write_features(prepared_data_dir, preprocessor, matrices)
+
+
 def parse_args() -> Namespace:
     # setup arg parser
     parser = ArgumentParser("prepare")
@@ -46,6 +95,7 @@ def parse_args() -> Namespace:
     parser.add_argument("--curated_dataset", type=str)
     parser.add_argument("--prepared_data_dir", type=str)
     parser.add_argument("--random_state", type=lambda x: int(float(x)), default=24)
+    parser.add_argument("--cache_dir", type=str)
 
     # parse args
     args = parser.parse_args()
@@ -0,0 +1,312 @@
+"""Mergeable per-feature profiles used to calculate data drift"""
+import json
+import os
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+from constants import CATEGORICAL_FEATURES, NUMERIC_FEATURES
+from datasets import hash_files
+from stattests import (
+    N_BINS,
+    bin_counts,
+    histogram_drift,
+    quantile_bin_edges,
+    summarize_feature_metrics,
+)
+
+# define version of the profile format, bump when the format changes
+PROFILE_VERSION = 1
+
+# define quantiles stored for numeric reference features
+QUANTILES = [0.01, 0.05, 0.1, 0.25, 0.5, 0.75, 0.9, 0.95, 0.99]
+
+
+class NumericProfile:
+    """Histogram over fixed bin edges with count and moment sums"""
+
+    def __init__(
+        self,
+        edges: np.ndarray,
+        counts: Optional[np.ndarray] = None,
+        n_missing: int = 0,
+        total: float = 0.0,
+        total_squares: float = 0.0,
+        quantiles: Optional[Dict[str, float]] = None,
+    ) -> None:
+        self.edges = np.asarray(edges, dtype=np.float64)
+
+        # bin i holds values in (edges[i - 1], edges[i]], the last bin is open
+        self.counts = (
+            np.zeros(len(self.edges) + 1, dtype=np.int64)
+            if counts is None
+            else np.asarray(counts, dtype=np.int64)
+        )
+        self.n_missing = n_missing
+        self.total = total
+        self.total_squares = total_squares
+        self.quantiles = quantiles or {}
+
+    @classmethod
+    def from_reference(cls, values: pd.Series, n_bins: int) -> "NumericProfile":
+        """Create a profile with quantile bin edges of the reference values"""
+        values = values.dropna().to_numpy(dtype=np.float64)
+        edges = quantile_bin_edges(values, n_bins)
+        quantiles = dict(zip(map(str, QUANTILES), np.quantile(values, QUANTILES)))
+
+        profile = cls(
+            edges, quantiles={key: float(value) for key, value in quantiles.items()}
+        )
+        profile.update(pd.Series(values))
+
+        return profile
+
+    def empty_like(self) -> "NumericProfile":
+        """Create an empty profile with the same bin edges"""
+        return NumericProfile(self.edges)
+
+    def update(self, values: pd.Series) -> None:
+        """Add a batch of values to the profile"""
+        values = values.to_numpy(dtype=np.float64)
+        missing = np.isnan(values)
+        values = values[~missing]
+
+        self.counts += bin_counts(values, self.edges)
+        self.n_missing += int(missing.sum())
+        self.total += float(values.sum())
+        self.total_squares += float(np.square(values).sum())
+
+    def merge(self, other: "NumericProfile") -> None:
+        """Add the counts and sums of a profile with the same bin edges"""
+        if not np.array_equal(self.edges, other.edges):
+            raise ValueError("Cannot merge numeric profiles with different bin edges")
+
+        self.counts += other.counts
+        self.n_missing += other.n_missing
+        self.total += other.total
+        self.total_squares += other.total_squares
+
+    @property
+    def count(self) -> int:
+        """Number of non-missing values"""
+        return int(self.counts.sum())
+
+    def to_dict(self) -> Dict:
+        """Convert the profile to a json serializable dictionary"""
+        return {
+            "type": "num",
+            "edges": self.edges.tolist(),
+            "counts": self.counts.tolist(),
+            "n_missing": self.n_missing,
+            "total": self.total,
+            "total_squares": self.total_squares,
+            "quantiles": self.quantiles,
+        }
+
+
+class CategoricalProfile:
+    """Frequency table of category values"""
+
+    def __init__(self, counts: Optional[Dict[str, int]] = None) -> None:
+        self.counts = dict(counts or {})
+
+    def empty_like(self) -> "CategoricalProfile":
+        """Create an empty profile"""
+        return CategoricalProfile()
+
+    def update(self, values: pd.Series) -> None:
+        """Add a batch of values to the profile"""
+        for category, count in values.astype("str").value_counts().items():
+            self.counts[category] = self.counts.get(category, 0) + int(count)
+
+    def merge(self, other: "CategoricalProfile") -> None:
+        """Add the frequencies of another profile"""
+        for category, count in other.counts.items():
+            self.counts[category] = self.counts.get(category, 0) + count
+
+    @property
+    def count(self) -> int:
+        """Number of values"""
+        return sum(self.counts.values())
+
+    def to_dict(self) -> Dict:
+        """Convert the profile to a json serializable dictionary"""
+        return {"type": "cat", "counts": self.counts}
+
+
+# define type of a feature profile
+FeatureProfile = Union[NumericProfile, CategoricalProfile]
+
+
+class DatasetProfile:
+    """Profiles of every feature of a dataset"""
+
+    def __init__(
+        self, features: Dict[str, FeatureProfile], content_hash: Optional[str] = None
+    ) -> None:
+        self.features = features
+        self.content_hash = content_hash
+
+    @classmethod
+    def from_reference(
+        cls, df: pd.DataFrame, content_hash: Optional[str] = None, n_bins: int = N_BINS
+    ) -> "DatasetProfile":
+        """Summarize a reference dataset"""
+        features: Dict[str, FeatureProfile] = {}
+        for feature in NUMERIC_FEATURES:
+            features[feature] = NumericProfile.from_reference(
+                df[feature].astype("float"), n_bins
+            )
+        for feature in CATEGORICAL_FEATURES:
+            features[feature] = CategoricalProfile()
+            features[feature].update(df[feature])
+
+        return cls(features, content_hash)
+
+    def empty_like(self) -> "DatasetProfile":
+        """Create an empty profile to accumulate target data against this one"""
+        return DatasetProfile(
+            {
+                feature: profile.empty_like()
+                for feature, profile in self.features.items()
+            }
+        )
+
+    def update(self, df: pd.DataFrame) -> None:
+        """Add a batch of rows to the profile"""
+        for feature, profile in self.features.items():
+            profile.update(df[feature])
+
+    def merge(self, other: "DatasetProfile") -> None:
+        """Add the summaries of another profile built against the same reference"""
+        for feature, profile in self.features.items():
+            profile.merge(other.features[feature])
+
+    @property
+    def count(self) -> int:
+        """Number of rows"""
+        profile = next(iter(self.features.values()))
+        if isinstance(profile, NumericProfile):
+            return profile.count + profile.n_missing
+
+        return profile.count
+
+    def to_dict(self) -> Dict:
+        """Convert the feature profiles to a json serializable dictionary"""
+        return {
+            feature: profile.to_dict() for feature, profile in self.features.items()
+        }
+
+    @classmethod
+    def from_dict(
+        cls, config: Dict, content_hash: Optional[str] = None
+    ) -> "DatasetProfile":
+        """Create a profile from feature profiles written by to_dict"""
+        features: Dict[str, FeatureProfile] = {}
+        for feature, profile in config.items():
+            profile = dict(profile)
+            profile_type = profile.pop("type")
+            if profile_type == "num":
+                features[feature] = NumericProfile(**profile)
+            else:
+                features[feature] = CategoricalProfile(**profile)
+
+        return cls(features, content_hash)
+
+    def save(self, path: str) -> None:
+        """Write the profile to a json file"""
+        write_json(
+            path,
+            {
+                "version": PROFILE_VERSION,
+                "content_hash": self.content_hash,
+                "features": self.to_dict(),
+            },
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "DatasetProfile":
+        """Read a profile written by save"""
+        with open(path, encoding="utf-8") as file:
+            config = json.load(file)
+
+        if config["version"] != PROFILE_VERSION:
+            raise ValueError(f"Unsupported profile version: {config['version']}")
+
+        return cls.from_dict(config["features"], config["content_hash"])
+
+
+def write_json(path: str, config: Dict) -> None:
+    """Write a json file atomically so readers never see a partial file"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(f"{path}.tmp", "w", encoding="utf-8") as file:
+        json.dump(config, file)
+    os.replace(f"{path}.tmp", path)
+
+
+def load_reference_profile(
+    reference_data: str, profile_dir: str, load_reference: Callable[[], pd.DataFrame]
+) -> DatasetProfile:
+    """Load the cached profile of the reference data or build and cache it"""
+    content_hash = hash_files(reference_data)
+    path = os.path.join(
+        profile_dir, f"reference_v{PROFILE_VERSION}_{content_hash}.json"
+    )
+
+    if os.path.exists(path):
+        print("Using cached reference profile:", path)
+        return DatasetProfile.load(path)
+
+    print("Building reference profile:", path)
+    profile = DatasetProfile.from_reference(load_reference(), content_hash)
+    profile.save(path)
+
+    return profile
+
+
+def compare_profiles(
+    reference: DatasetProfile,
+    target: DatasetProfile,
+    numeric_stattest: str = "auto",
+    categorical_stattest: str = "auto",
+) -> Tuple[Dict, List[Dict]]:
+    """Calculate drift metrics of a target profile against the reference profile"""
+    feature_metrics = []
+    for feature in CATEGORICAL_FEATURES + NUMERIC_FEATURES:
+        reference_profile = reference.features[feature]
+        target_profile = target.features[feature]
+
+        # compare numeric histograms over the reference quantile bins, values above
+        # the reference maximum are counted in the last reference bin
+        if isinstance(reference_profile, NumericProfile):
+            feature_metrics.append(
+                histogram_drift(
+                    feature,
+                    fold_last_bin(reference_profile.counts),
+                    fold_last_bin(target_profile.counts),
+                    "num",
+                    numeric_stattest,
+                )
+            )
+
+        # compare category frequencies over the union of categories
+        else:
+            categories = sorted(
+                set(reference_profile.counts) | set(target_profile.counts)
+            )
+            feature_metrics.append(
+                histogram_drift(
+                    feature,
+                    np.array([reference_profile.counts.get(c, 0) for c in categories]),
+                    np.array([target_profile.counts.get(c, 0) for c in categories]),
+                    "cat",
+                    categorical_stattest,
+                )
+            )
+
+    return summarize_feature_metrics(feature_metrics), feature_metrics
+
+
+def fold_last_bin(counts: np.ndarray) -> np.ndarray:
+    """Add the counts of the open bin above the last edge to the bin before it"""
+    return np.concatenate([counts[:-2], [counts[-2] + counts[-1]]])
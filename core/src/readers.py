@@ -0,0 +1,35 @@
+"""Readers streaming delimited and parquet data files in chunks of rows"""
+from typing import Dict, Iterator, List, Optional
+
+import pandas as pd
+import pyarrow.parquet as pq
+from constants import CATEGORICAL_FEATURES
+
+
+def iter_file(
+    file_path: str,
+    columns: List[str],
+    chunk_size: int,
+    read_options: Optional[Dict] = None,
+) -> Iterator[pd.DataFrame]:
+    """Read columns of a csv or parquet file in chunks of rows"""
+    # read row groups of parquet files in batches
+    if file_path.endswith(".parquet"):
+        for batch in pq.ParquetFile(file_path).iter_batches(
+            batch_size=chunk_size, columns=columns
+        ):
+            yield batch.to_pandas()
+        return
+
+    # read categories as strings so that chunks share data types
+    read_options = read_options or {}
+    yield from pd.read_csv(
+        file_path,
+        sep=read_options.get("delimiter", ","),
+        encoding=read_options.get("encoding", "utf-8"),
+        usecols=columns,
+        dtype={
+            feature: "str" for feature in CATEGORICAL_FEATURES if feature in columns
+        },
+        chunksize=chunk_size,
+    )
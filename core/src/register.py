@@ -1,10 +1,30 @@
 """Script to register a machine learning model to mlflow"""
+import os
+import tempfile
+import time
 from argparse import ArgumentParser, Namespace
+from typing import Dict, Tuple
 
 import mlflow
+import numpy as np
 import pandas as pd
-from constants import FEATURES
+from compaction import (
+    oob_tree_probabilities,
+    prune_pipeline,
+    score_probabilities,
+    select_trees,
+)
+from constants import CATEGORICAL_FEATURES, FEATURES, TARGET
+from datasets import read_prepared
+from encoder import FeatureEncoder
+from features import transform_features
+from forest import CompiledForest
 from mlflow.models.signature import infer_signature
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.pipeline import Pipeline
+
+# define number of single row predictions timed to measure latency
+LATENCY_ROWS = 100
 
 
 def main(args: Namespace) -> None:
@@ -13,19 +33,168 @@ def main(args: Namespace) -> None:
     model = mlflow.sklearn.load_model(f"{args.model_output}/model")
 
     # create model signature
-    df_train = pd.read_csv(f"{args.prepared_data_dir}/train.csv")
+    df_train = read_prepared(args.prepared_data_dir, "train")
     model_input = df_train[FEATURES].head()
+    model_input[CATEGORICAL_FEATURES] = model_input[CATEGORICAL_FEATURES].astype("str")
     model_output = model.predict(model_input)
     model_signature = infer_signature(model_input, model_output)
 
+    # replace the model by a pruned one if it stays within tolerance, quantizing
+    # the compiled forest for compact models
+    quantize = False
+    if args.optimize != "none":
+        model, quantize = optimize_model(
+            model, args.prepared_data_dir, args.tolerance, args.optimize == "compact"
+        )
+
     mlflow.sklearn.log_model(
         sk_model=model,
         artifact_path="model",
         conda_env=args.conda_env,
         signature=model_signature,
-        registered_model_name=args.model_name,
     )
 
+    # add memory-mappable compiled model used by the scoring scripts
+    try:
+        save_compiled_model(model, "compiled", quantize)
+        mlflow.log_artifacts("compiled", "model/compiled")
+    except (AttributeError, KeyError, ValueError) as error:
+        print("Skipping compiled model:", error)
+
+    # register model
+    mlflow.register_model(
+        f"runs:/{mlflow.active_run().info.run_id}/model", args.model_name
+    )
+
+
+def optimize_model(
+    model: Pipeline, prepared_data_dir: str, tolerance: float, quantize: bool
+) -> Tuple[Pipeline, bool]:
+    """Prune and optionally quantize a forest, return it and whether to quantize"""
+    classifier = model.named_steps["classifier"]
+    if not isinstance(classifier, RandomForestClassifier):
+        print("Skipping model optimization:", type(classifier).__name__)
+        return model, False
+
+    # trees are selected on the training rows each tree did not draw
+    if not classifier.bootstrap:
+        print("Skipping model optimization: forest has no out-of-bag rows")
+        return model, False
+
+    # keep the fewest trees that score within tolerance on their out-of-bag
+    # training rows, leaving the test data to check the optimized model
+    df_train = read_prepared(prepared_data_dir, "train")
+    y_train = df_train[TARGET].to_numpy(np.int64).ravel()
+    x_train = transform_features(model.named_steps["preprocessor"], df_train[FEATURES])
+    try:
+        probabilities = oob_tree_probabilities(classifier, x_train)
+    except ValueError as error:
+        print("Skipping model optimization:", error)
+        return model, False
+    trees, _ = select_trees(probabilities, y_train, tolerance)
+    optimized = prune_pipeline(model, trees)
+
+    # measure both models as they would be registered on the test data
+    df_test = read_prepared(prepared_data_dir, "test")
+    y_test = df_test[TARGET].to_numpy(np.int64).ravel()
+    with tempfile.TemporaryDirectory() as path:
+        before = measure_model(model, f"{path}/original", df_test, y_test, False)
+        after = measure_model(optimized, f"{path}/optimized", df_test, y_test, quantize)
+
+    mlflow.log_metric("original_n_estimators", len(classifier.estimators_))
+    mlflow.log_metric("optimized_n_estimators", len(trees))
+    for name in before:
+        mlflow.log_metric(f"original_{name}", before[name])
+        mlflow.log_metric(f"optimized_{name}", after[name])
+
+    # register the original model if pruning moved the metrics too far
+    within_tolerance = all(
+        after[name] >= before[name] - tolerance
+        for name in ["validation_f1_score", "validation_roc_auc_score"]
+    )
+    mlflow.log_param("optimized_model_registered", within_tolerance)
+    if not within_tolerance:
+        print("Optimized model is outside tolerance, registering original model")
+        return model, False
+
+    # online requests are scored by the compiled forest and batches by the pickle,
+    # keep full precision if quantization moved probabilities beyond tolerance
+    if quantize and after["compiled_max_abs_difference"] > tolerance:
+        print("Quantized forest is outside tolerance, keeping full precision")
+        quantize = False
+    mlflow.log_param("compiled_model_quantized", quantize)
+
+    return optimized, quantize
+
+
+def measure_model(
+    model: Pipeline,
+    path: str,
+    df_test: pd.DataFrame,
+    y_test: np.ndarray,
+    quantize: bool,
+) -> Dict[str, float]:
+    """Save a model like registration does, measure size, load time and scores"""
+    mlflow.sklearn.save_model(model, path)
+    save_compiled_model(model, f"{path}/compiled", quantize)
+    model_mb = (
+        sum(
+            os.path.getsize(os.path.join(root, name))
+            for root, _, names in os.walk(path)
+            for name in names
+        )
+        / 1024**2
+    )
+
+    # time loading the pipeline and the compiled model used by the scoring scripts
+    start_time = time.perf_counter()
+    mlflow.sklearn.load_model(path)
+    load_seconds = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    encoder = FeatureEncoder.load(f"{path}/compiled/encoder.json")
+    forest = CompiledForest.load(f"{path}/compiled/forest")
+    compiled_load_seconds = time.perf_counter() - start_time
+
+    # time single row predictions like online requests with the model pipeline
+    # and the compiled model
+    records = df_test[FEATURES].to_dict(orient="records")
+    latencies, compiled_latencies = [], []
+    for record in records[:LATENCY_ROWS]:
+        start_time = time.perf_counter()
+        model.predict_proba(pd.DataFrame([record]))
+        latencies.append((time.perf_counter() - start_time) * 1000)
+
+        start_time = time.perf_counter()
+        forest.predict_proba(encoder.transform([record]))
+        compiled_latencies.append((time.perf_counter() - start_time) * 1000)
+
+    # score the pickle used by batch scoring and compare the compiled forest with it
+    y_proba = model.predict_proba(df_test[FEATURES])[:, 1]
+    compiled_proba = forest.predict_proba(encoder.transform(records))[:, 1]
+
+    return {
+        "model_mb": model_mb,
+        "load_seconds": load_seconds,
+        "compiled_load_seconds": compiled_load_seconds,
+        "latency_ms": float(np.median(latencies)),
+        "compiled_latency_ms": float(np.median(compiled_latencies)),
+        "compiled_max_abs_difference": float(np.abs(compiled_proba - y_proba).max()),
+        **score_probabilities(y_test, y_proba),
+    }
+
+
+def save_compiled_model(model: Pipeline, path: str, quantize: bool = False) -> None:
+    """Write the feature encoder and flattened forest of a model pipeline"""
+    encoder = FeatureEncoder.from_pipeline(model)
+    forest = CompiledForest.from_estimator(model.named_steps["classifier"])
+    if quantize:
+        forest = forest.quantize()
+
+    os.makedirs(path, exist_ok=True)
+    encoder.save(f"{path}/encoder.json")
+    forest.save(f"{path}/forest")
+
 
 def parse_args() -> Namespace:
     """Parse command line arguments"""
@@ -37,6 +206,10 @@ def parse_args() -> Namespace:
     parser.add_argument("--model_name", type=str)
     parser.add_argument("--model_output", type=str)
     parser.add_argument("--conda_env", type=str)
+    parser.add_argument(
+        "--optimize", type=str, choices=["none", "prune", "compact"], default="none"
+    )
+    parser.add_argument("--tolerance", type=float, default=0.005)
 
     # parse args
     args = parser.parse_args()
@@ -0,0 +1,589 @@
+"""Script to run a pipeline job locally, caching unchanged steps"""
+import hashlib
+import importlib.util
+import json
+import math
+import os
+import random
+import re
+import shlex
+import shutil
+import subprocess
+import sys
+import time
+from argparse import ArgumentParser, Namespace
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import yaml
+from datasets import hash_files
+from mlflow.tracking import MlflowClient
+
+# define version of the step cache, bump when the runner changes step outputs
+RUNNER_VERSION = 1
+
+# define folders of the code snapshot whose python files key the step cache
+CODE_FOLDERS = ["src"]
+
+# define folder of local stand-ins for packages only installed on azureml
+STAND_INS_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "stand_ins"
+)
+
+# define name of the file marking a completed step
+STEP_MARKER = "step.json"
+
+# define pattern of the bindings used in pipeline and component files
+BINDING = re.compile(r"\$\{\{\s*([\w.]+)\s*\}\}")
+
+
+class LocalPipeline:
+    """Run the steps of a pipeline job as local processes"""
+
+    def __init__(
+        self,
+        pipeline_path: str,
+        inputs: Dict[str, str],
+        work_dir: str,
+        tracking_uri: str,
+        max_workers: int,
+    ) -> None:
+        self.pipeline_dir = os.path.dirname(os.path.abspath(pipeline_path))
+        self.pipeline = load_yaml(pipeline_path)
+        self.work_dir = work_dir
+        self.tracking_uri = tracking_uri
+        self.max_workers = max_workers
+        self.client = MlflowClient(tracking_uri)
+        self.experiment_id = get_experiment_id(
+            self.client, self.pipeline.get("experiment_name", "Default")
+        )
+
+        # use the stand-ins when the azureml packages are not installed
+        self.use_stand_ins = importlib.util.find_spec("mltable") is None
+
+        # resolve pipeline inputs to local values and fingerprint their contents
+        self.inputs = resolve_pipeline_inputs(
+            self.pipeline.get("inputs") or {}, inputs, self.pipeline_dir
+        )
+        self.fingerprints = {
+            name: fingerprint(value) for name, value in self.inputs.items()
+        }
+        self.code_hashes: Dict[str, str] = {}
+        self.results: Dict[str, Dict] = {}
+
+    def run(self) -> Dict[str, Dict]:
+        """Run every step as soon as the steps producing its inputs completed"""
+        jobs = self.pipeline["jobs"]
+        pending = {name: step_dependencies(job) for name, job in jobs.items()}
+        running: Dict[Future, str] = {}
+        parent_run_id = self.create_run(self.pipeline.get("display_name", "pipeline"))
+
+        start_time = time.perf_counter()
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                while pending or running:
+                    for name, dependencies in list(pending.items()):
+                        if dependencies.issubset(self.results):
+                            del pending[name]
+                            future = executor.submit(
+                                self.run_step, name, jobs[name], parent_run_id
+                            )
+                            running[future] = name
+
+                    if not running:
+                        raise ValueError(f"Unresolved step inputs: {sorted(pending)}")
+
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        name = running.pop(future)
+                        self.results[name] = future.result()
+        except BaseException:
+            self.client.set_terminated(parent_run_id, "FAILED")
+            raise
+
+        # log step durations and cache hits of the iteration
+        seconds = time.perf_counter() - start_time
+        for name, result in self.results.items():
+            self.client.log_metric(parent_run_id, f"{name}_seconds", result["seconds"])
+        self.client.log_metric(parent_run_id, "pipeline_seconds", seconds)
+        self.client.log_metric(parent_run_id, "cache_hits", self.cache_hits)
+        self.client.set_terminated(parent_run_id)
+
+        return self.results
+
+    @property
+    def cache_hits(self) -> int:
+        """Number of completed steps skipped because their key was unchanged"""
+        return sum(result["cached"] for result in self.results.values())
+
+    def run_step(self, name: str, job: Dict, parent_run_id: str) -> Dict:
+        """Run a command or sweep step unless its outputs are cached"""
+        start_time = time.perf_counter()
+
+        # identify the step by its definition, code and inputs
+        inputs, fingerprints = {}, {}
+        for input_name, binding in (job.get("inputs") or {}).items():
+            inputs[input_name], fingerprints[input_name] = self.resolve(binding)
+        key = self.step_key(job, fingerprints)
+        step_dir = os.path.join(self.work_dir, "steps", name, key)
+        outputs = {
+            output_name: self.output_path(binding, step_dir, output_name)
+            for output_name, binding in (job.get("outputs") or {}).items()
+        }
+
+        # skip steps that completed with the same key
+        if os.path.exists(os.path.join(step_dir, STEP_MARKER)):
+            print(f"{name}: cached {key[:12]}")
+            return {
+                "key": key,
+                "outputs": outputs,
+                "cached": True,
+                "seconds": time.perf_counter() - start_time,
+            }
+
+        # start from empty outputs so that failed attempts leave nothing behind
+        print(f"{name}: running {key[:12]}")
+        shutil.rmtree(step_dir, ignore_errors=True)
+        for path in [step_dir, *outputs.values()]:
+            os.makedirs(path, exist_ok=True)
+
+        run_id = self.create_run(name, parent_run_id)
+        if job["type"] == "sweep":
+            self.run_sweep(job, inputs, outputs, step_dir, run_id)
+        else:
+            code_dir = os.path.join(self.pipeline_dir, job.get("code", "."))
+            self.run_command(job, code_dir, inputs, outputs, step_dir, run_id)
+
+        # mark the step as completed once every output was written
+        with open(os.path.join(step_dir, STEP_MARKER), "w", encoding="utf-8") as file:
+            json.dump({"key": key, "outputs": outputs}, file)
+
+        seconds = time.perf_counter() - start_time
+        print(f"{name}: completed in {seconds:.1f} s")
+
+        return {"key": key, "outputs": outputs, "cached": False, "seconds": seconds}
+
+    def run_sweep(
+        self,
+        job: Dict,
+        inputs: Dict[str, str],
+        outputs: Dict[str, str],
+        step_dir: str,
+        run_id: str,
+    ) -> None:
+        """Run sampled trials of a component concurrently and keep the best"""
+        trial_path = os.path.join(self.pipeline_dir, job["trial"])
+        trial = load_yaml(trial_path)
+        code_dir = os.path.join(os.path.dirname(trial_path), trial.get("code", "."))
+        metric = job["objective"]["primary_metric"]
+        sign = 1 if job["objective"].get("goal", "maximize") == "maximize" else -1
+        limits = job.get("limits") or {}
+        n_trials = limits.get("max_total_trials", 1)
+        max_workers = min(
+            limits.get("max_concurrent_trials", n_trials), self.max_workers
+        )
+
+        # fill trial inputs from the component defaults, step inputs and samples
+        defaults = {
+            name: str(spec["default"])
+            for name, spec in (trial.get("inputs") or {}).items()
+            if isinstance(spec, dict) and "default" in spec
+        }
+        candidates = [
+            {**defaults, **inputs, **cast_parameters(params, trial)}
+            for params in sample_search_space(
+                job["search_space"], job.get("sampling_algorithm", "random"), n_trials
+            )
+        ]
+
+        # run trials as separate processes, at most the concurrent trial limit
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [
+                executor.submit(
+                    self.run_trial,
+                    index,
+                    trial,
+                    code_dir,
+                    candidate,
+                    step_dir,
+                    run_id,
+                    metric,
+                )
+                for index, candidate in enumerate(candidates)
+            ]
+            scores = [future.result() for future in futures]
+
+        completed = [index for index, score in enumerate(scores) if score is not None]
+        if not completed:
+            raise ValueError(f"No trial logged the primary metric: {metric}")
+
+        # copy the outputs of the best trial to the step outputs
+        best = max(completed, key=lambda index: sign * scores[index])
+        for output_name, path in outputs.items():
+            shutil.copytree(
+                os.path.join(step_dir, "trials", str(best), output_name),
+                path,
+                dirs_exist_ok=True,
+            )
+
+        self.client.log_param(run_id, "best_trial", best)
+        self.client.log_metric(run_id, f"best_{metric}", scores[best])
+        self.client.set_terminated(run_id)
+        print(f"sweep best trial {best}: {metric} {scores[best]:.4f}")
+
+    def run_trial(
+        self,
+        index: int,
+        trial: Dict,
+        code_dir: str,
+        inputs: Dict[str, str],
+        step_dir: str,
+        parent_run_id: str,
+        metric: str,
+    ) -> Optional[float]:
+        """Run a trial of a sweep and return its primary metric"""
+        trial_dir = os.path.join(step_dir, "trials", str(index))
+        outputs = {
+            output_name: os.path.join(trial_dir, output_name)
+            for output_name in trial.get("outputs") or {}
+        }
+        for path in [trial_dir, *outputs.values()]:
+            os.makedirs(path, exist_ok=True)
+
+        run_id = self.create_run(f"trial_{index}", parent_run_id)
+        try:
+            self.run_command(trial, code_dir, inputs, outputs, trial_dir, run_id)
+        except subprocess.CalledProcessError:
+            return None
+
+        return self.client.get_run(run_id).data.metrics.get(metric)
+
+    def run_command(
+        self,
+        component: Dict,
+        code_dir: str,
+        inputs: Dict[str, str],
+        outputs: Dict[str, str],
+        run_dir: str,
+        run_id: str,
+    ) -> None:
+        """Run the command of a step in a snapshot of its code"""
+        snapshot_dir = os.path.join(run_dir, "snapshot")
+        make_snapshot(code_dir, snapshot_dir, self.work_dir)
+        command = render_command(component["command"], inputs, outputs)
+        if command[0] == "python":
+            command[0] = sys.executable
+
+        # log to the run created for the step and read data with the stand-ins
+        env = {
+            **os.environ,
+            "MLFLOW_TRACKING_URI": self.tracking_uri,
+            "MLFLOW_EXPERIMENT_ID": self.experiment_id,
+            "MLFLOW_RUN_ID": run_id,
+        }
+        if self.use_stand_ins:
+            env["PYTHONPATH"] = os.pathsep.join(
+                filter(None, [STAND_INS_DIR, os.getenv("PYTHONPATH")])
+            )
+
+        log_path = os.path.join(run_dir, "output.log")
+        with open(log_path, "w", encoding="utf-8") as log:
+            try:
+                subprocess.run(
+                    command,
+                    cwd=snapshot_dir,
+                    env=env,
+                    stdout=log,
+                    stderr=subprocess.STDOUT,
+                    check=True,
+                )
+            except subprocess.CalledProcessError:
+                self.client.set_terminated(run_id, "FAILED")
+                print("Command failed, see log:", log_path)
+                raise
+
+        self.client.set_terminated(run_id)
+
+    def resolve(self, binding: Any) -> Tuple[str, Any]:
+        """Return the local value of a step input and the fingerprint keying it"""
+        match = BINDING.fullmatch(str(binding))
+        if not match:
+            return str(binding), binding
+
+        parts = match.group(1).split(".")
+        if parts[:2] == ["parent", "inputs"]:
+            return self.inputs[parts[2]], self.fingerprints[parts[2]]
+
+        if parts[:2] == ["parent", "jobs"] and parts[3] == "outputs":
+            result = self.results[parts[2]]
+            return result["outputs"][parts[4]], f"{parts[2]}:{result['key']}"
+
+        raise ValueError(f"Unsupported input binding: {binding}")
+
+    def output_path(self, binding: Any, step_dir: str, output_name: str) -> str:
+        """Return the folder of a step output, shared when the output has a path"""
+        match = BINDING.fullmatch(str(binding))
+        if match and match.group(1).startswith("parent.outputs."):
+            outputs = self.pipeline.get("outputs") or {}
+            spec = outputs.get(match.group(1).split(".")[2]) or {}
+            if spec.get("path"):
+                return datastore_path(spec["path"], self.work_dir)
+
+        return os.path.join(step_dir, output_name)
+
+    def step_key(self, job: Dict, fingerprints: Dict[str, Any]) -> str:
+        """Calculate the key of a step from its definition, code and inputs"""
+        definition = {
+            name: value
+            for name, value in job.items()
+            if name not in ("name", "display_name")
+        }
+        code_dir = os.path.join(self.pipeline_dir, job.get("code", "."))
+        if job["type"] == "sweep":
+            trial_path = os.path.join(self.pipeline_dir, job["trial"])
+            definition["trial"] = load_yaml(trial_path)
+            code_dir = os.path.join(
+                os.path.dirname(trial_path), definition["trial"].get("code", ".")
+            )
+
+        code_dir = os.path.normpath(code_dir)
+        if code_dir not in self.code_hashes:
+            self.code_hashes[code_dir] = hash_code(code_dir)
+
+        return hashlib.sha256(
+            json.dumps(
+                [RUNNER_VERSION, self.code_hashes[code_dir], definition, fingerprints],
+                sort_keys=True,
+                default=str,
+            ).encode()
+        ).hexdigest()
+
+    def create_run(self, name: str, parent_run_id: Optional[str] = None) -> str:
+        """Create an mlflow run for a step, nested under the pipeline run"""
+        tags = {"mlflow.runName": name}
+        if parent_run_id:
+            tags["mlflow.parentRunId"] = parent_run_id
+
+        return self.client.create_run(self.experiment_id, tags=tags).info.run_id
+
+
+def main(args: Namespace) -> None:
+    """Run a pipeline locally and report step durations and cache hits"""
+    work_dir = os.path.abspath(os.path.expanduser(args.work_dir))
+    tracking_uri = args.tracking_uri or "file:" + os.path.join(work_dir, "mlruns")
+    start_time = time.perf_counter()
+    pipeline = LocalPipeline(
+        args.pipeline,
+        dict(binding.split("=", 1) for binding in args.input),
+        work_dir,
+        tracking_uri,
+        args.max_workers or os.cpu_count() or 1,
+    )
+
+    results = pipeline.run()
+    seconds = time.perf_counter() - start_time
+
+    # report step durations and cache hits
+    print(f"{'step':<24} {'status':<8} {'seconds':>8}  key")
+    for name, result in results.items():
+        status = "cached" if result["cached"] else "ran"
+        print(f"{name:<24} {status:<8} {result['seconds']:>8.1f}  {result['key'][:12]}")
+    print(
+        f"Completed pipeline in {seconds:.1f} s, "
+        f"{pipeline.cache_hits} of {len(results)} steps cached"
+    )
+
+
+def load_yaml(path: str) -> Dict:
+    """Read a pipeline or component file"""
+    with open(path, encoding="utf-8") as file:
+        return yaml.safe_load(file)
+
+
+def get_experiment_id(client: MlflowClient, name: str) -> str:
+    """Return the id of an experiment, creating it if it does not exist"""
+    experiment = client.get_experiment_by_name(name)
+    if experiment is not None:
+        return experiment.experiment_id
+
+    return client.create_experiment(name)
+
+
+def resolve_pipeline_inputs(
+    specs: Dict, overrides: Dict[str, str], pipeline_dir: str
+) -> Dict[str, str]:
+    """Return local values of pipeline inputs, replacing azureml assets"""
+    inputs = {}
+    for name, spec in specs.items():
+        if name in overrides:
+            value = overrides[name]
+            if os.path.exists(value):
+                value = os.path.abspath(value)
+        elif isinstance(spec, dict):
+            value = str(spec.get("path", spec.get("default", "")))
+            if value.startswith("azureml:"):
+                raise ValueError(
+                    f"Set a local path for the pipeline input: --input {name}=<path>"
+                )
+            if "path" in spec:
+                value = os.path.normpath(os.path.join(pipeline_dir, value))
+        else:
+            value = str(spec)
+        inputs[name] = value
+
+    return inputs
+
+
+def step_dependencies(job: Dict) -> Set[str]:
+    """Return the names of the steps whose outputs a step reads"""
+    return {
+        match.group(1).split(".")[2]
+        for binding in (job.get("inputs") or {}).values()
+        for match in BINDING.finditer(str(binding))
+        if match.group(1).startswith("parent.jobs.")
+    }
+
+
+def fingerprint(value: str) -> str:
+    """Return the content hash of a local path or the value itself"""
+    if os.path.isdir(value):
+        return hash_files(value)
+
+    if os.path.isfile(value):
+        digest = hashlib.sha256()
+        with open(value, "rb") as file:
+            for chunk in iter(lambda: file.read(1 << 20), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    return value
+
+
+def hash_code(code_dir: str) -> str:
+    """Calculate a content hash of the python files run by the steps"""
+    digest = hashlib.sha256()
+    for folder in CODE_FOLDERS:
+        for root, directories, files in os.walk(os.path.join(code_dir, folder)):
+            directories[:] = sorted(
+                directory for directory in directories if directory != "__pycache__"
+            )
+            for name in sorted(files):
+                if not name.endswith(".py"):
+                    continue
+                file_path = os.path.join(root, name)
+                digest.update(os.path.relpath(file_path, code_dir).encode())
+                with open(file_path, "rb") as file:
+                    digest.update(file.read())
+
+    return digest.hexdigest()
+
+
+def datastore_path(uri: str, work_dir: str) -> str:
+    """Map an azureml datastore uri to a local folder of the work directory"""
+    match = re.fullmatch(r"azureml://datastores/([^/]+)/paths/(.*)", uri)
+    if match:
+        return os.path.join(work_dir, "datastores", match.group(1), match.group(2))
+
+    return os.path.abspath(uri)
+
+
+def make_snapshot(code_dir: str, snapshot_dir: str, work_dir: str) -> None:
+    """Link the entries of a code folder so that each run has its own cwd"""
+    os.makedirs(snapshot_dir, exist_ok=True)
+    for name in os.listdir(code_dir):
+        path = os.path.abspath(os.path.join(code_dir, name))
+        if path == work_dir or name.startswith("."):
+            continue
+        os.symlink(path, os.path.join(snapshot_dir, name))
+
+
+def render_command(
+    command: str, inputs: Dict[str, str], outputs: Dict[str, str]
+) -> List[str]:
+    """Split a command and replace its input and output bindings"""
+    values = {
+        **{f"inputs.{name}": value for name, value in inputs.items()},
+        **{f"outputs.{name}": value for name, value in outputs.items()},
+    }
+
+    def replace(match: re.Match) -> str:
+        if match.group(1) not in values:
+            raise ValueError(f"Unbound command binding: {match.group(0)}")
+        return values[match.group(1)]
+
+    return [BINDING.sub(replace, token) for token in shlex.split(command)]
+
+
+def sample_search_space(
+    search_space: Dict, sampling_algorithm: Any, n_trials: int
+) -> List[Dict]:
+    """Sample parameters of trials with a seeded random sampling algorithm"""
+    if isinstance(sampling_algorithm, dict):
+        seed = sampling_algorithm.get("seed", 0)
+        sampling_algorithm = sampling_algorithm.get("type")
+    else:
+        seed = 0
+
+    if sampling_algorithm != "random":
+        raise ValueError(f"Unsupported sampling algorithm: {sampling_algorithm}")
+
+    # a fixed seed keeps the trials and the step key stable between runs
+    generator = random.Random(seed)
+
+    return [
+        {name: sample_parameter(generator, spec) for name, spec in search_space.items()}
+        for _ in range(n_trials)
+    ]
+
+
+def sample_parameter(generator: random.Random, spec: Dict) -> Any:
+    """Sample a value of a search space parameter"""
+    if spec["type"] == "choice":
+        return generator.choice(spec["values"])
+    if spec["type"] == "randint":
+        return generator.randrange(spec["upper"])
+    if spec["type"] == "uniform":
+        return generator.uniform(spec["min_value"], spec["max_value"])
+    if spec["type"] == "quniform":
+        value = generator.uniform(spec["min_value"], spec["max_value"])
+        return round(value / spec["q"]) * spec["q"]
+    if spec["type"] == "loguniform":
+        return math.exp(generator.uniform(spec["min_value"], spec["max_value"]))
+
+    raise ValueError(f"Unsupported search space type: {spec['type']}")
+
+
+def cast_parameters(params: Dict[str, Any], trial: Dict) -> Dict[str, str]:
+    """Convert sampled parameters to the types of the trial inputs"""
+    specs = trial.get("inputs") or {}
+
+    return {
+        name: str(
+            int(value) if (specs.get(name) or {}).get("type") == "integer" else value
+        )
+        for name, value in params.items()
+    }
+
+
+def parse_args() -> Namespace:
+    """Parse command line arguments"""
+    # setup arg parser
+    parser = ArgumentParser("run_pipeline")
+
+    # add arguments
+    parser.add_argument("--pipeline", type=str)
+    parser.add_argument("--input", type=str, nargs="*", default=[])
+    parser.add_argument(
+        "--work_dir", type=str, default="~/.cache/credit-card-default/pipelines"
+    )
+    parser.add_argument("--tracking_uri", type=str)
+    parser.add_argument("--max_workers", type=int, default=0)
+
+    # parse args
+    args = parser.parse_args()
+
+    return args
+
+
+if __name__ == "__main__":
+    main(parse_args())
@@ -0,0 +1,108 @@
+"""Successive halving search over warm-started random forest candidates"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+
+import mlflow
+import numpy as np
+from features import Matrix
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.metrics import f1_score
+
+# define search space sampled by the sweep in the training pipeline
+MAX_DEPTH_RANGE = (1, 25)
+CRITERIA = ["gini", "entropy"]
+
+
+def sample_candidates(n_candidates: int, random_state: int) -> List[Dict]:
+    """Sample forest parameters from the search space of the sweep"""
+    rng = np.random.default_rng(random_state)
+
+    return [
+        {
+            "max_depth": int(rng.integers(MAX_DEPTH_RANGE[0], MAX_DEPTH_RANGE[1] + 1)),
+            "criterion": str(rng.choice(CRITERIA)),
+            "random_state": random_state,
+        }
+        for _ in range(n_candidates)
+    ]
+
+
+def make_rungs(min_estimators: int, max_estimators: int, eta: int) -> List[int]:
+    """Return the number of trees of each rung, growing by eta up to the maximum"""
+    rungs = []
+    n_estimators = min_estimators
+    while n_estimators < max_estimators:
+        rungs.append(n_estimators)
+        n_estimators *= eta
+
+    return rungs + [max_estimators]
+
+
+def successive_halving(
+    matrices: Dict[str, Matrix],
+    candidates: List[Dict],
+    min_estimators: int = 100,
+    max_estimators: int = 1000,
+    eta: int = 3,
+) -> Tuple[Dict, RandomForestClassifier]:
+    """Grow forests rung by rung, keeping the best 1 / eta of candidates each time"""
+    forests = [
+        RandomForestClassifier(**params, warm_start=True) for params in candidates
+    ]
+    survivors = list(range(len(candidates)))
+    rungs = make_rungs(min_estimators, max_estimators, eta)
+    n_cores = os.cpu_count() or 1
+
+    for rung, n_estimators in enumerate(rungs):
+        # grow surviving forests concurrently, sharing cores between them
+        n_jobs = max(1, n_cores // len(survivors))
+        with ThreadPoolExecutor(max_workers=min(len(survivors), n_cores)) as executor:
+            scores = list(
+                executor.map(
+                    lambda index: grow_forest(
+                        forests[index], matrices, n_estimators, n_jobs
+                    ),
+                    survivors,
+                )
+            )
+
+        # log scores of the rung with the number of trees as step
+        for index, score in zip(survivors, scores):
+            mlflow.log_metric(
+                f"candidate_{index}_validation_f1_score", score, step=n_estimators
+            )
+        mlflow.log_metric("rung_n_candidates", len(survivors), step=n_estimators)
+        mlflow.log_metric(
+            "rung_best_validation_f1_score", max(scores), step=n_estimators
+        )
+        print(
+            f"Rung {rung}: {n_estimators} trees,",
+            f"{len(survivors)} candidate(s), best f1 {max(scores):.4f}",
+        )
+
+        # keep the best candidates for the next rung and release the others
+        ranking = np.argsort(-np.asarray(scores), kind="stable")
+        best = survivors[ranking[0]]
+        n_survivors = max(1, len(survivors) // eta)
+        survivors = [survivors[i] for i in sorted(ranking[:n_survivors])]
+        for index in set(range(len(forests))) - set(survivors):
+            forests[index] = None
+
+    params = {**candidates[best], "n_estimators": max_estimators}
+    mlflow.log_dict({"candidates": candidates, "rungs": rungs}, "search.json")
+
+    return params, forests[best].set_params(warm_start=False, n_jobs=-1)
+
+
+def grow_forest(
+    forest: RandomForestClassifier,
+    matrices: Dict[str, Matrix],
+    n_estimators: int,
+    n_jobs: int,
+) -> float:
+    """Add trees to a warm-started forest and return its validation f1 score"""
+    forest.set_params(n_estimators=n_estimators, n_jobs=n_jobs)
+    forest.fit(matrices["x_train"], matrices["y_train"])
+
+    return float(f1_score(matrices["y_test"], forest.predict(matrices["x_test"])))
@@ -0,0 +1,133 @@
+"""Background shadow scoring of a candidate model version"""
+import json
+import logging
+import queue
+import random
+import threading
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+from hosting import ModelStore
+from instrumentation import Recorder, timed
+from payloads import Columns
+
+# define type of a queued shadow request
+ShadowRequest = Tuple[str, str, Union[List[Dict], Columns], int, List[float]]
+
+
+class ShadowScorer:
+    """Score a sample of requests with a candidate version on a worker thread"""
+
+    def __init__(
+        self,
+        service_name: str,
+        logger: logging.Logger,
+        store: ModelStore,
+        version: str,
+        sample_rate: float = 0.1,
+        max_queue_size: int = 1000,
+        record_stage: Optional[Recorder] = None,
+    ) -> None:
+        if version not in store.versions:
+            raise ValueError(f"Model version not found: {version}")
+
+        self.service_name = service_name
+        self.logger = logger
+        self.store = store
+        self.version = version
+        self.sample_rate = sample_rate
+
+        # time shadow scoring of the worker thread with the given recorder
+        if record_stage is not None:
+            self.score = timed("shadow_score", record_stage)(self.score)
+
+        # define counter of sampled requests that were not scored
+        self.dropped = 0
+        self._lock = threading.Lock()
+
+        # start worker thread scoring the request queue
+        self._queue: "queue.Queue[Optional[ShadowRequest]]" = queue.Queue(
+            max_queue_size
+        )
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def submit(
+        self,
+        request_id: str,
+        version: str,
+        data: Union[List[Dict], Columns],
+        n_rows: int,
+        predictions: List[float],
+    ) -> None:
+        """Queue a sample of requests without blocking"""
+        if version == self.version or random.random() >= self.sample_rate:
+            return
+
+        try:
+            self._queue.put_nowait((request_id, version, data, n_rows, predictions))
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """Score queued requests and stop the worker thread"""
+        self._queue.put(None)
+        self._worker.join(timeout)
+
+    def _run(self) -> None:
+        """Score queued requests until the scorer is closed"""
+        while True:
+            request = self._queue.get()
+            if request is None:
+                break
+
+            try:
+                self.score(*request)
+            except Exception as error:
+                self.logger.error(
+                    json.dumps(
+                        {
+                            "service_name": self.service_name,
+                            "type": "Exception",
+                            "request_id": request[0],
+                            "error": str(error),
+                        }
+                    ),
+                    exc_info=error,
+                )
+
+    def score(
+        self,
+        request_id: str,
+        version: str,
+        data: Union[List[Dict], Columns],
+        n_rows: int,
+        predictions: List[float],
+    ) -> None:
+        """Score a request with the candidate version and log both predictions"""
+        model = self.store.get(self.version)
+        if isinstance(data, dict):
+            shadow_predictions = model.predict_columns(data, n_rows)
+        else:
+            shadow_predictions = model.predict(data)
+        with self._lock:
+            dropped = self.dropped
+
+        self.logger.info(
+            json.dumps(
+                {
+                    "service_name": self.service_name,
+                    "type": "ShadowPrediction",
+                    "request_id": request_id,
+                    "model_version": version,
+                    "shadow_model_version": self.version,
+                    "data": predictions,
+                    "shadow_data": shadow_predictions,
+                    "mean_absolute_difference": float(
+                        np.mean(np.abs(np.subtract(predictions, shadow_predictions)))
+                    ),
+                    "dropped": dropped,
+                }
+            )
+        )
@@ -0,0 +1,303 @@
+"""Statistical tests used to detect drift between two distributions"""
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+from scipy import stats
+
+# define drift threshold of distance metrics and dataset drift share used by evidently
+DRIFT_THRESHOLD = 0.1
+DRIFT_SHARE = 0.5
+
+# define p-value below which statistical tests detect drift
+P_VALUE_THRESHOLD = 0.05
+
+# define number of reference quantile bins used for numeric histograms
+N_BINS = 20
+
+# define number of reference rows up to which statistical tests are the default
+SMALL_SAMPLE_SIZE = 1000
+
+# define number of distinct values up to which numeric features count as categories
+FEW_VALUES = 5
+
+# define number of distinct reference values above which numeric samples are binned
+MAX_DISTINCT_VALUES = 20
+
+
+def summarize_feature_metrics(feature_metrics: List[Dict]) -> Dict:
+    """Calculate the overall drift metrics from the feature drift metrics"""
+    n_features = len(feature_metrics)
+    n_drifted_features = sum(metric["drift_detected"] for metric in feature_metrics)
+    share_drifted_features = n_drifted_features / n_features if n_features else 0.0
+
+    return {
+        "n_features": n_features,
+        "n_drifted_features": n_drifted_features,
+        "share_drifted_features": share_drifted_features,
+        "dataset_drift": bool(share_drifted_features >= DRIFT_SHARE),
+    }
+
+
+def population_stability_index(
+    reference_counts: np.ndarray, target_counts: np.ndarray
+) -> float:
+    """Calculate the population stability index of two histograms"""
+    reference_percents = _to_percents(reference_counts)
+    target_percents = _to_percents(target_counts)
+
+    return float(
+        np.sum(
+            (target_percents - reference_percents)
+            * np.log(target_percents / reference_percents)
+        )
+    )
+
+
+def jensen_shannon_distance(
+    reference_counts: np.ndarray, target_counts: np.ndarray
+) -> float:
+    """Calculate the jensen-shannon distance of two histograms"""
+    reference_percents = reference_counts / max(reference_counts.sum(), 1)
+    target_percents = target_counts / max(target_counts.sum(), 1)
+    mixture = (reference_percents + target_percents) / 2
+
+    def kl_divergence(percents: np.ndarray) -> float:
+        nonzero = percents > 0
+        return float(
+            np.sum(percents[nonzero] * np.log(percents[nonzero] / mixture[nonzero]))
+        )
+
+    return float(
+        np.sqrt(
+            max(
+                (kl_divergence(reference_percents) + kl_divergence(target_percents))
+                / 2,
+                0.0,
+            )
+        )
+    )
+
+
+def quantile_bin_edges(values: np.ndarray, n_bins: int = N_BINS) -> np.ndarray:
+    """Calculate bin edges at evenly spaced quantiles of the reference values"""
+    return np.unique(np.quantile(values, np.linspace(0, 1, n_bins + 1)))
+
+
+def bin_counts(values: np.ndarray, edges: np.ndarray) -> np.ndarray:
+    """Count values per bin, bin i holds values in (edges[i - 1], edges[i]]"""
+    return np.bincount(
+        np.searchsorted(edges, values, side="left"), minlength=len(edges) + 1
+    )
+
+
+def histograms(
+    reference: np.ndarray, target: np.ndarray, feature_type: str
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Count reference and target values over shared bins or values like evidently"""
+    # bin numeric features with many values over the range of both samples
+    if feature_type == "num" and len(np.unique(reference)) > MAX_DISTINCT_VALUES:
+        edges = np.histogram_bin_edges(
+            np.concatenate([reference, target]), bins="sturges"
+        )
+        return np.histogram(reference, edges)[0], np.histogram(target, edges)[0]
+
+    # count each value of both samples, categorical features are integer codes
+    values = np.union1d(reference, target)
+    return (
+        np.bincount(np.searchsorted(values, reference), minlength=len(values)),
+        np.bincount(np.searchsorted(values, target), minlength=len(values)),
+    )
+
+
+def ks_test(reference: np.ndarray, target: np.ndarray, feature_type: str) -> float:
+    """Return the p-value of the two sample kolmogorov-smirnov test"""
+    return float(stats.ks_2samp(reference, target).pvalue)
+
+
+def chi_square_test(
+    reference: np.ndarray, target: np.ndarray, feature_type: str
+) -> float:
+    """Return the p-value of the chi-square test of target against reference shares"""
+    return chi_square_p_value(*histograms(reference, target, feature_type))
+
+
+def chi_square_p_value(
+    reference_counts: np.ndarray, target_counts: np.ndarray
+) -> float:
+    """Return the p-value of the chi-square test of two histograms"""
+    # leave out bins without values in either sample
+    observed = reference_counts + target_counts > 0
+    expected = reference_counts[observed] * target_counts.sum() / reference_counts.sum()
+
+    return float(stats.chisquare(target_counts[observed], expected).pvalue)
+
+
+def z_test(reference: np.ndarray, target: np.ndarray, feature_type: str) -> float:
+    """Return the p-value of the z-test of the shares of the first value"""
+    return z_test_p_value(*histograms(reference, target, feature_type))
+
+
+def z_test_p_value(reference_counts: np.ndarray, target_counts: np.ndarray) -> float:
+    """Return the p-value of the two proportion z-test of two binary histograms"""
+    n_reference, n_target = reference_counts.sum(), target_counts.sum()
+    reference_share = 1 - reference_counts[0] / n_reference
+    target_share = 1 - target_counts[0] / n_target
+    pooled_share = (reference_share * n_reference + target_share * n_target) / (
+        n_reference + n_target
+    )
+
+    # both samples hold the same single value
+    if pooled_share in (0, 1):
+        return 1.0
+
+    z_score = (reference_share - target_share) / np.sqrt(
+        pooled_share * (1 - pooled_share) * (1 / n_reference + 1 / n_target)
+    )
+    return float(2 * (1 - stats.norm.cdf(np.abs(z_score))))
+
+
+def wasserstein(reference: np.ndarray, target: np.ndarray, feature_type: str) -> float:
+    """Return the wasserstein distance of two samples normed by the reference std"""
+    return float(
+        stats.wasserstein_distance(reference, target) / max(np.std(reference), 0.001)
+    )
+
+
+def psi(reference: np.ndarray, target: np.ndarray, feature_type: str) -> float:
+    """Return the population stability index of two samples"""
+    return population_stability_index(*histograms(reference, target, feature_type))
+
+
+def jensen_shannon(
+    reference: np.ndarray, target: np.ndarray, feature_type: str
+) -> float:
+    """Return the jensen-shannon distance of two samples"""
+    return jensen_shannon_distance(*histograms(reference, target, feature_type))
+
+
+# define statistical tests as (function, threshold, score is a p-value, name)
+STATTESTS: Dict[str, Tuple[Callable, float, bool, str]] = {
+    "ks": (ks_test, P_VALUE_THRESHOLD, True, "K-S p_value"),
+    "chisquare": (chi_square_test, P_VALUE_THRESHOLD, True, "chi-square p_value"),
+    "z": (z_test, P_VALUE_THRESHOLD, True, "Z-test p_value"),
+    "wasserstein": (
+        wasserstein,
+        DRIFT_THRESHOLD,
+        False,
+        "Wasserstein distance (normed)",
+    ),
+    "psi": (psi, DRIFT_THRESHOLD, False, "PSI"),
+    "jensenshannon": (
+        jensen_shannon,
+        DRIFT_THRESHOLD,
+        False,
+        "Jensen-Shannon distance",
+    ),
+}
+
+
+# define tests calculated from histogram counts, used to compare profiles
+HISTOGRAM_STATTESTS: Dict[str, Callable[[np.ndarray, np.ndarray], float]] = {
+    "chisquare": chi_square_p_value,
+    "z": z_test_p_value,
+    "psi": population_stability_index,
+    "jensenshannon": jensen_shannon_distance,
+}
+
+
+def default_stattest(feature_type: str, n_reference: int, n_values: int) -> str:
+    """Select the default test of evidently from the sample size and distinct values"""
+    # use statistical tests for small samples, numeric features with few values
+    # are tested like categories
+    if n_reference <= SMALL_SAMPLE_SIZE:
+        if feature_type == "cat" or n_values <= FEW_VALUES:
+            return "chisquare" if n_values > 2 else "z"
+        return "ks"
+
+    # use distances for large samples
+    if feature_type == "num" and n_values > FEW_VALUES:
+        return "wasserstein"
+    return "jensenshannon"
+
+
+def default_histogram_stattest(
+    feature_type: str, n_reference: int, n_values: int
+) -> str:
+    """Select the default test of evidently that can be calculated from histograms"""
+    stattest = default_stattest(feature_type, n_reference, n_values)
+
+    # compare numeric histograms with the population stability index instead, the
+    # chi-square test takes the shares of the reference quantile bins as exact and
+    # detects drift between samples of the same data
+    if stattest in ("ks", "wasserstein"):
+        return "psi"
+    return stattest
+
+
+def feature_drift(
+    feature: str,
+    reference: np.ndarray,
+    target: np.ndarray,
+    feature_type: str,
+    stattest: str = "auto",
+) -> Dict:
+    """Calculate the drift metrics of a single feature"""
+    if stattest == "auto":
+        stattest = default_stattest(
+            feature_type, len(reference), len(np.union1d(reference, target))
+        )
+
+    drift_score = STATTESTS[stattest][0](reference, target, feature_type)
+
+    return drift_metrics(feature, drift_score, feature_type, stattest)
+
+
+def histogram_drift(
+    feature: str,
+    reference_counts: np.ndarray,
+    target_counts: np.ndarray,
+    feature_type: str,
+    stattest: str = "auto",
+) -> Dict:
+    """Calculate the drift metrics of a single feature from histogram counts"""
+    if stattest == "auto":
+        stattest = default_histogram_stattest(
+            feature_type,
+            int(reference_counts.sum()),
+            int(np.count_nonzero(reference_counts + target_counts)),
+        )
+
+    # kolmogorov-smirnov and wasserstein need the samples, which histograms do not keep
+    if stattest not in HISTOGRAM_STATTESTS:
+        raise ValueError(
+            f"Stattest {stattest} of {feature} cannot be calculated from profiles, "
+            f"choose one of {sorted(HISTOGRAM_STATTESTS)}"
+        )
+    drift_score = HISTOGRAM_STATTESTS[stattest](reference_counts, target_counts)
+
+    return drift_metrics(feature, drift_score, feature_type, stattest)
+
+
+def drift_metrics(
+    feature: str, drift_score: float, feature_type: str, stattest: str
+) -> Dict:
+    """Compare a drift score with the threshold of its statistical test"""
+    _, threshold, is_p_value, stattest_name = STATTESTS[stattest]
+    drift_detected = drift_score < threshold if is_p_value else drift_score >= threshold
+
+    return {
+        "feature_name": feature,
+        "drift_score": drift_score,
+        "drift_detected": bool(drift_detected),
+        "feature_type": feature_type,
+        "stattest_name": stattest_name,
+    }
+
+
+def _to_percents(counts: np.ndarray) -> np.ndarray:
+    """Convert counts to shares, replacing empty bins like evidently does"""
+    percents = np.asarray(counts, dtype=np.float64) / max(np.sum(counts), 1)
+    smallest = percents[percents > 0].min(initial=1.0)
+    percents[percents == 0] = smallest / 10**6 if smallest <= 0.0001 else 0.0001
+
+    return percents
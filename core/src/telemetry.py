@@ -0,0 +1,203 @@
+"""Background telemetry pipeline for the online scoring service"""
+import json
+import logging
+import queue
+import random
+import threading
+import time
+from typing import Dict, List, Optional, Tuple, Union
+
+import pandas as pd
+from instrumentation import Recorder, timed
+from payloads import Columns, to_rows
+
+# define type of a queued telemetry record
+Record = Tuple[str, Union[List[Dict], Columns], List[float]]
+
+
+class TelemetryPipeline:
+    """Log request telemetry and collect data on a background worker thread"""
+
+    def __init__(
+        self,
+        service_name: str,
+        logger: logging.Logger,
+        inputs_collector,
+        outputs_collector,
+        inputs_outputs_collector,
+        max_queue_size: int = 10000,
+        max_batch_size: int = 100,
+        flush_interval: float = 1.0,
+        overflow_policy: str = "drop",
+        sample_rate: float = 0.1,
+        record_stage: Optional[Recorder] = None,
+    ) -> None:
+        if overflow_policy not in ("drop", "sample"):
+            raise ValueError(f"Unsupported overflow policy: {overflow_policy}")
+
+        self.service_name = service_name
+        self.logger = logger
+        self.inputs_collector = inputs_collector
+        self.outputs_collector = outputs_collector
+        self.inputs_outputs_collector = inputs_outputs_collector
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self.overflow_policy = overflow_policy
+        self.sample_rate = sample_rate
+
+        # time flushes of the worker thread with the given recorder
+        if record_stage is not None:
+            self.flush = timed("telemetry_flush", record_stage)(self.flush)
+
+        # define counters of records that were not collected
+        self.dropped = 0
+        self.sampled = 0
+        self._reported = (0, 0)
+        self._lock = threading.Lock()
+        self._closing = threading.Event()
+
+        # start worker thread flushing the record queue
+        self._queue: "queue.Queue[Optional[Record]]" = queue.Queue(max_queue_size)
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def submit(
+        self,
+        request_id: str,
+        data: Union[List[Dict], Columns],
+        predictions: List[float],
+    ) -> None:
+        """Queue the inputs and outputs of a request without blocking"""
+        # sample records once the worker falls behind by half the queue
+        if (
+            self.overflow_policy == "sample"
+            and self._queue.qsize() >= self._queue.maxsize // 2
+            and random.random() >= self.sample_rate
+        ):
+            with self._lock:
+                self.sampled += 1
+            return
+
+        try:
+            self._queue.put_nowait((request_id, data, predictions))
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """Flush queued records and stop the worker thread without blocking"""
+        self._closing.set()
+
+        # a full queue is drained by the worker, which then stops without the marker
+        try:
+            self._queue.put_nowait(None)
+        except queue.Full:
+            pass
+        self._worker.join(timeout)
+
+    def _run(self) -> None:
+        """Collect queued records until the batch is full or the interval expires"""
+        stopped = False
+        while not stopped:
+            records = []
+            deadline = time.monotonic() + self.flush_interval
+
+            while len(records) < self.max_batch_size:
+                try:
+                    record = self._queue.get(
+                        timeout=max(deadline - time.monotonic(), 0)
+                    )
+                except queue.Empty:
+                    break
+                if record is None:
+                    stopped = True
+                    break
+                records.append(record)
+
+            if self._closing.is_set() and self._queue.empty():
+                stopped = True
+
+            try:
+                if records:
+                    self.flush(records)
+                self._report()
+            except Exception as error:
+                self.logger.error(
+                    json.dumps(
+                        {
+                            "service_name": self.service_name,
+                            "type": "Exception",
+                            "error": str(error),
+                        }
+                    ),
+                    exc_info=error,
+                )
+
+    def flush(self, records: List[Record]) -> None:
+        """Log and collect the inputs and outputs of a batch of requests"""
+        # convert columnar payloads to records off the request path
+        records = [
+            (request_id, to_rows(data) if isinstance(data, dict) else data, predictions)
+            for request_id, data, predictions in records
+        ]
+
+        for request_id, data, predictions in records:
+            # build frames per request so that keys of one request do not add
+            # columns to the others
+            input_df = pd.DataFrame(data)
+            output_df = pd.DataFrame(predictions, columns=["predictions"])
+
+            # --- Custom Monitoring / Data Collection ---
+
+            # Log input data
+            self.logger.info(
+                json.dumps(
+                    {
+                        "service_name": self.service_name,
+                        "type": "InputData",
+                        "request_id": request_id,
+                        "data": input_df.to_json(orient="records"),
+                    }
+                )
+            )
+
+            # Log output data
+            self.logger.info(
+                json.dumps(
+                    {
+                        "service_name": self.service_name,
+                        "type": "OutputData",
+                        "request_id": request_id,
+                        "data": predictions,
+                    }
+                )
+            )
+
+            # --- Azure ML Native Data Collection ---
+
+            # collect inputs data, the context correlates the outputs of the request
+            context = self.inputs_collector.collect(input_df)
+
+            # collect outputs data
+            self.outputs_collector.collect(output_df, context)
+
+            # collect both inputs and outputs joined
+            self.inputs_outputs_collector.collect(input_df.join(output_df), context)
+
+    def _report(self) -> None:
+        """Log the number of dropped and sampled records when they change"""
+        with self._lock:
+            counts = (self.dropped, self.sampled)
+        if counts == self._reported:
+            return
+
+        self._reported = counts
+        self.logger.info(
+            json.dumps(
+                {
+                    "service_name": self.service_name,
+                    "type": "TelemetryStats",
+                    "data": {"dropped": counts[0], "sampled": counts[1]},
+                }
+            )
+        )
@@ -1,13 +1,17 @@
 """Script to develop a machine learning model from input data"""
 from argparse import ArgumentParser, Namespace
 from distutils.dir_util import copy_tree
-from typing import Dict, Union
+from typing import Dict, Optional, Tuple, Union
 
 import mlflow
-import pandas as pd
-from constants import CATEGORICAL_FEATURES, NUMERIC_FEATURES, TARGET
+import numpy as np
+from constants import CATEGORICAL_FEATURES, FEATURES, NUMERIC_FEATURES
+from datasets import read_prepared
+from features import Matrix, compute_features, read_features
+from instrumentation import stage
+from search import sample_candidates, successive_halving
 from sklearn.compose import ColumnTransformer
-from sklearn.ensemble import RandomForestClassifier
+from sklearn.ensemble import HistGradientBoostingClassifier, RandomForestClassifier
 from sklearn.impute import SimpleImputer
 from sklearn.metrics import (
     accuracy_score,
@@ -17,13 +21,13 @@ from sklearn.metrics import (
     roc_auc_score,
 )
 from sklearn.pipeline import Pipeline
-from sklearn.preprocessing import OneHotEncoder
+from sklearn.preprocessing import OneHotEncoder, OrdinalEncoder
 
 
 def main(args: Namespace) -> None:
     """Develop an sklearn model and use mlflow to log metrics"""
-    # enable auto logging
-    mlflow.sklearn.autolog()
+    # enable auto logging of single fits, searches log each rung instead
+    mlflow.sklearn.autolog(disable=args.search != "none")
 
     # setup parameters
     params = {
@@ -33,28 +37,41 @@ def main(args: Namespace) -> None:
         "random_state": args.random_state,
     }
 
-    # read data
-    df_train = pd.read_csv(f"{args.prepared_data_dir}/train.csv")
-    df_test = pd.read_csv(f"{args.prepared_data_dir}/test.csv")
-
-    # seperate features and target variables
-    x_train, y_train = (
-        df_train[CATEGORICAL_FEATURES + NUMERIC_FEATURES],
-        df_train[TARGET],
-    )
-    x_test, y_test = df_test[CATEGORICAL_FEATURES + NUMERIC_FEATURES], df_test[TARGET]
-
-    # train model
-    estimator = make_classifer_pipeline(params)
-    estimator.fit(x_train, y_train.values.ravel())
+    # read features, reusing the preprocessor fitted once by prepare
+    mlflow.log_param("engine", args.engine)
+    with stage("load_features"):
+        preprocessor, matrices = load_features(args.prepared_data_dir, args.engine)
+
+    # train model, searching parameters in process if requested
+    if args.search == "halving":
+        if args.engine != "random_forest":
+            raise ValueError("Only random_forest models can be searched in process")
+
+        candidates = sample_candidates(args.n_candidates, args.random_state)
+        with stage("search"):
+            params, classifier = successive_halving(
+                matrices, candidates, args.min_estimators, args.max_estimators, args.eta
+            )
+        mlflow.log_params(params)
+        estimator = make_classifer_pipeline(params, preprocessor)
+        estimator.set_params(classifier=classifier)
+    else:
+        estimator = make_classifer_pipeline(params, preprocessor, args.engine)
+        with stage("fit"):
+            estimator.named_steps["classifier"].fit(
+                matrices["x_train"], matrices["y_train"]
+            )
+
+    y_test = matrices["y_test"]
+    with stage("predict"):
+        y_pred = estimator.named_steps["classifier"].predict(matrices["x_test"])
 
     # calculate evaluation metrics
-    y_pred = estimator.predict(x_test)
-    validation_accuracy_score = accuracy_score(y_test.values.ravel(), y_pred)
-    validation_roc_auc_score = roc_auc_score(y_test.values.ravel(), y_pred)
-    validation_f1_score = f1_score(y_test.values.ravel(), y_pred)
-    validation_precision_score = precision_score(y_test.values.ravel(), y_pred)
-    validation_recall_score = recall_score(y_test.values.ravel(), y_pred)
+    validation_accuracy_score = accuracy_score(y_test, y_pred)
+    validation_roc_auc_score = roc_auc_score(y_test, y_pred)
+    validation_f1_score = f1_score(y_test, y_pred)
+    validation_precision_score = precision_score(y_test, y_pred)
+    validation_recall_score = recall_score(y_test, y_pred)
 
     # log evaluation metrics
     mlflow.log_metric("validation_accuracy_score", validation_accuracy_score)
@@ -64,15 +81,75 @@ def main(args: Namespace) -> None:
     mlflow.log_metric("validation_recall_score", validation_recall_score)
 
     # save models
-    mlflow.sklearn.save_model(estimator, "model")
+    with stage("save_model"):
+        mlflow.sklearn.save_model(estimator, "model")
+
+        # copy model artifact to directory
+        to_directory = args.model_output
+        copy_tree("model", f"{to_directory}/model")
+
+
+def load_features(
+    prepared_data_dir: str, engine: str = "random_forest"
+) -> Tuple[ColumnTransformer, Dict[str, Matrix]]:
+    """Read precomputed features or fit the preprocessor on the prepared data"""
+    # prepare stores features encoded for the default engine only
+    if engine == "random_forest":
+        features = read_features(prepared_data_dir)
+        if features is not None:
+            return features
 
-    # copy model artifact to directory
-    to_directory = args.model_output
-    copy_tree("model", f"{to_directory}/model")
+    # compute features of prepared data written without them
+    df_train = read_prepared(prepared_data_dir, "train")
+    df_test = read_prepared(prepared_data_dir, "test")
+    preprocessor = make_preprocessor(engine).fit(df_train[FEATURES])
 
+    return preprocessor, compute_features(preprocessor, df_train, df_test)
 
-def make_classifer_pipeline(params: Dict[str, Union[str, int]]) -> Pipeline:
+
+def make_classifer_pipeline(
+    params: Dict[str, Union[str, int]],
+    preprocessor: Optional[ColumnTransformer] = None,
+    engine: str = "random_forest",
+) -> Pipeline:
     """Create sklearn pipeline to apply transforms and a final estimator"""
+    # reuse a fitted preprocessor when given
+    if preprocessor is None:
+        preprocessor = make_preprocessor(engine)
+
+    # model training pipeline
+    classifer_pipeline = Pipeline(
+        [
+            ("preprocessor", preprocessor),
+            ("classifier", make_classifier(params, engine)),
+        ]
+    )
+
+    return classifer_pipeline
+
+
+def make_classifier(
+    params: Dict[str, Union[str, int]], engine: str = "random_forest"
+) -> Union[RandomForestClassifier, HistGradientBoostingClassifier]:
+    """Create the final estimator of an engine from the training parameters"""
+    if engine == "random_forest":
+        return RandomForestClassifier(**params, n_jobs=-1)
+
+    # boost one tree per estimator, splitting ordinal codes as categories
+    return HistGradientBoostingClassifier(
+        max_iter=params["n_estimators"],
+        max_depth=params["max_depth"],
+        categorical_features=[False] * len(NUMERIC_FEATURES)
+        + [True] * len(CATEGORICAL_FEATURES),
+        random_state=params["random_state"],
+    )
+
+
+def make_preprocessor(engine: str = "random_forest") -> ColumnTransformer:
+    """Create sklearn column transformer to impute and encode features"""
+    if engine == "hist_gradient_boosting":
+        return make_ordinal_preprocessor()
+
     # categorical features transformations
     categorical_transformer = Pipeline(
         steps=[
@@ -99,15 +176,35 @@ def make_classifer_pipeline(params: Dict[str, Union[str, int]]) -> Pipeline:
         ]
     )
 
-    # model training pipeline
-    classifer_pipeline = Pipeline(
-        [
-            ("preprocessor", preprocessor),
-            ("classifier", RandomForestClassifier(**params, n_jobs=-1)),
+    return preprocessor
+
+
+def make_ordinal_preprocessor() -> ColumnTransformer:
+    """Create sklearn column transformer to encode categories as float32 codes"""
+    # categorical features transformations, unknown categories become missing
+    categorical_transformer = Pipeline(
+        steps=[
+            ("imputer", SimpleImputer(strategy="constant", fill_value="missing")),
+            (
+                "ordinal",
+                OrdinalEncoder(
+                    handle_unknown="use_encoded_value",
+                    unknown_value=np.nan,
+                    dtype=np.float32,
+                ),
+            ),
         ]
     )
 
-    return classifer_pipeline
+    # preprocessing pipeline, missing numeric values are handled by the learner
+    preprocessor = ColumnTransformer(
+        transformers=[
+            ("numeric", "passthrough", NUMERIC_FEATURES),
+            ("categorical", categorical_transformer, CATEGORICAL_FEATURES),
+        ]
+    )
+
+    return preprocessor
 
 
 def parse_args() -> Namespace:
@@ -122,6 +219,19 @@ def parse_args() -> Namespace:
     parser.add_argument("--n_estimators", type=lambda x: int(float(x)), default=500)
     parser.add_argument("--max_depth", type=lambda x: int(float(x)), default=10)
     parser.add_argument("--criterion", type=str, default="gini")
+    parser.add_argument(
+        "--engine",
+        type=str,
+        choices=["random_forest", "hist_gradient_boosting"],
+        default="random_forest",
+    )
+    parser.add_argument(
+        "--search", type=str, choices=["none", "halving"], default="none"
+    )
+    parser.add_argument("--n_candidates", type=int, default=27)
+    parser.add_argument("--min_estimators", type=int, default=100)
+    parser.add_argument("--max_estimators", type=int, default=1000)
+    parser.add_argument("--eta", type=int, default=3)
 
     # parse args
     args = parser.parse_args()
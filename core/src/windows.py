@@ -0,0 +1,171 @@
+"""Incremental data drift over time windows of exported inference data"""
+import json
+import os
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import pandas as pd
+from constants import FEATURES
+from datasets import hash_file
+from profiles import PROFILE_VERSION, DatasetProfile, compare_profiles, write_json
+from readers import iter_file
+
+# define column holding the time of each exported request
+TIME_COLUMN = "TimeGenerated"
+
+# define pandas frequencies of the supported sketch periods
+FREQUENCIES = {"day": "D", "hour": "H"}
+
+
+def load_sketches(
+    data_dir: str,
+    files: List[str],
+    reference: DatasetProfile,
+    sketch_dir: str,
+    frequency: str = "day",
+    chunk_size: int = 100000,
+) -> Dict[pd.Timestamp, DatasetProfile]:
+    """Load the period profiles of every file, sketching new files only"""
+    sketches: Dict[pd.Timestamp, DatasetProfile] = {}
+    for file_path in files:
+        for period, profile in load_file_sketch(
+            data_dir, file_path, reference, sketch_dir, frequency, chunk_size
+        ).items():
+            if period in sketches:
+                sketches[period].merge(profile)
+            else:
+                sketches[period] = profile
+
+    return sketches
+
+
+def load_file_sketch(
+    data_dir: str,
+    file_path: str,
+    reference: DatasetProfile,
+    sketch_dir: str,
+    frequency: str,
+    chunk_size: int,
+) -> Dict[pd.Timestamp, DatasetProfile]:
+    """Load the cached period profiles of a file or sketch and cache them"""
+    # name sketches after the file path since partitions reuse file names
+    name = os.path.splitext(os.path.relpath(file_path, data_dir))[0]
+    path = os.path.join(
+        sketch_folder(sketch_dir, reference, frequency),
+        f"{name.replace(os.sep, '_')}.json",
+    )
+    content_hash = hash_file(file_path)
+
+    # reuse the sketch unless the file content changed since it was sketched, a
+    # rewrite may keep the size and mounts do not preserve modification times
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as file:
+            config = json.load(file)
+        if config.get("content_hash") == content_hash:
+            return {
+                pd.Timestamp(period): DatasetProfile.from_dict(profile)
+                for period, profile in config["periods"].items()
+            }
+
+    print("Sketching inference data:", file_path)
+    sketches = sketch_file(file_path, reference, frequency, chunk_size)
+    write_json(
+        path,
+        {
+            "content_hash": content_hash,
+            "periods": {
+                period.isoformat(): profile.to_dict()
+                for period, profile in sketches.items()
+            },
+        },
+    )
+
+    return sketches
+
+
+def sketch_file(
+    file_path: str, reference: DatasetProfile, frequency: str, chunk_size: int
+) -> Dict[pd.Timestamp, DatasetProfile]:
+    """Accumulate one profile per period of an exported inference data file"""
+    sketches: Dict[pd.Timestamp, DatasetProfile] = {}
+    for df in iter_file(file_path, FEATURES + [TIME_COLUMN], chunk_size):
+        periods = pd.to_datetime(df[TIME_COLUMN]).dt.floor(FREQUENCIES[frequency])
+        for period, period_df in df.groupby(periods):
+            if period not in sketches:
+                sketches[period] = reference.empty_like()
+            sketches[period].update(period_df)
+
+    return sketches
+
+
+def window_drift(
+    sketches: Dict[pd.Timestamp, DatasetProfile],
+    reference: DatasetProfile,
+    window_days: int,
+    frequency: str = "day",
+    since: Optional[pd.Timestamp] = None,
+    numeric_stattest: str = "auto",
+    categorical_stattest: str = "auto",
+) -> Iterator[Tuple[pd.Timestamp, pd.Timestamp, Dict, List[Dict]]]:
+    """Calculate drift metrics of windows ending after each completed period"""
+    if not sketches:
+        return
+
+    # slide windows over completed periods after the last reported one
+    offset = pd.tseries.frequencies.to_offset(FREQUENCIES[frequency])
+    current = pd.Timestamp(datetime.now(timezone.utc).replace(tzinfo=None))
+    first = min(sketches) if since is None else since
+    periods = pd.date_range(first, current.floor(offset.freqstr), freq=offset)
+
+    for end in periods[1:]:
+        start = end - pd.Timedelta(days=window_days)
+
+        # merge the period profiles inside the window
+        window = reference.empty_like()
+        for period in pd.date_range(start, end, freq=offset, inclusive="left"):
+            if period in sketches:
+                window.merge(sketches[period])
+
+        if window.count:
+            yield (
+                start,
+                end,
+                *compare_profiles(
+                    reference, window, numeric_stattest, categorical_stattest
+                ),
+            )
+
+
+def sketch_folder(sketch_dir: str, reference: DatasetProfile, frequency: str) -> str:
+    """Return the folder of sketches built against a reference profile"""
+    return os.path.join(
+        sketch_dir, f"v{PROFILE_VERSION}_{reference.content_hash}_{frequency}"
+    )
+
+
+def load_watermarks(
+    sketch_dir: str, reference: DatasetProfile, frequency: str
+) -> Dict[str, pd.Timestamp]:
+    """Load the end of the last window reported for each window size"""
+    path = os.path.join(sketch_folder(sketch_dir, reference, frequency), "windows.json")
+    if not os.path.exists(path):
+        return {}
+
+    with open(path, encoding="utf-8") as file:
+        return {
+            window_days: pd.Timestamp(period)
+            for window_days, period in json.load(file).items()
+        }
+
+
+def save_watermarks(
+    sketch_dir: str,
+    reference: DatasetProfile,
+    frequency: str,
+    watermarks: Dict[str, pd.Timestamp],
+) -> None:
+    """Save the end of the last window reported for each window size"""
+    write_json(
+        os.path.join(sketch_folder(sketch_dir, reference, frequency), "windows.json"),
+        {window_days: period.isoformat() for window_days, period in watermarks.items()},
+    )
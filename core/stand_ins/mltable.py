@@ -0,0 +1,68 @@
+"""Local stand-in for the mltable package reading delimited and parquet tables"""
+import glob
+import os
+from typing import Dict, List
+
+import pandas as pd
+import yaml
+
+
+class MLTable:
+    """Table of the local files matched by the paths of an MLTable file"""
+
+    def __init__(self, path: str, config: Dict) -> None:
+        self.path = path
+        self.config = config
+
+    @property
+    def files(self) -> List[str]:
+        """List the local files matched by the paths of the table"""
+        files = []
+        for entry in self.config.get("paths", []):
+            if "file" in entry:
+                files.append(os.path.join(self.path, entry["file"]))
+            elif "folder" in entry:
+                files.extend(
+                    sorted(glob.glob(os.path.join(self.path, entry["folder"], "*")))
+                )
+            else:
+                files.extend(
+                    sorted(
+                        glob.glob(
+                            os.path.join(self.path, entry["pattern"]), recursive=True
+                        )
+                    )
+                )
+
+        return files
+
+    def to_pandas_dataframe(self) -> pd.DataFrame:
+        """Read every file of the table into a single frame"""
+        transformations = self.config.get("transformations") or [{}]
+        transformation = transformations[0]
+        if isinstance(transformation, str):
+            transformation = {transformation: {}}
+
+        if "read_parquet" in transformation:
+            frames = [pd.read_parquet(file_path) for file_path in self.files]
+        else:
+            read_options = transformation.get("read_delimited") or {}
+            frames = [
+                pd.read_csv(
+                    file_path,
+                    sep=read_options.get("delimiter", ","),
+                    encoding=read_options.get("encoding", "utf-8"),
+                )
+                for file_path in self.files
+            ]
+
+        if not frames:
+            raise ValueError(f"No files found for mltable: {self.path}")
+
+        return pd.concat(frames, ignore_index=True)
+
+
+def load(uri: str) -> MLTable:
+    """Read the MLTable file of a local mltable folder"""
+    with open(os.path.join(uri, "MLTable"), encoding="utf-8") as file:
+        return MLTable(uri, yaml.safe_load(file))
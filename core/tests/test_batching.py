@@ -0,0 +1,104 @@
+"""Tests of micro-batching concurrent scoring requests"""
+import threading
+from typing import Dict, List
+
+import pytest
+from batching import MicroBatcher
+
+
+class RecordingModel:
+    """Score rows as ten times their value and record every call"""
+
+    def __init__(self) -> None:
+        self.calls: List[List[Dict]] = []
+        self._lock = threading.Lock()
+
+    def __call__(self, data: List[Dict]) -> List[float]:
+        with self._lock:
+            self.calls.append(data)
+        if any(row["value"] < 0 for row in data):
+            raise ValueError("Negative value")
+
+        return [row["value"] * 10.0 for row in data]
+
+
+def submit_concurrently(batcher: MicroBatcher, requests: List[List[Dict]]) -> List:
+    """Submit requests from one thread each and return their results or errors"""
+    results: List = [None] * len(requests)
+    barrier = threading.Barrier(len(requests))
+
+    def submit(index: int) -> None:
+        barrier.wait()
+        try:
+            results[index] = batcher.submit(requests[index])
+        except Exception as error:
+            results[index] = error
+
+    threads = [
+        threading.Thread(target=submit, args=(index,)) for index in range(len(requests))
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=10)
+
+    return results
+
+
+def test_submit_routes_batch_predictions_to_each_caller():
+    requests = [
+        [{"value": index * 100 + row} for row in range(index % 3 + 1)]
+        for index in range(8)
+    ]
+
+    # flush once the rows of every request are queued
+    model = RecordingModel()
+    batcher = MicroBatcher(
+        model, max_batch_size=sum(map(len, requests)), max_wait_ms=10000
+    )
+
+    results = submit_concurrently(batcher, requests)
+
+    # every caller receives the predictions of its own rows in order
+    for data, predictions in zip(requests, results):
+        assert predictions == [row["value"] * 10.0 for row in data]
+
+    # concurrent requests are coalesced into a single model call
+    assert len(model.calls) == 1
+    assert sorted(row["value"] for row in model.calls[0]) == sorted(
+        row["value"] for data in requests for row in data
+    )
+
+
+def test_submit_scores_full_batches_directly():
+    model = RecordingModel()
+    batcher = MicroBatcher(model, max_batch_size=4, max_wait_ms=200)
+    data = [{"value": value} for value in range(4)]
+
+    assert batcher.submit(data) == [0.0, 10.0, 20.0, 30.0]
+    assert model.calls == [data]
+
+
+def test_failed_batch_falls_back_to_scoring_requests_one_by_one():
+    requests = [[{"value": 1}, {"value": 2}], [{"value": -1}], [{"value": 3}]]
+
+    model = RecordingModel()
+    batcher = MicroBatcher(model, max_batch_size=4, max_wait_ms=10000)
+
+    results = submit_concurrently(batcher, requests)
+
+    # the bad payload only fails its own caller
+    assert results[0] == [10.0, 20.0]
+    assert isinstance(results[1], ValueError)
+    assert results[2] == [30.0]
+
+    # the failed batch is scored again request by request
+    assert len(model.calls[0]) == 4
+    assert sorted(model.calls[1:], key=str) == sorted(requests, key=str)
+
+
+def test_failed_request_raises_to_its_caller():
+    batcher = MicroBatcher(RecordingModel(), max_batch_size=64, max_wait_ms=1)
+
+    with pytest.raises(ValueError, match="Negative value"):
+        batcher.submit([{"value": -1}])
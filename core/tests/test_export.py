@@ -0,0 +1,138 @@
+"""Tests of querying log analytics in sub-windows"""
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+import pyarrow as pa
+import pytest
+from azure.monitor.query import LogsQueryStatus
+from export import query_window
+
+# define start of the queried windows
+START_TIME = datetime(2023, 1, 1, tzinfo=timezone.utc)
+
+
+class FakeLogsQueryClient:
+    """Stand-in for LogsQueryClient returning at most row_limit rows per query"""
+
+    def __init__(
+        self,
+        times: List[datetime],
+        row_limit: int = 1000,
+        latency: Optional[Callable[[datetime, datetime], float]] = None,
+    ) -> None:
+        self.times = np.array(
+            [value.replace(tzinfo=None) for value in times], dtype="datetime64[us]"
+        )
+        self.row_limit = row_limit
+        self.latency = latency
+        self.timespans: List[Tuple[datetime, datetime]] = []
+        self._lock = threading.Lock()
+
+    def query_workspace(self, workspace_id, query, timespan):
+        with self._lock:
+            self.timespans.append(timespan)
+        if self.latency is not None:
+            time.sleep(self.latency(*timespan))
+
+        # select rows logged within the half open timespan
+        start, end = [
+            np.datetime64(value.astimezone(timezone.utc).replace(tzinfo=None), "us")
+            for value in timespan
+        ]
+        first, last = np.searchsorted(self.times, [start, end])
+        is_partial = last - first > self.row_limit
+        rows = [
+            [str(value)]
+            for value in self.times[first : min(last, first + self.row_limit)]
+        ]
+
+        tables = [SimpleNamespace(rows=rows, columns=["TimeGenerated"])]
+        if is_partial:
+            return SimpleNamespace(
+                status=LogsQueryStatus.PARTIAL,
+                partial_data=tables,
+                partial_error=SimpleNamespace(message="Row limit exceeded"),
+            )
+
+        return SimpleNamespace(status=LogsQueryStatus.SUCCESS, tables=tables)
+
+
+def exported_times(client: FakeLogsQueryClient, end_time: datetime, **kwargs) -> List:
+    """Query a window from the start time and return the exported row times"""
+    batches = list(
+        query_window(client, "workspace", "model", "1", START_TIME, end_time, **kwargs)
+    )
+    if not batches:
+        return []
+
+    return pa.Table.from_batches(batches)["TimeGenerated"].to_pylist()
+
+
+def expected_times(times: List[datetime]) -> List[datetime]:
+    """Return the row times as exported, naive in utc"""
+    return [value.replace(tzinfo=None) for value in times]
+
+
+def test_query_window_splits_into_sub_windows():
+    times = [START_TIME + timedelta(minutes=10 * index) for index in range(36)]
+    client = FakeLogsQueryClient(times)
+
+    exported = exported_times(
+        client, START_TIME + timedelta(hours=6), sub_window=timedelta(hours=2)
+    )
+
+    assert exported == expected_times(times)
+    assert sorted(client.timespans) == [
+        (START_TIME + timedelta(hours=hours), START_TIME + timedelta(hours=hours + 2))
+        for hours in (0, 2, 4)
+    ]
+
+
+def test_query_window_stitches_sub_windows_in_time_order():
+    times = [START_TIME + timedelta(minutes=10 * index) for index in range(36)]
+
+    # later sub-windows complete first
+    def latency(start: datetime, end: datetime) -> float:
+        return 0.05 * (START_TIME + timedelta(hours=6) - start) / timedelta(hours=1)
+
+    client = FakeLogsQueryClient(times, latency=latency)
+
+    exported = exported_times(
+        client,
+        START_TIME + timedelta(hours=6),
+        sub_window=timedelta(hours=1),
+        max_concurrency=6,
+    )
+
+    assert exported == expected_times(times)
+
+
+def test_query_window_splits_partial_sub_windows():
+    times = [START_TIME + timedelta(minutes=10 * index) for index in range(12)]
+    client = FakeLogsQueryClient(times, row_limit=6)
+
+    exported = exported_times(
+        client, START_TIME + timedelta(hours=2), sub_window=timedelta(hours=2)
+    )
+
+    # the partial window is queried again in halves, each within the row limit
+    assert exported == expected_times(times)
+    assert client.timespans[0] == (START_TIME, START_TIME + timedelta(hours=2))
+    assert sorted(client.timespans[1:]) == [
+        (START_TIME, START_TIME + timedelta(hours=1)),
+        (START_TIME + timedelta(hours=1), START_TIME + timedelta(hours=2)),
+    ]
+
+
+def test_query_window_fails_when_smallest_sub_window_is_partial():
+    times = [START_TIME + timedelta(seconds=index) for index in range(10)]
+    client = FakeLogsQueryClient(times, row_limit=4)
+
+    with pytest.raises(RuntimeError, match="still partial"):
+        exported_times(
+            client, START_TIME + timedelta(minutes=2), sub_window=timedelta(minutes=2)
+        )